@@ -0,0 +1,84 @@
+from keras_retinanet.utils.socket_protocol import DetectionClient, shared_memory
+# import miscellaneous modules
+import argparse
+import base64
+import http.client
+import json
+import time
+import cv2
+import numpy as np
+from urllib.parse import urlparse
+
+def http_binary(connection, data, threshold):
+    connection.request('POST', '/image/binary?threshold={}'.format(threshold), body=data, headers={'Content-Type': 'application/octet-stream'})
+    response = connection.getresponse()
+    return json.loads(response.read())
+
+def http_json(connection, data, threshold):
+    body = json.dumps({'data': base64.b64encode(data).decode('ascii'), 'threshold': threshold})
+    connection.request('POST', '/image', body=body, headers={'Content-Type': 'application/json'})
+    response = connection.getresponse()
+    return json.loads(response.read())
+
+def measure(call, repeat, warmup=3):
+    """ Returns the latencies in seconds of repeat calls, after a few calls which are not measured.
+    """
+    for _ in range(warmup):
+        call()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return np.array(latencies)
+
+def parse_args(args):
+    """ Parse the arguments.
+    """
+    parser = argparse.ArgumentParser(description='Latency comparison of the Unix socket and HTTP transports of the detection server.')
+    parser.add_argument('image', help='Image sent with every request.')
+    parser.add_argument('--socket', help='Path of the socket of socket_server.py.', default='/tmp/lacmus.sock')
+    parser.add_argument('--http', help='Base url of the HTTP server (socket_server.py --http-port or inference.py), empty to skip HTTP.', default='http://127.0.0.1:5000')
+    parser.add_argument('--repeat', help='Number of measured requests per transport.', type=int, default=100)
+    parser.add_argument('--threshold', help='Score threshold of the requests.', type=float, default=0.5)
+    return parser.parse_args(args)
+
+def main(args=None):
+    args = parse_args(args)
+    with open(args.image, 'rb') as f:
+        data = f.read()
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+
+    transports = []
+    client = DetectionClient(args.socket)
+    transports.append(('socket encoded', lambda: client.detect_encoded(data, threshold=args.threshold)))
+    transports.append(('socket raw', lambda: client.detect_image(image, threshold=args.threshold)))
+
+    block = None
+    if shared_memory is not None:
+        # the client decodes into shared memory once, like a desktop client holding its frames there
+        block = shared_memory.SharedMemory(create=True, size=image.nbytes)
+        np.ndarray(image.shape, dtype=np.uint8, buffer=block.buf)[:] = image
+        transports.append(('socket shm', lambda: client.detect_shared_memory(block.name, image.shape[0], image.shape[1], threshold=args.threshold)))
+
+    if args.http:
+        url = urlparse(args.http)
+        connection = http.client.HTTPConnection(url.hostname, url.port or 80)
+        transports.append(('http binary', lambda: http_binary(connection, data, args.threshold)))
+        transports.append(('http json', lambda: http_json(connection, data, args.threshold)))
+
+    try:
+        print('{} ({}x{}, {} KB), {} requests per transport'.format(args.image, image.shape[1], image.shape[0], len(data) // 1024, args.repeat))
+        for name, call in transports:
+            latencies = measure(call, args.repeat) * 1000
+            print('{:15s}: mean {:7.2f} ms | p50 {:7.2f} ms | p95 {:7.2f} ms'.format(
+                name, latencies.mean(), np.percentile(latencies, 50), np.percentile(latencies, 95)
+            ))
+    finally:
+        client.close()
+        if block is not None:
+            block.close()
+            block.unlink()
+
+if __name__ == '__main__':
+    main()
@@ -1,110 +1,1016 @@
-import keras
-# import keras_retinanet
-import tensorflow as tf
+# import keras_retinanet, tensorflow is only imported by the engines which need it
 from keras_retinanet import models
-from keras_retinanet.utils.image import read_image_bgr, preprocess_image, resize_image
+from keras_retinanet.utils.image import compute_resize_scale, decode_image_bgr, jpeg_size, preprocess_and_resize, read_image_bgr
 from keras_retinanet.utils.visualization import draw_box, draw_caption
 from keras_retinanet.utils.colors import label_color
-from keras_retinanet.utils.gpu import setup_gpu
+from keras_retinanet.utils.batching import BatchScheduler, DeadlineExceededError, QueueFullError, PRIORITY_BULK, PRIORITY_INTERACTIVE, check_deadline
+from keras_retinanet.utils.tiling import TiledPredictor
+from keras_retinanet.utils.cpu import add_cpu_arguments, apply_cpu_config, calibrate_in_subprocess, cpu_config_from_args, model_affinity, parse_cpu_parameters, pin_to_cores, session_config
+from keras_retinanet.utils.worker_pool import WorkerPool
+from keras_retinanet.utils.engine import ENGINES, create_engine, engine_name, resolve_model_path
+from keras_retinanet.utils.detection_cache import DetectionCache, image_key
+from keras_retinanet.utils.mission import iter_paths, iter_tar, iter_zip, process_unordered, resolve_path
+from keras_retinanet.utils.metrics import MetricsRegistry, process_rss_bytes
+from keras_retinanet.utils.shape_buckets import ShapeBuckets, bucket_name, parse_buckets
+from keras_retinanet.utils.model_registry import ModelRegistry, ModelSpec, parse_model_spec
+from jobs import JobRunner, JobStore, job_items_from_archive, job_items_from_paths, job_upload_dir, new_job_id
 # import miscellaneous modules
 import cv2
 from io import BytesIO
 import pybase64
 import argparse
+import configparser
 import sys
 import os
+import tarfile
+import zipfile
 import numpy as np
 import time
 import json
-from flask import Flask, jsonify, request, abort
+import math
+import queue
+import threading
+import tempfile
+import shutil
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import partial
+from flask import Flask, Response, g, jsonify, request, abort, stream_with_context
 
 app = Flask(__name__)
+model_registry = None
+model_specs = OrderedDict()
+default_model = None
+worker_pool = None
+detection_cache = None
+reduced_decode = False
+request_timeout = 0
+request_slots = None
+mission_root = None
+snapshots_root = None
+mission_workers = 4
+cpu_config = None
+jobs_dir = None
+job_store = None
+job_runner = None
+
+PRIORITY_NAMES = {PRIORITY_INTERACTIVE: 'interactive', PRIORITY_BULK: 'bulk'}
+
+def workers_rss_bytes():
+    if worker_pool is None:
+        return 0
+    return sum(process_rss_bytes(w.process.pid) for w in worker_pool.workers if w.process is not None)
+
+metrics = MetricsRegistry()
+http_requests = metrics.counter('lacmus_http_requests_total', 'HTTP requests by endpoint and status code.', ['endpoint', 'status'])
+http_latency = metrics.histogram('lacmus_http_request_duration_seconds', 'Time until an HTTP response is ready, streamed bodies are not included.', ['endpoint'])
+http_in_flight = metrics.gauge('lacmus_http_requests_in_flight', 'HTTP requests currently being handled.', ['endpoint'])
+stage_latency = metrics.histogram('lacmus_stage_duration_seconds', 'Latency of the processing stages of a detection.', ['stage'])
+detections_in_flight = metrics.gauge('lacmus_detections_in_flight', 'Images currently being decoded or detected.')
+batch_sizes = metrics.histogram('lacmus_batch_size', 'Number of images per predict_on_batch call.', buckets=(1, 2, 4, 8, 16, 32, 64))
+bucket_padding = metrics.histogram('lacmus_bucket_padding_ratio', 'Fraction of the shape bucket an image is padded with.', ['bucket'], buckets=(0.05, 0.1, 0.2, 0.3, 0.4, 0.5, 0.75, 1.0))
+queue_submitted = metrics.counter('lacmus_queue_submitted_total', 'Images submitted to the batch queue by priority.', ['priority'])
+queue_rejected = metrics.counter('lacmus_queue_rejected_total', 'Images rejected because the batch queue was full.')
+requests_shed = metrics.counter('lacmus_requests_shed_total', 'Detection requests rejected with 503 because the server was saturated.', ['reason'])
+deadline_exceeded = metrics.counter('lacmus_deadline_exceeded_total', 'Detection requests dropped because their deadline passed before they reached the model.')
+metrics.gauge('lacmus_queue_size', 'Images waiting in the batch queues of the models in the server process.', function=lambda: sum(served.scheduler.queue_size() for _, served in model_registry.loaded()) if model_registry is not None else 0)
+metrics.gauge('lacmus_models_memory_bytes', 'Weight memory of the models loaded in the server process.', function=lambda: sum(served.memory_bytes for _, served in model_registry.loaded()) if model_registry is not None else 0)
+metrics.gauge('lacmus_idle_workers', 'Idle model worker processes.', function=lambda: worker_pool.idle_workers() if worker_pool is not None else 0)
+metrics.gauge('process_resident_memory_bytes', 'Resident memory of the server process in bytes.', function=process_rss_bytes)
+metrics.gauge('lacmus_workers_resident_memory_bytes', 'Resident memory of all model worker processes in bytes.', function=workers_rss_bytes)
+
+@app.before_request
+def start_request_metrics():
+    g.request_start = time.time()
+    http_in_flight.inc(endpoint=request.endpoint or 'unknown')
+
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    http_requests.inc(endpoint=endpoint, status=response.status_code)
+    http_latency.observe(time.time() - g.request_start, endpoint=endpoint)
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    http_in_flight.dec(endpoint=request.endpoint or 'unknown')
+
 
 @app.route('/')
 def index():
     return jsonify({'status': "server is running"}), 200
 
 
+class ServerBusyError(RuntimeError):
+    """ Raised when a detection request arrives while --max-pending-requests requests are already pending.
+    """
+    pass
+
+
+@contextmanager
+def admitted():
+    """ Holds one of the --max-pending-requests slots while a detection request runs.
+    """
+    if request_slots is None:
+        yield
+        return
+    if not request_slots.acquire(blocking=False):
+        raise ServerBusyError('Too many pending requests.')
+    try:
+        yield
+    finally:
+        request_slots.release()
+
+
+def request_deadline(timeout=None):
+    """ Returns the deadline of the current request as time.time() timestamp, or None if it has none.
+
+    The timeout in seconds is taken from the argument, ?timeout= or the X-Request-Timeout header and defaults to --request-timeout.
+    """
+    if timeout is None:
+        timeout = request.args.get('timeout', request.headers.get('X-Request-Timeout'))
+    timeout = request_timeout if timeout is None else float(timeout)
+    return g.request_start + timeout if timeout > 0 else None
+
+
+def request_threshold(value, default=0.5):
+    """ Parses the score threshold of a request, a malformed threshold is a bad request.
+    """
+    if value is None:
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        abort(400)
+
+
+def retry_after():
+    """ Estimates the seconds until the queue of the default model has drained.
+    """
+    served = dict(model_registry.loaded()).get(default_model) if model_registry is not None else None
+    if served is None:
+        return 1
+    stats   = served.scheduler.statistics.as_dict()
+    batches = served.scheduler.queue_size() / stats['max_batch_size']
+    return max(1, int(math.ceil(batches * stats['mean_predict_time'])))
+
+
+def shed(reason, error):
+    requests_shed.inc(reason=reason)
+    return jsonify({'error': str(error)}), 503, {'Retry-After': str(retry_after())}
+
+
+def detection_response(run, headers=None):
+    """ Runs a detection request under admission control, overload fails fast with 503 and expired requests get 504.
+    """
+    try:
+        with admitted():
+            caption = run()
+    except ServerBusyError as e:
+        return shed('pending_limit', e)
+    except QueueFullError as e:
+        return shed('queue_full', e)
+    except DeadlineExceededError as e:
+        deadline_exceeded.inc()
+        return jsonify({'error': str(e)}), 504
+    if caption is None:
+        abort(400)
+    return caption, 200, headers or {}
+
+
 @app.route('/image', methods=['POST'])
 def predict_image():
     if not request.json or not 'data' in request.json:
         abort(400)
-    
-    caption = run_detection_image(model, labels_to_names, request.json['data'])
-    return caption, 200
 
+    return detection_response(partial(
+        run_detection_image,
+        None, labels_to_names, request.json['data'], request_threshold(request.json.get('threshold')),
+        model_name=requested_model(request.json.get('model')),
+        deadline=request_deadline(request.json.get('timeout'))
+    ))
+
+
+@app.route('/image/binary', methods=['POST'])
+def predict_image_binary():
+    """ Accepts a raw JPEG/PNG body (application/octet-stream) or a multipart upload with a single file.
+    """
+    threshold  = request_threshold(request.args.get('threshold'))
+    model_name = requested_model(request.args.get('model'))
+    deadline   = request_deadline()
+
+    def run():
+        # the body is only read once the request is admitted
+        if request.files:
+            data = next(iter(request.files.values())).read()
+        else:
+            data = request.get_data(cache=False)
+        if not data:
+            abort(400)
+        return run_detection_binary(None, labels_to_names, data, threshold, model_name=model_name, deadline=deadline)
+
+    return detection_response(run, headers={'Content-Type': 'application/json'})
+
+
+@app.route('/mission', methods=['POST'])
+def predict_mission():
+    """ Runs the model on a whole mission and streams one NDJSON line per image as soon as it is done.
+
+    The body is either a tar/zip archive of images or a JSON object {"paths": [...]} with paths
+    relative to --mission-root on the server.
+    """
+    threshold = request_threshold(request.args.get('threshold'))
+    model_name = requested_model(request.args.get('model'))
+
+    archive = None
+    if request.is_json:
+        if mission_root is None or not isinstance(request.json.get('paths'), list):
+            abort(400)
+        items = iter_paths(request.json['paths'], mission_root)
+    elif request.mimetype in ('application/zip', 'application/x-zip-compressed'):
+        # zip archives need to be seekable, keep the upload on disk instead of in memory
+        archive = tempfile.TemporaryFile()
+        shutil.copyfileobj(request.stream, archive)
+        archive.seek(0)
+        items = iter_zip(archive)
+    else:
+        items = iter_tar(request.stream)
+
+    def generate():
+        start_time = time.time()
+        count = 0
+        try:
+            process = partial(detect_encoded, priority=PRIORITY_BULK, model_name=model_name)
+            for name, detections, error in process_unordered(items, process, workers=mission_workers):
+                count += 1
+                if error is not None:
+                    line = {'name': name, 'error': str(error)}
+                elif detections is None:
+                    line = {'name': name, 'error': 'unable to decode image'}
+                else:
+                    line = {'name': name, 'objects': format_objects(*detections, threshold=threshold)}
+                yield json.dumps(line, separators=(',', ':')) + '\n'
+        except (ValueError, tarfile.TarError, zipfile.BadZipFile) as e:
+            yield json.dumps({'error': str(e)}) + '\n'
+        print("mission of {} images done in {} s".format(count, time.time() - start_time))
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    if archive is not None:
+        # also closed if the client disconnects before the stream starts
+        response.call_on_close(archive.close)
+    return response
+
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """ Submits a job for a whole mission, given as a tar/zip archive or a JSON object {"paths": [...]}.
+
+    The images are processed in the background with lower priority than single image requests.
+    """
+    if job_store is None:
+        abort(404)
+
+    job_id    = new_job_id()
+    directory = None
+    try:
+        threshold = float(request.args.get('threshold', 0.5))
+        if request.is_json:
+            if mission_root is None or not isinstance(request.json.get('paths'), list):
+                abort(400)
+            items = job_items_from_paths(request.json['paths'], mission_root)
+            threshold = float(request.json.get('threshold', threshold))
+        else:
+            # removed by the job runner once the job is done or cancelled
+            directory = job_upload_dir(jobs_dir, job_id)
+            if request.mimetype in ('application/zip', 'application/x-zip-compressed'):
+                with tempfile.TemporaryFile() as archive:
+                    shutil.copyfileobj(request.stream, archive)
+                    archive.seek(0)
+                    items = job_items_from_archive(iter_zip(archive), directory)
+            else:
+                items = job_items_from_archive(iter_tar(request.stream), directory)
+    except (TypeError, ValueError, tarfile.TarError, zipfile.BadZipFile) as e:
+        if directory is not None:
+            shutil.rmtree(directory, ignore_errors=True)
+        return jsonify({'error': str(e)}), 400
+
+    job_store.create(items, threshold=threshold, job_id=job_id)
+    job_runner.notify()
+    return jsonify(job_store.status(job_id)), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    status = job_store.status(job_id) if job_store is not None else None
+    if status is None:
+        abort(404)
+    return jsonify(status), 200
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    if job_store is None or job_store.status(job_id) is None:
+        abort(404)
+    job_runner.cancel(job_id)
+    return jsonify(job_store.status(job_id)), 200
+
+
+@app.route('/jobs/<job_id>/results', methods=['GET'])
+def job_results(job_id):
+    """ Streams the finished images of a job as NDJSON, ?offset=N skips the images before index N.
+    """
+    if job_store is None or job_store.status(job_id) is None:
+        abort(404)
+    offset = int(request.args.get('offset', 0))
+    lines = (json.dumps(line, separators=(',', ':')) + '\n' for line in job_store.results(job_id, offset))
+    return Response(lines, mimetype='application/x-ndjson')
+
+
+@app.route('/models', methods=['GET'])
+def model_stats():
+    """ Lists the served models, with the load and memory state of the registry when the models run in this process.
+    """
+    if model_registry is not None:
+        stats = model_registry.statistics()
+    else:
+        stats = {'models': {name: {'path': spec.path, 'backbone': spec.backbone_name} for name, spec in model_specs.items()}}
+    stats['default'] = default_model
+    return jsonify(stats), 200
+
+
+@app.route('/models/<name>/reload', methods=['POST'])
+def reload_model(name):
+    """ Loads a new snapshot of a model in the background and swaps it in once it is warmed up.
+
+    An optional JSON body {"path": ...} switches the model to another snapshot file, relative to --snapshots-root.
+    """
+    if name not in model_specs:
+        abort(404)
+    if model_registry is None:
+        # every worker watches the snapshots of its models itself
+        return jsonify({'error': 'models run in workers, they reload changed snapshots on their own'}), 409
+
+    spec = model_registry.spec(name)
+    if request.is_json and request.json.get('path'):
+        # loading a snapshot can run code of the file, so only snapshots under --snapshots-root are allowed
+        if snapshots_root is None:
+            return jsonify({'error': 'reloading another snapshot is disabled, the server has no --snapshots-root'}), 400
+        try:
+            spec = spec._replace(path=resolve_path(snapshots_root, request.json['path']))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'snapshot is outside of the snapshots root: {}'.format(request.json['path'])}), 400
+        if not os.path.isfile(spec.path):
+            return jsonify({'error': 'no such snapshot: {}'.format(spec.path)}), 400
+    model_registry.reload_in_background(name, spec)
+    return jsonify({'name': name, 'path': spec.path, 'state': 'reloading'}), 202
+
+
+@app.route('/batching', methods=['GET'])
+def batching_stats():
+    scheduler = loaded_model_or_404().scheduler
+    stats = scheduler.statistics.as_dict()
+    stats['queue_size'] = scheduler.queue_size()
+    return jsonify(stats), 200
+
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    if detection_cache is None:
+        abort(404)
+    return jsonify(detection_cache.statistics()), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    return metrics.expose(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+@app.route('/buckets', methods=['GET'])
+def bucket_stats():
+    shape_buckets = loaded_model_or_404().shape_buckets
+    if shape_buckets is None:
+        abort(404)
+    return jsonify(shape_buckets.statistics()), 200
+
+
+@app.route('/tiling', methods=['GET'])
+def tiling_stats():
+    tiled_predictor = loaded_model_or_404().tiled_predictor
+    if tiled_predictor is None:
+        abort(404)
+    return jsonify(tiled_predictor.statistics()), 200
+
+
+class ServedModel(object):
+    """ A loaded model with its own inference engine and batch scheduler, so several models can be served side by side.
+
+    Args
+        name    : Name of the model in the registry.
+        spec    : ModelSpec with the snapshot path and the backbone.
+        args    : Parsed server arguments with the engine, batching, tiling and bucket settings.
+        config  : tf.ConfigProto for the session of the model, None if no served model runs on TensorFlow.
+        weights : Optional (model_config, weights) from models.read_model_weights, used instead of reading spec.path by the keras engine.
+        threads : Intra-op threads of the engines without a config, like TFLite and ONNX Runtime (0 lets them decide).
+    """
+
+    def __init__(self, name, spec, args, config=None, weights=None, threads=0):
+        self.name = name
+        self.spec = spec
+
+        # the identity is taken before loading, so a snapshot written meanwhile is never cached under it
+        path          = resolve_model_path(spec.path, args.engine if args.engine != 'auto' else engine_name(spec.path))
+        model_stat    = os.stat(path)
+        self.identity = '{}:{}:{}:{}:{}'.format(os.path.abspath(path), model_stat.st_size, model_stat.st_mtime, args.engine, model_mode(args))
+
+        # models may load in a request thread, the threads of the engine still run on the model cores
+        with model_affinity(cpu_config):
+            self.engine = create_engine(
+                spec.path,
+                args.engine,
+                backbone_name=spec.backbone_name,
+                config=config,
+                weights=weights,
+                threads=threads
+            )
+        # a model converted with --preprocess resizes and preprocesses uint8 images itself
+        self.preprocessed = self.engine.preprocessed
+        if self.preprocessed and args.tiled:
+            raise ValueError('Tiling needs a model without in-graph preprocessing: {}'.format(spec.path))
+        # the preprocessing of the backbone of the model, as mode of preprocess_and_resize
+        self.preprocess = None if self.preprocessed else models.backbone_preprocessing(spec.backbone_name)
+        self.memory_bytes = self.engine.memory_bytes
+
+        self.scheduler = BatchScheduler(
+            self.predict_batch,
+            max_batch_size=args.max_batch_size,
+            max_wait=args.max_batch_wait / 1000.0,
+            max_queue_size=args.max_queue_size
+        ).start()
+        self.tiled_predictor = None
+        if args.tiled:
+            self.tiled_predictor = TiledPredictor(
+                self.predict_scheduled,
+                tile_width=args.tile_width,
+                tile_height=args.tile_height,
+                overlap_width=args.tile_overlap,
+                overlap_height=args.tile_overlap,
+                batch_size=args.tile_batch_size,
+                preprocess_image=self.preprocess_tile
+            )
+        self.shape_buckets = None
+        if self.engine.input_shape is not None and not args.tiled:
+            # a model with a static input shape only takes images of that shape, whatever --shape-buckets asks for
+            self.shape_buckets = ShapeBuckets([self.engine.input_shape])
+        elif args.shape_buckets and not args.tiled and not self.preprocessed:
+            self.shape_buckets = ShapeBuckets(parse_buckets(args.shape_buckets))
+
+        self.warmup(args)
+
+    def preprocess_tile(self, tile):
+        return preprocess_and_resize(tile, min_side=None, mode=self.preprocess)[0]
+
+    def predict_batch(self, batch):
+        batch_sizes.observe(len(batch))
+        with stage_latency.time(stage='predict'):
+            return self.engine.predict(batch)
+
+    def submit(self, image, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """ Submits a preprocessed image to the scheduler and counts it.
+
+        Raises
+            ValueError: if priority is unknown, before the image is queued.
+        """
+        if priority not in PRIORITY_NAMES:
+            raise ValueError('Unknown priority: {}'.format(priority))
+        try:
+            future = self.scheduler.submit(image, priority=priority, deadline=deadline)
+        except QueueFullError:
+            queue_rejected.inc()
+            raise
+        queue_submitted.inc(priority=PRIORITY_NAMES[priority])
+        return future
+
+    def predict_scheduled(self, batch, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """ Runs a batch of images through the scheduler, so it shares the model thread with single image requests.
+        """
+        futures = [self.submit(image, priority=priority, deadline=deadline) for image in batch]
+        outputs = [future.result() for future in futures]
+        return [np.concatenate(output, axis=0) for output in zip(*outputs)]
+
+    def detect(self, image, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """ Runs the model on a decoded BGR image and returns boxes, scores and labels in image coordinates.
+        """
+        if self.tiled_predictor is not None:
+            # run the model on native resolution tiles, boxes are already in image coordinates
+            return self.tiled_predictor(image, priority=priority, deadline=deadline)
+        if self.preprocessed:
+            # boxes are already in image coordinates
+            return self.submit(image, priority=priority, deadline=deadline).result()
+
+        height, width = image.shape[:2]
+
+        # resize and preprocess image for network
+        with stage_latency.time(stage='preprocess'):
+            image, scale = preprocess_and_resize(image, mode=self.preprocess)
+        if self.shape_buckets is not None:
+            # pad to a shape the model was warmed up for
+            with stage_latency.time(stage='bucket'):
+                image, bucket_scale, padding = self.shape_buckets.fit(image)
+            bucket_padding.observe(padding, bucket=bucket_name(image.shape[:2]))
+            scale *= bucket_scale
+
+        # process image, the scheduler batches it together with concurrent requests
+        boxes, scores, labels = self.submit(image, priority=priority, deadline=deadline).result()
+
+        # correct for image scale
+        boxes /= scale
+        if self.shape_buckets is not None:
+            # boxes may reach into the padding
+            np.clip(boxes[..., 0::2], 0, width - 1, out=boxes[..., 0::2])
+            np.clip(boxes[..., 1::2], 0, height - 1, out=boxes[..., 1::2])
 
-def run_detection_image(model, labels_to_names, data):
+        return boxes, scores, labels
+
+    def warmup(self, args):
+        """ Runs the model for every input shape it will see (the shape buckets or the tile shape) and every batch size.
+
+        TensorFlow plans and allocates on the first run of a shape, so this keeps that cost out of the first requests.
+        """
+        if self.tiled_predictor is not None:
+            shapes = [(args.tile_height, args.tile_width)]
+        elif self.shape_buckets is not None:
+            shapes = self.shape_buckets.buckets
+        else:
+            return
+
+        for shape in shapes:
+            start_time = time.time()
+            for batch_size in range(1, args.max_batch_size + 1):
+                self.engine.predict(np.zeros((batch_size,) + tuple(shape) + (3,), dtype=np.float32))
+            print('{}: warmed up {} for batch sizes 1-{} in {:.2f} s'.format(self.name, bucket_name(shape), args.max_batch_size, time.time() - start_time))
+
+    def close(self):
+        """ Stops the scheduler after its pending requests and frees the engine.
+        """
+        self.scheduler.stop()
+        self.engine.close()
+        print('model {} unloaded'.format(self.name))
+
+
+def loaded_model_or_404():
+    """ Returns the loaded model named by ?model= (the default model if not given) for the statistics endpoints.
+    """
+    if model_registry is None:
+        abort(404)
+    served = dict(model_registry.loaded()).get(request.args.get('model', default_model))
+    if served is None:
+        abort(404)
+    return served
+
+
+def requested_model(name):
+    """ Validates a model name given in a request, None selects the default model.
+    """
+    if name is not None and name not in model_specs:
+        abort(404)
+    return name
+
+
+def detect_encoded(data, priority=PRIORITY_INTERACTIVE, model_name=None, deadline=None):
+    """ Decodes an encoded JPEG/PNG image and runs a model on it, in a pool worker if workers are used.
+
+    data may also be an already decoded BGR image (np.array of shape (H, W, 3)), which is detected as it is.
+
+    Returns None if the data can not be decoded.
+
+    Raises
+        DeadlineExceededError: if the deadline passed before the image reached the model.
+        QueueFullError: if the batch queue of the model is full.
+    """
+    with detections_in_flight.track_inprogress():
+        if worker_pool is not None:
+            # bulk work leaves one worker idle for interactive requests
+            reserve = 1 if priority == PRIORITY_BULK and len(worker_pool.workers) > 1 else 0
+            timeout = None if deadline is None else max(deadline - time.time(), 0)
+            try:
+                detections, samples = worker_pool.run((data, priority, model_name, deadline), timeout=timeout, reserve=reserve)
+            except queue.Empty:
+                raise DeadlineExceededError('No worker became idle before the deadline.')
+            # the stage latencies measured in the worker
+            metrics.replay(samples)
+            return detections
+        return decode_and_detect(data, priority=priority, model_name=model_name, deadline=deadline)
+
+
+def decode_and_detect(data, priority=PRIORITY_INTERACTIVE, model_name=None, deadline=None):
+    """ Decodes an encoded image and detects its objects in this process, through the detection cache if enabled.
+    """
+    # do not spend time decoding for a client which gave up already
+    check_deadline(deadline)
+    if isinstance(data, np.ndarray):
+        image, decode_scale = data, 1
+    else:
+        with stage_latency.time(stage='imdecode'):
+            image, decode_scale = decode_image_bgr(data, scale=network_scale(data))
+    if image is None:
+        return None
+
+    # the model stays loaded until the request is done, even if it is replaced or evicted meanwhile
+    with model_registry.use(model_name or default_model) as served:
+        if detection_cache is None:
+            detections = served.detect(image, priority=priority, deadline=deadline)
+        else:
+            # the cache holds the detections before the score cut, so any threshold can be served from it
+            key = image_key(image, served.identity)
+            detections = detection_cache.get(key)
+            if detections is None:
+                detections = detection_cache.put(key, *served.detect(image, priority=priority, deadline=deadline))
+
+    if decode_scale != 1:
+        # boxes of a reduced decode are mapped to the full image, without touching the cached arrays
+        boxes, scores, labels = detections
+        detections = (boxes / decode_scale, scores, labels)
+    return detections
+
+
+def network_scale(data):
+    """ Returns the scale an encoded image will be resized with for the network, or None to decode it at full size.
+
+    Only JPEGs are decoded at a reduced size, their size is read from the header.
+    """
+    if not reduced_decode:
+        return None
+    size = jpeg_size(data)
+    if size is None:
+        return None
+    return compute_resize_scale(size + (3,))
+
+
+def detect_in_worker(payload):
+    """ Handler of a pool worker, returns the detections with the metric samples recorded while detecting.
+    """
+    data, priority, model_name, deadline = payload
+    return decode_and_detect(data, priority=priority, model_name=model_name, deadline=deadline), metrics.drain()
+
+
+def format_objects(boxes, scores, labels, threshold=0.5):
+    """ Converts the detections above threshold to a list of dicts with numeric fields.
+    """
+    objects = []
+    for box, score, label in zip(boxes[0], scores[0], labels[0]):
+        # scores are sorted so we can break
+        if score < threshold:
+            break
+        b = box.astype(int)
+        objects.append({
+            'name': labels_to_names[label],
+            'score': round(float(score), 4),
+            'xmin': int(b[0]),
+            'ymin': int(b[1]),
+            'xmax': int(b[2]),
+            'ymax': int(b[3])
+        })
+    return objects
+
+
+def process_job_image(data, threshold=0.5):
+    """ Runs a job image with bulk priority and returns its objects, or None if it can not be decoded.
+    """
+    detections = detect_encoded(data, priority=PRIORITY_BULK)
+    if detections is None:
+        return None
+    return format_objects(*detections, threshold=threshold)
+
+
+def run_detection_binary(model, labels_to_names, data, threshold=0.5, model_name=None, deadline=None):
+    """ Decodes an encoded image straight from the request buffer and returns a compact JSON response.
+
+    Returns None if the data can not be decoded.
+    """
     print("start predict...")
     start_time = time.time()
-    with sess.as_default():
-        with graph.as_default():
-            imgdata = pybase64.b64decode(data)
-            file_bytes = np.asarray(bytearray(imgdata), dtype=np.uint8)
-            image = cv2.imdecode(file_bytes, cv2.IMREAD_COLOR)
-
-            # preprocess image for network
-            image = preprocess_image(image)
-            image, scale = resize_image(image)
-
-            # process image
-            boxes, scores, labels = model.predict_on_batch(np.expand_dims(image, axis=0))
-
-            # correct for image scale
-            boxes /= scale
-
-            objects = []
-            reaponse = {
-              'objects': objects
-            }
-
-            # visualize detections
-            for box, score, label in zip(boxes[0], scores[0], labels[0]):
-                # scores are sorted so we can break
-                if score < 0.5:
-                    break
-                b = np.array(box.astype(int)).astype(int)
-                # x1 y1 x2 y2
-                obj = {
-                  'name': labels_to_names[label],
-                  'score': str(score),
-                  'xmin': str(b[0]),
-                  'ymin': str(b[1]),
-                  'xmax': str(b[2]),
-                  'ymax': str(b[3])
-                }
-                objects.append(obj)
-            reaponse_json = json.dumps(reaponse)
-            print("done in {} s".format(time.time() - start_time))
-            return reaponse_json
+    detections = detect_encoded(data, model_name=model_name, deadline=deadline)
+    if detections is None:
+        return None
+    boxes, scores, labels = detections
+
+    objects = format_objects(boxes, scores, labels, threshold)
+    with stage_latency.time(stage='json'):
+        reaponse_json = json.dumps({'objects': objects}, separators=(',', ':'))
+    print("done in {} s".format(time.time() - start_time))
+    return reaponse_json
+
+
+def run_detection_image(model, labels_to_names, data, threshold=0.5, model_name=None, deadline=None):
+    print("start predict...")
+    start_time = time.time()
+    with stage_latency.time(stage='b64decode'):
+        imgdata = pybase64.b64decode(data)
+    detections = detect_encoded(imgdata, model_name=model_name, deadline=deadline)
+    if detections is None:
+        return None
+    boxes, scores, labels = detections
+
+    objects = []
+    reaponse = {
+      'objects': objects
+    }
+
+    # visualize detections
+    for box, score, label in zip(boxes[0], scores[0], labels[0]):
+        # scores are sorted so we can break
+        if score < threshold:
+            break
+        b = np.array(box.astype(int)).astype(int)
+        # x1 y1 x2 y2
+        obj = {
+          'name': labels_to_names[label],
+          'score': str(score),
+          'xmin': str(b[0]),
+          'ymin': str(b[1]),
+          'xmax': str(b[2]),
+          'ymax': str(b[3])
+        }
+        objects.append(obj)
+    with stage_latency.time(stage='json'):
+        reaponse_json = json.dumps(reaponse)
+    print("done in {} s".format(time.time() - start_time))
+    return reaponse_json
+
+def model_specs_from_args(args):
+    """ Returns an OrderedDict of the served models, the default model (--model) comes first.
+    """
+    specs = OrderedDict([(args.model_name, ModelSpec(args.model, args.backbone))])
+    for definition in args.extra_model or []:
+        name, spec = parse_model_spec(definition)
+        specs[name] = spec
+    return specs
+
+def create_model_registry(args, config, shared_weights=None, threads=0):
+    """ Creates the registry of the served models, loading the default model and watching the snapshots for changes.
+
+    Args
+        args           : Parsed server arguments.
+        config         : tf.ConfigProto for the sessions of the models, None if no served model runs on TensorFlow.
+        shared_weights : Optional dict mapping snapshot paths to the output of models.read_model_weights,
+                         used once instead of reading the snapshot (workers use the weights read before forking).
+        threads        : Intra-op threads of the engines without a config.
+    """
+    global model_registry
+    global default_model
+
+    shared_weights = dict(shared_weights or {})
+
+    def load(name, spec):
+        return ServedModel(name, spec, args, config=config, weights=shared_weights.pop(spec.path, None), threads=threads)
+
+    max_bytes = int(args.model_memory * 1024 * 1024) if args.model_memory > 0 else None
+    model_registry = ModelRegistry(load, max_bytes=max_bytes)
+    for name, spec in model_specs.items():
+        model_registry.add(name, spec)
+    default_model = args.model_name
+
+    # the default model is ready (and warmed up) before the server reports ready, others load on first use
+    with model_registry.use(default_model):
+        pass
+    if args.watch_interval > 0:
+        model_registry.watch(args.watch_interval)
+    return model_registry
+
+def start_detector(args):
+    """ Creates the detection cache shared by all models and sets up the decoding.
+    """
+    global detection_cache
+    global reduced_decode
+
+    # tiles are cut from the full resolution image
+    reduced_decode = args.reduced_decode and not args.tiled
+    detection_cache = None
+    if args.cache_size > 0:
+        detection_cache = DetectionCache(max_bytes=int(args.cache_size * 1024 * 1024), cache_dir=args.cache_dir)
+
+def uses_tensorflow(args):
+    """ Whether any served model runs on the keras or tf engine, only then tensorflow is imported.
+    """
+    return any((args.engine if args.engine != 'auto' else engine_name(spec.path)) in ('keras', 'tf') for spec in model_specs.values())
+
+def setup_tensorflow(config=None):
+    """ Creates the first tensorflow session of the process with config, which sizes the tensorflow thread pools.
+    """
+    from keras_retinanet.utils.gpu import setup_gpu
+    setup_gpu(0, config)
 
 def load_model(args):
-    global sess 
-    global model
     global labels_to_names
-    global graph
 
-    sess = tf.InteractiveSession()
-    graph = tf.get_default_graph()
-    setup_gpu(0)
-    model_path = args.model
-    model = models.load_model(model_path, backbone_name='resnet50')
+    config = None
+    if uses_tensorflow(args):
+        config = apply_cpu_config(cpu_config) if cpu_config is not None else session_config()
+        with model_affinity(cpu_config):
+            setup_tensorflow(config)
+    elif cpu_config is not None:
+        cv2.setNumThreads(cpu_config.opencv_threads)
     labels_to_names = {0: 'Pedestrian'}
-    return model, labels_to_names
+    start_detector(args)
+    create_model_registry(args, config, threads=cpu_config.intra_op_threads if cpu_config is not None else 0)
+    return model_registry, labels_to_names
 
-def parse_args(args):
-    """ Parse the arguments.
+def calibration_setup(args):
+    """ Loads the default model for --cpu-split auto, in the forked calibration process.
+
+    A drone photo sized image is decoded and preprocessed like a request and run through the model.
+    """
+    config = None
+    if uses_tensorflow(args):
+        config = session_config()
+        setup_tensorflow()
+    start_detector(args)
+    served = ServedModel(args.model_name, model_specs[args.model_name], args, config=config)
+
+    # smooth content, noise would make decoding unrealistically slow
+    random = np.random.RandomState(0)
+    image  = cv2.resize(random.randint(0, 256, (300, 400, 3)).astype(np.uint8), (4000, 3000), interpolation=cv2.INTER_CUBIC)
+    data   = cv2.imencode('.jpg', image)[1].tobytes()
+
+    def load():
+        image, _ = decode_image_bgr(data, scale=network_scale(data))
+        if not served.preprocessed:
+            image, _ = preprocess_and_resize(image, mode=served.preprocess)
+        return np.expand_dims(image, axis=0)
+
+    return load, served.predict_batch
+
+def start_cpu(args):
+    """ Splits the cores between request handling (decoding) and the models, before any session exists.
+    """
+    global cpu_config
+
+    config = configparser.ConfigParser()
+    if args.config:
+        with open(args.config) as f:
+            config.read_file(f)
+    cpu_config = cpu_config_from_args(
+        args,
+        parse_cpu_parameters(config) if 'cpu' in config else None,
+        data_workers=args.mission_workers,
+        calibrate=partial(calibrate_in_subprocess, partial(calibration_setup, args))
+    )
+    if cpu_config is not None:
+        args.mission_workers = cpu_config.data_workers
+    elif not args.mission_workers:
+        args.mission_workers = 4
+
+def model_mode(args):
+    """ Describes the detection settings which influence the detections of a model.
+    """
+    if args.tiled:
+        return 'tiled-{}x{}-{}'.format(args.tile_width, args.tile_height, args.tile_overlap)
+    if args.shape_buckets:
+        # letterboxing changes the detections of large images
+        return 'resized-buckets-{}'.format(','.join(bucket_name(b) for b in ShapeBuckets(parse_buckets(args.shape_buckets)).buckets))
+    return 'resized'
+
+def init_worker(args, shared_weights, index, cores):
+    """ Initializes a forked pool worker: pins it and loads the default model from the shared weights in its own sessions.
+    """
+    global cpu_config
+    global worker_pool
+
+    # a respawned worker inherits the pool of the parent
+    worker_pool = None
+    # the samples of every request are sent back to the parent, which exposes them
+    metrics.start_recording()
+    if args.pin_workers:
+        pin_to_cores(cores)
+    if cpu_config is not None:
+        # the worker decodes its requests itself
+        cv2.setNumThreads(cpu_config.opencv_threads)
+        # and it is pinned as a whole, so its sessions are not pinned to all model cores
+        cpu_config = None
+    intra_op_threads = args.intra_op_threads or len(cores)
+    inter_op_threads = args.inter_op_threads or 1
+
+    # in a worker requests arrive one by one, so there is nothing to batch
+    args.max_batch_size = 1
+    args.max_batch_wait = 0
+    start_detector(args)
+    config = session_config(intra_op_threads, inter_op_threads) if uses_tensorflow(args) else None
+    create_model_registry(args, config, shared_weights, threads=intra_op_threads)
+    print('worker {} ready on cores {} with {} intra-op threads'.format(index, cores, intra_op_threads))
+
+def start_worker_pool(args):
+    """ Reads the default model once and forks the workers, which share the weights copy-on-write.
     """
-    parser = argparse.ArgumentParser(description='Evaluation script for a RetinaNet network.')
+    global labels_to_names
+    global worker_pool
+
+    # no tensorflow session may exist in the parent before forking
+    shared_weights = {}
+    if (args.engine if args.engine != 'auto' else engine_name(args.model)) == 'keras':
+        shared_weights[args.model] = models.read_model_weights(args.model)
+    labels_to_names = {0: 'Pedestrian'}
+    worker_pool = WorkerPool(
+        partial(init_worker, args, shared_weights),
+        detect_in_worker,
+        num_workers=args.workers,
+        # request handling in the parent keeps the data cores of the CPU split
+        cores=cpu_config.model_cores if cpu_config is not None else None,
+        # overload and deadline errors reach the request handlers as they are
+        forward_exceptions=(DeadlineExceededError, QueueFullError)
+    ).start()
+    return worker_pool
+
+def build_parser(description='Evaluation script for a RetinaNet network.'):
+    """ Returns the argument parser of the server, which other transports extend with their own arguments.
+    """
+    parser = argparse.ArgumentParser(description=description)
     parser.add_argument('--model', help='Path to RetinaNet model.', default=os.path.join('snapshots', 'resnet50_liza_alert_v1_interface.h5'))
+    parser.add_argument('--backbone', help='Backbone of the model given by --model.', default='resnet50')
+    parser.add_argument('--engine', help='Inference engine of the models: keras, or tf, tflite or onnxruntime for the exports of convert_model.py --export next to a Keras model (auto picks the engine of the model file).', choices=['auto'] + list(ENGINES), default='auto')
+    parser.add_argument('--model-name', help='Name of the model given by --model, it serves requests which do not name a model.', default='resnet50')
+    parser.add_argument('--extra-model', help='Additional model requests can select by name, as NAME=BACKBONE:PATH (like mobilenet=mobilenet224_1.0:snapshots/mobilenet.h5). Can be repeated.', action='append')
+    parser.add_argument('--model-memory', help='Memory budget in MB for the weights of loaded models, least recently used models are unloaded above it. 0 means no limit.', type=float, default=0)
+    parser.add_argument('--snapshots-root', help='Directory the snapshot paths of reload requests are relative to, reloads to another snapshot are refused if not set.')
+    parser.add_argument('--watch-interval', help='Seconds between checks for new snapshots of the loaded models, which are then reloaded in the background. 0 disables the checks.', type=float, default=10)
     parser.add_argument('--gpu', help='Visile gpu device. Set to -1 if CPU', default=0)
-    return parser.parse_args(args)
+    parser.add_argument('--max-batch-size', help='Maximum number of concurrent requests run as one batch.', type=int, default=4)
+    parser.add_argument('--max-batch-wait', help='Maximum time in milliseconds to wait for a batch to fill up.', type=float, default=5.0)
+    parser.add_argument('--max-queue-size', help='Maximum number of requests waiting for the model, further requests get 503.', type=int, default=64)
+    parser.add_argument('--tiled', help='Run the model on overlapping full resolution tiles instead of a downscaled image.', action='store_true')
+    parser.add_argument('--tile-width', help='Width of a tile in tiled mode.', type=int, default=1024)
+    parser.add_argument('--tile-height', help='Height of a tile in tiled mode.', type=int, default=1024)
+    parser.add_argument('--tile-overlap', help='Overlap between neighbouring tiles in tiled mode.', type=int, default=128)
+    parser.add_argument('--tile-batch-size', help='Number of tiles per model call in tiled mode.', type=int, default=4)
+    parser.add_argument('--shape-buckets', help='Comma separated WIDTHxHEIGHT shapes (like 1067x800,1333x750) resized images are padded or letterboxed to, every bucket is warmed up at startup.')
+    parser.add_argument('--no-reduced-decode', help='Always decode JPEGs at full size, instead of at 1/2, 1/4 or 1/8 when they are downscaled that much anyway.', dest='reduced_decode', action='store_false')
+    parser.add_argument('--cache-size', help='Memory budget in MB for cached detections of repeated images, 0 disables the cache.', type=float, default=64)
+    parser.add_argument('--cache-dir', help='Optional directory for an on-disk tier of the detection cache.')
+    parser.add_argument('--request-timeout', help='Default deadline in seconds for single image requests (overridden by ?timeout= or the X-Request-Timeout header), requests still waiting for the model after it get 504. 0 means no deadline.', type=float, default=0)
+    parser.add_argument('--max-pending-requests', help='Maximum number of single image requests in progress, further requests get 503 with Retry-After. 0 means no limit.', type=int, default=0)
+    parser.add_argument('--mission-root', help='Directory the server-local paths of /mission requests are relative to, path requests are refused if not set.')
+    parser.add_argument('--mission-workers', help='Number of threads decoding mission images while the model runs (defaults to the data workers of the CPU split, or 4).', type=int, default=0)
+    parser.add_argument('--jobs-dir', help='Directory for the job database and uploaded job archives, jobs are disabled if not set.')
+    parser.add_argument('--workers', help='Number of forked model worker processes, 0 runs the model in the server process.', type=int, default=0)
+    parser.add_argument('--no-pin-workers', help='Do not pin workers to their core sets.', dest='pin_workers', action='store_false')
+    parser.add_argument('--config', help='Path to a configuration parameters .ini file, only its [cpu] section is used.')
+    # with --workers the thread settings are per worker and the intra-op threads default to the cores of the worker
+    add_cpu_arguments(parser)
+    return parser
+
+def parse_args(args):
+    """ Parse the arguments.
+    """
+    return build_parser().parse_args(args)
+
+def start_jobs(args):
+    """ Opens the job database and resumes unfinished jobs in the background.
+    """
+    global jobs_dir
+    global job_store
+    global job_runner
+
+    jobs_dir = args.jobs_dir
+    os.makedirs(jobs_dir, exist_ok=True)
+    job_store = JobStore(os.path.join(jobs_dir, 'jobs.sqlite'))
+    job_runner = JobRunner(job_store, process_job_image, workers=args.mission_workers, uploads_dir=jobs_dir).start()
+
+def start_server(args):
+    """ Loads the models (or starts the workers) and sets up admission control and jobs, independent of the transport.
+    """
+    global mission_root
+    global snapshots_root
+    global mission_workers
+    global model_specs
+    global request_timeout
+    global request_slots
+
+    model_specs = model_specs_from_args(args)
+    request_timeout = args.request_timeout
+    if args.max_pending_requests > 0:
+        request_slots = threading.BoundedSemaphore(args.max_pending_requests)
+    mission_root = args.mission_root
+    snapshots_root = args.snapshots_root
+    start_cpu(args)
+    mission_workers = args.mission_workers
+    if args.workers > 0:
+        start_worker_pool(args)
+        print('{} workers started'.format(args.workers))
+    else:
+        load_model(args)
+        print('model loaded')
+    if cpu_config is not None and cpu_config.pin:
+        # request and mission threads are started from here and decode on the data cores
+        pin_to_cores(cpu_config.data_cores)
+    if args.jobs_dir:
+        # only after forking, the workers do not need the database or its thread
+        start_jobs(args)
 
 def main(args=None):
     args = parse_args(args)
-    load_model(args)
-    print('model loaded')
-    app.run(debug=False, host='0.0.0.0', port=5000)    
+    start_server(args)
+    app.run(debug=False, host='0.0.0.0', port=5000, threaded=True)
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,313 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from functools import partial
+
+from keras_retinanet.utils.batching import DeadlineExceededError, QueueFullError
+from keras_retinanet.utils.mission import process_unordered, resolve_path
+
+QUEUED    = 'queued'
+RUNNING   = 'running'
+DONE      = 'done'
+CANCELLED = 'cancelled'
+
+PENDING = 'pending'
+FAILED  = 'failed'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id        TEXT PRIMARY KEY,
+    state     TEXT NOT NULL,
+    threshold REAL NOT NULL,
+    total     INTEGER NOT NULL,
+    created   REAL NOT NULL,
+    updated   REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS items (
+    job_id TEXT NOT NULL,
+    idx    INTEGER NOT NULL,
+    name   TEXT NOT NULL,
+    path   TEXT NOT NULL,
+    state  TEXT NOT NULL,
+    result TEXT,
+    PRIMARY KEY (job_id, idx)
+);
+"""
+
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+class JobStore(object):
+    """ Persists jobs and their per-image results in SQLite, so they survive restarts.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock, self._conn:
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.executescript(SCHEMA)
+
+    def create(self, items, threshold=0.5, job_id=None):
+        """ Creates a queued job.
+
+        Args
+            items     : List of (name, path) tuples, path is an absolute path of an image.
+            threshold : Score threshold for the stored detections.
+            job_id    : Id of the job, like new_job_id() when its images are stored before it is created.
+
+        Returns
+            The id of the job.
+        """
+        job_id = job_id or new_job_id()
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT INTO jobs (id, state, threshold, total, created, updated) VALUES (?, ?, ?, ?, ?, ?)',
+                (job_id, QUEUED, threshold, len(items), now, now)
+            )
+            self._conn.executemany(
+                'INSERT INTO items (job_id, idx, name, path, state) VALUES (?, ?, ?, ?, ?)',
+                ((job_id, idx, name, path, PENDING) for idx, (name, path) in enumerate(items))
+            )
+        return job_id
+
+    def status(self, job_id):
+        """ Returns the state and progress of a job, or None if it does not exist.
+        """
+        with self._lock:
+            job = self._conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            if job is None:
+                return None
+            counts = dict(self._conn.execute(
+                'SELECT state, COUNT(*) FROM items WHERE job_id = ? GROUP BY state', (job_id,)
+            ).fetchall())
+
+        return {
+            'id'        : job['id'],
+            'state'     : job['state'],
+            'threshold' : job['threshold'],
+            'total'     : job['total'],
+            'done'      : counts.get(DONE, 0),
+            'failed'    : counts.get(FAILED, 0),
+            'pending'   : counts.get(PENDING, 0),
+            'created'   : job['created'],
+            'updated'   : job['updated'],
+        }
+
+    def state(self, job_id):
+        """ Returns the state of a job, or None if it does not exist.
+        """
+        with self._lock:
+            job = self._conn.execute('SELECT state FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return None if job is None else job['state']
+
+    def set_state(self, job_id, state, only_from=None):
+        """ Changes the state of a job, optionally only if it currently is in one of the states in only_from.
+
+        Returns
+            True if the state was changed.
+        """
+        query  = 'UPDATE jobs SET state = ?, updated = ? WHERE id = ?'
+        params = [state, time.time(), job_id]
+        if only_from:
+            query  += ' AND state IN ({})'.format(', '.join('?' * len(only_from)))
+            params += list(only_from)
+        with self._lock, self._conn:
+            return self._conn.execute(query, params).rowcount > 0
+
+    def next_job(self):
+        """ Returns the oldest unfinished job (jobs interrupted by a restart come first), or None.
+        """
+        with self._lock:
+            job = self._conn.execute(
+                'SELECT id, threshold FROM jobs WHERE state IN (?, ?) ORDER BY state = ? DESC, created LIMIT 1',
+                (QUEUED, RUNNING, RUNNING)
+            ).fetchone()
+        return None if job is None else (job['id'], job['threshold'])
+
+    def pending_items(self, job_id):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT idx, path FROM items WHERE job_id = ? AND state = ? ORDER BY idx', (job_id, PENDING)
+            ).fetchall()
+
+    def finish_item(self, job_id, idx, state, result):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'UPDATE items SET state = ?, result = ? WHERE job_id = ? AND idx = ?',
+                (state, json.dumps(result, separators=(',', ':')), job_id, idx)
+            )
+            self._conn.execute('UPDATE jobs SET updated = ? WHERE id = ?', (time.time(), job_id))
+
+    def results(self, job_id, offset=0):
+        """ Iterates the finished items of a job in image order, starting at item index offset.
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT idx, name, state, result FROM items WHERE job_id = ? AND state != ? AND idx >= ? ORDER BY idx',
+                (job_id, PENDING, offset)
+            ).fetchall()
+        for row in rows:
+            line = {'index': row['idx'], 'name': row['name']}
+            if row['state'] == DONE:
+                line['objects'] = json.loads(row['result'])
+            else:
+                line['error'] = json.loads(row['result'])
+            yield line
+
+
+class JobRunner(object):
+    """ Processes the jobs of a JobStore one after another in a background thread.
+
+    Args
+        store   : The JobStore to take jobs from.
+        process : Function called as process(data, threshold) with the encoded bytes of an image, returning
+                  a JSON serializable result or None if the image can not be decoded. It should submit its
+                  work with bulk priority, so interactive requests are not delayed by jobs.
+        workers          : Number of images processed at once within a job.
+        transient_errors : Exceptions of process which mean the server is busy, the image stays pending and is
+                           tried again after a backoff instead of failing.
+        retry_delay      : Seconds to wait before the first retry of busy images, doubled on every retry without progress.
+        max_retry_delay  : Longest wait between retries.
+        uploads_dir      : Directory the images of uploaded jobs are stored in, as uploads_dir/<job id> (see job_upload_dir),
+                           which is removed once the job is done or cancelled.
+    """
+
+    def __init__(self, store, process, workers=4, transient_errors=(QueueFullError, DeadlineExceededError), retry_delay=0.5, max_retry_delay=30.0, uploads_dir=None):
+        self.store            = store
+        self.uploads_dir      = uploads_dir
+        self.process          = process
+        self.workers          = workers
+        self.transient_errors = transient_errors
+        self.retry_delay      = retry_delay
+        self.max_retry_delay  = max_retry_delay
+
+        self._wakeup  = threading.Event()
+        self._stopped = threading.Event()
+        self._running = False
+        self._thread  = None
+
+    def start(self):
+        self._running = True
+        self._stopped.clear()
+        self._thread  = threading.Thread(target=self._run, name='job-runner', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._running = False
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def notify(self):
+        """ Wakes up the runner after a job was submitted.
+        """
+        self._wakeup.set()
+
+    def cancel(self, job_id):
+        """ Cancels a queued or running job, images which are in progress still finish.
+
+        Returns
+            True if the job was cancelled.
+        """
+        queued    = self.store.state(job_id) == QUEUED
+        cancelled = self.store.set_state(job_id, CANCELLED, only_from=(QUEUED, RUNNING))
+        # a running job still reads its images, the runner removes them once it stops
+        if cancelled and queued:
+            self._remove_upload(job_id)
+        return cancelled
+
+    def _remove_upload(self, job_id):
+        if self.uploads_dir is not None:
+            shutil.rmtree(job_upload_dir(self.uploads_dir, job_id), ignore_errors=True)
+
+    def _items(self, job_id):
+        for idx, path in self.store.pending_items(job_id):
+            if not self._running or self.store.state(job_id) != RUNNING:
+                return
+
+            def load(path=path):
+                with open(path, 'rb') as f:
+                    return f.read()
+
+            yield idx, load
+
+    def _run_job(self, job_id, threshold):
+        self.store.set_state(job_id, RUNNING, only_from=(QUEUED, RUNNING))
+        process = partial(self.process, threshold=threshold)
+        delay   = self.retry_delay
+
+        while True:
+            busy     = 0
+            finished = 0
+            for idx, result, error in process_unordered(self._items(job_id), process, workers=self.workers):
+                if isinstance(error, self.transient_errors):
+                    # the server is busy, the image stays pending
+                    busy += 1
+                    continue
+                if error is not None:
+                    self.store.finish_item(job_id, idx, FAILED, str(error))
+                elif result is None:
+                    self.store.finish_item(job_id, idx, FAILED, 'unable to decode image')
+                else:
+                    self.store.finish_item(job_id, idx, DONE, result)
+                finished += 1
+
+            if not busy or not self._running or self.store.state(job_id) != RUNNING:
+                break
+            # back off while the server stays busy, retry sooner once images get through again
+            delay = self.retry_delay if finished else min(delay * 2, self.max_retry_delay)
+            self._stopped.wait(timeout=delay)
+
+        # a stopped runner leaves the job running, so it is resumed after a restart
+        if self._running:
+            self.store.set_state(job_id, DONE, only_from=(RUNNING,))
+        if self.store.state(job_id) in (DONE, CANCELLED):
+            self._remove_upload(job_id)
+
+    def _run(self):
+        while self._running:
+            job = self.store.next_job()
+            if job is None:
+                self._wakeup.wait(timeout=1.0)
+                self._wakeup.clear()
+                continue
+            self._run_job(*job)
+
+
+def job_upload_dir(uploads_dir, job_id):
+    """ Returns the directory the images of an uploaded job are stored in.
+    """
+    return os.path.join(uploads_dir, job_id)
+
+
+def job_items_from_paths(paths, root):
+    """ Converts paths relative to root to job items, raises ValueError for paths outside of root.
+    """
+    return [(path, resolve_path(root, path)) for path in paths]
+
+
+def job_items_from_archive(items, directory):
+    """ Stores the images of an archive (as iterated by mission.iter_tar/iter_zip) in directory and returns job items.
+    """
+    os.makedirs(directory, exist_ok=True)
+    job_items = []
+    for idx, (name, load) in enumerate(items):
+        # never trust archive member names as paths
+        path = os.path.join(directory, '{:06d}{}'.format(idx, os.path.splitext(name)[1].lower()))
+        with open(path, 'wb') as f:
+            f.write(load())
+        job_items.append((name, path))
+    return job_items
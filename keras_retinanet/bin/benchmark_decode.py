@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import argparse
+import os
+import sys
+import time
+
+# Allow relative imports when being executed as script.
+if __name__ == "__main__" and __package__ is None:
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+    import keras_retinanet.bin  # noqa: F401
+    __package__ = "keras_retinanet.bin"
+
+# Change these to absolute imports if you copy this script outside the keras_retinanet package.
+from ..utils.image import compute_resize_scale, decode_image_bgr, jpeg_size, preprocess_and_resize
+
+
+def image_paths(paths, limit=None):
+    """ Lists the JPEG files of the given files and directories (like LaDD JPEGImages folders).
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                found += [os.path.join(root, name) for name in sorted(names) if name.lower().endswith(('.jpg', '.jpeg'))]
+        else:
+            found.append(path)
+    return found[:limit] if limit else found
+
+
+def measure(data, reduced, min_side, max_side):
+    """ Decodes and preprocesses one encoded image for the network.
+
+    Returns
+        The decode time, the preprocessing time and the size in bytes of the decoded image.
+    """
+    scale = None
+    if reduced:
+        size  = jpeg_size(data)
+        scale = compute_resize_scale(size + (3,), min_side=min_side, max_side=max_side) if size else None
+
+    start = time.perf_counter()
+    image, _ = decode_image_bgr(data, scale=scale)
+    decoded = time.perf_counter()
+    preprocess_and_resize(image, min_side=min_side, max_side=max_side)
+    return decoded - start, time.perf_counter() - decoded, image.nbytes
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Benchmark of full size and reduced (DCT-domain downscaled) JPEG decoding.')
+
+    parser.add_argument('paths', help='JPEG files or directories with JPEG files, like the JPEGImages folder of LaDD.', nargs='+')
+    parser.add_argument('--limit', help='Maximum number of images.', type=int, default=100)
+    parser.add_argument('--repeat', help='Number of measurements per image, the fastest one is used.', type=int, default=3)
+    parser.add_argument('--image-min-side', help='Rescale the image so the smallest side is min_side.', type=int, default=800)
+    parser.add_argument('--image-max-side', help='Rescale the image if the largest side is larger than max_side.', type=int, default=1333)
+
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    # parse arguments
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_args(args)
+
+    paths = image_paths(args.paths, args.limit)
+    if not paths:
+        print('No JPEG images found.', file=sys.stderr)
+        sys.exit(1)
+
+    results = {}
+    for reduced in (False, True):
+        decode_time = preprocess_time = nbytes = 0
+        for path in paths:
+            with open(path, 'rb') as f:
+                data = f.read()
+            samples = [measure(data, reduced, args.image_min_side, args.image_max_side) for _ in range(args.repeat)]
+            decode, preprocess, size = min(samples)
+            decode_time     += decode
+            preprocess_time += preprocess
+            nbytes          += size
+        results[reduced] = (decode_time / len(paths), preprocess_time / len(paths), nbytes / len(paths))
+
+    print('{} images, network input {}/{}'.format(len(paths), args.image_min_side, args.image_max_side))
+    for reduced, name in ((False, 'full decode'), (True, 'reduced decode')):
+        decode, preprocess, size = results[reduced]
+        print('{:15s}: decode {:7.1f} ms | preprocess {:7.1f} ms | decoded image {:7.1f} MB'.format(name, decode * 1000, preprocess * 1000, size / 2 ** 20))
+
+    full, reduced = results[False], results[True]
+    print('reduced decode is {:.1f}x faster end to end and decodes {:.1f} MB less per image'.format(
+        (full[0] + full[1]) / (reduced[0] + reduced[1]), (full[2] - reduced[2]) / 2 ** 20
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -19,6 +19,11 @@ limitations under the License.
 import argparse
 import os
 import sys
+import time
+
+import cv2
+import keras
+import numpy as np
 
 # Allow relative imports when being executed as script.
 if __name__ == "__main__" and __package__ is None:
@@ -29,11 +34,164 @@ if __name__ == "__main__" and __package__ is None:
 # Change these to absolute imports if you copy this script outside the keras_retinanet package.
 from .. import models
 from ..utils.config import read_config_file, parse_anchor_parameters
+from ..utils.engine import create_engine
+from ..utils.export import EXPORT_FORMATS, compare_detections, export_model
 from ..utils.gpu import setup_gpu
+from ..utils.image import preprocess_and_resize, read_image_bgr
+from ..utils.shape_buckets import ShapeBuckets, parse_buckets
 from ..utils.keras_version import check_keras_version
 from ..utils.tf_version import check_tf_version
 
 
+def image_paths(paths, limit=None):
+    """ Lists the images of the given files and directories.
+    """
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                found += [os.path.join(root, name) for name in sorted(names) if name.lower().endswith(('.jpg', '.jpeg', '.png'))]
+        else:
+            found.append(path)
+    return found[:limit] if limit else found
+
+
+def sample_images(paths, args):
+    """ Loads the images the converted models are compared on, a synthetic image of --export-shape without paths.
+    """
+    if paths:
+        return [read_image_bgr(path) for path in paths]
+
+    # smooth content like a photo
+    random = np.random.RandomState(0)
+    height, width = args.export_shape
+    return [cv2.resize(random.randint(0, 256, (height // 8, width // 8, 3)).astype(np.uint8), (width, height), interpolation=cv2.INTER_CUBIC)]
+
+
+def check_inputs(model, images, args, preprocess_mode):
+    """ Prepares the sample images as the converted model takes them, every runtime gets the same inputs.
+    """
+    preprocessed = models.has_preprocessing(model)
+    # a TFLite model or a model with a static shape takes images of its input shape, the Keras model gets them fitted the same way
+    buckets      = ShapeBuckets([args.export_shape]) if 'tflite' in args.export or args.static_shape else None
+    inputs       = []
+    for image in images:
+        if not preprocessed:
+            image, _ = preprocess_and_resize(image, min_side=args.image_min_side, max_side=args.image_max_side, mode=preprocess_mode)
+            if buckets is not None:
+                image, _, _ = buckets.fit(image)
+        inputs.append(np.expand_dims(image, axis=0))
+    return inputs
+
+
+def measure(predict, inputs, repeat):
+    """ Runs predict on every input, returns the outputs and the mean latency of repeat further runs.
+    """
+    outputs = [predict(batch) for batch in inputs]
+    start   = time.perf_counter()
+    for _ in range(repeat):
+        for batch in inputs:
+            predict(batch)
+    return outputs, (time.perf_counter() - start) / (repeat * len(inputs))
+
+
+def check_exports(model, exported, inputs, args):
+    """ Prints how far the detections of the exported models are from those of the Keras model and their latencies.
+    """
+    expected, keras_latency = measure(lambda batch: model.predict_on_batch(batch)[:3], inputs, args.check_repeat)
+    print('{:12s}: {:8.1f} ms'.format('keras', keras_latency * 1000))
+
+    for export_format, path in exported:
+        engine = create_engine(path)
+        try:
+            actual, latency = measure(engine.predict, inputs, args.check_repeat)
+        finally:
+            engine.close()
+        results = [
+            compare_detections([o[0] for o in e], [o[0] for o in a], threshold=args.check_threshold)
+            for e, a in zip(expected, actual)
+        ]
+        print('{:12s}: {:8.1f} ms ({:.2f}x) | {} of {} detections unmatched | min IoU {:.4f} | max score diff {:.2e}'.format(
+            export_format,
+            latency * 1000,
+            keras_latency / latency,
+            sum(r['unmatched'] for r in results),
+            sum(r['detections'] for r in results),
+            min(r['min_iou'] for r in results),
+            max(r['max_score_diff'] for r in results),
+        ))
+
+
+def sample_inputs(paths, args, preprocess):
+    """ Loads the images the static and the dynamic model are compared on, a synthetic image of --export-shape without paths.
+    """
+    images = sample_images(paths, args)
+    return [np.expand_dims(preprocess_and_resize(image, min_side=args.image_min_side, max_side=args.image_max_side, mode=preprocess)[0], axis=0) for image in images]
+
+
+def count_batch_norms(model):
+    """ Counts the BatchNormalization layers of a model, including those of the models nested in it like the backbone.
+    """
+    return sum(
+        count_batch_norms(layer) if isinstance(layer, keras.models.Model) else isinstance(layer, keras.layers.BatchNormalization)
+        for layer in model.layers
+    )
+
+
+def check_folding(model, folded_model, inputs, args):
+    """ Verifies that the converted model with folded batch normalizations detects what the one without does and prints the latency gain.
+
+    Raises
+        ValueError: if a detection is lost or its score changes by more than --fold-tolerance.
+    """
+    expected, latency      = measure(lambda batch: model.predict_on_batch(batch)[:3], inputs, args.check_repeat)
+    actual, folded_latency = measure(lambda batch: folded_model.predict_on_batch(batch)[:3], inputs, args.check_repeat)
+    results                = [
+        compare_detections([o[0] for o in e], [o[0] for o in a], threshold=args.check_threshold)
+        for e, a in zip(expected, actual)
+    ]
+    unmatched  = sum(r['unmatched'] for r in results)
+    difference = max(r['max_score_diff'] for r in results)
+
+    print('batch norm folding: {} of {} BatchNormalization layers folded | {} of {} detections unmatched | max score diff {:.2e} | {:.1f} ms -> {:.1f} ms ({:.2f}x)'.format(
+        count_batch_norms(model) - count_batch_norms(folded_model),
+        count_batch_norms(model),
+        unmatched,
+        sum(r['detections'] for r in results),
+        difference,
+        latency * 1000,
+        folded_latency * 1000,
+        latency / folded_latency,
+    ))
+    if unmatched or difference > args.fold_tolerance:
+        raise ValueError('Folding the batch normalizations lost {} detections and changed the scores by {:.2e}, --fold-tolerance is {:.2e}.'.format(unmatched, difference, args.fold_tolerance))
+
+
+def check_static_shape(model, dynamic_model, inputs, args):
+    """ Prints the latency of the model with a static input shape against the same model with a dynamic one and how far their detections are apart.
+    """
+    buckets                 = ShapeBuckets([args.static_shape])
+    inputs                  = [np.expand_dims(buckets.fit(batch[0])[0], axis=0) for batch in inputs]
+    expected, latency       = measure(lambda batch: dynamic_model.predict_on_batch(batch)[:3], inputs, args.check_repeat)
+    actual, static_latency  = measure(lambda batch: model.predict_on_batch(batch)[:3], inputs, args.check_repeat)
+    results                 = [
+        compare_detections([o[0] for o in e], [o[0] for o in a], threshold=args.check_threshold)
+        for e, a in zip(expected, actual)
+    ]
+
+    print('static shape {}x{}: {:.1f} ms -> {:.1f} ms ({:.2f}x) | {} of {} detections unmatched | min IoU {:.4f} | max score diff {:.2e}'.format(
+        args.static_shape[1],
+        args.static_shape[0],
+        latency * 1000,
+        static_latency * 1000,
+        latency / static_latency,
+        sum(r['unmatched'] for r in results),
+        sum(r['detections'] for r in results),
+        min(r['min_iou'] for r in results),
+        max(r['max_score_diff'] for r in results),
+    ))
+
+
 def parse_args(args):
     parser = argparse.ArgumentParser(description='Script for converting a training model to an inference model.')
 
@@ -43,6 +201,20 @@ def parse_args(args):
     parser.add_argument('--no-nms', help='Disables non maximum suppression.', dest='nms', action='store_false')
     parser.add_argument('--no-class-specific-filter', help='Disables class specific filtering.', dest='class_specific_filter', action='store_false')
     parser.add_argument('--config', help='Path to a configuration parameters .ini file.')
+    parser.add_argument('--preprocess', help='Resize and preprocess images inside the model, which then takes uint8 images of any size and returns boxes in their coordinates.', action='store_true')
+    parser.add_argument('--preprocess-mode', help='Preprocessing of the backbone (defaults to the preprocess_mode of the backbone).', choices=['caffe', 'tf'])
+    parser.add_argument('--image-min-side', help='Rescale the image so the smallest side is min_side (with --preprocess).', type=int, default=800)
+    parser.add_argument('--image-max-side', help='Rescale the image if the largest side is larger than max_side (with --preprocess).', type=int, default=1333)
+    parser.add_argument('--fold-batch-norm', help='Fold the batch normalizations into the convolutions before them, verified on --check-images (or a synthetic image without them).', action='store_true')
+    parser.add_argument('--fold-tolerance', help='Largest score difference of the detections on the checked images after folding the batch normalizations.', type=float, default=1e-3)
+    parser.add_argument('--static-shape', help='WIDTHxHEIGHT of the images the converted model takes, which makes every shape of the graph static and its anchors a constant (also the default --export-shape).', type=lambda spec: parse_buckets(spec)[0])
+    parser.add_argument('--export', help='Also export the converted model to these formats, next to model_out.', nargs='+', choices=EXPORT_FORMATS, default=[])
+    parser.add_argument('--export-shape', help='WIDTHxHEIGHT of the images a TFLite model takes (defaults to LaDD photos resized for the network).', type=lambda spec: parse_buckets(spec)[0], default='1067x800')
+    parser.add_argument('--onnx-opset', help='ONNX opset of the ONNX export.', type=int, default=11)
+    parser.add_argument('--check-images', help='Images or directories of images to compare the detections and latencies of the exported models with the Keras model on, and of the model with folded batch normalizations against the one without and of the model with a static shape against the dynamic one (which use a synthetic image without them).', nargs='+')
+    parser.add_argument('--check-limit', help='Maximum number of images of --check-images.', type=int, default=10)
+    parser.add_argument('--check-threshold', help='Score threshold of the compared detections.', type=float, default=0.3)
+    parser.add_argument('--check-repeat', help='Number of timed runs over the images.', type=int, default=3)
 
     return parser.parse_args(args)
 
@@ -52,6 +224,8 @@ def main(args=None):
     if args is None:
         args = sys.argv[1:]
     args = parse_args(args)
+    if args.static_shape:
+        args.export_shape = args.static_shape
 
     # make sure keras and tensorflow are the minimum required version
     check_keras_version()
@@ -60,6 +234,10 @@ def main(args=None):
     # set modified tf session to avoid using the GPUs
     setup_gpu('cpu')
 
+    # exported graphs are frozen in inference mode
+    if args.export:
+        keras.backend.set_learning_phase(0)
+
     # optionally load config parameters
     anchor_parameters = None
     if args.config:
@@ -74,11 +252,48 @@ def main(args=None):
     models.check_training_model(model)
 
     # convert the model
-    model = models.convert_model(model, nms=args.nms, class_specific_filter=args.class_specific_filter, anchor_params=anchor_parameters)
+    backbone        = models.backbone(args.backbone)
+    preprocess_mode = args.preprocess_mode or backbone.preprocess_mode
+    if args.preprocess and preprocess_mode is None:
+        raise ValueError('In-graph preprocessing of {} backbones is not supported, pass --preprocess-mode to force it.'.format(args.backbone))
+
+    def convert(input_shape=None, fold_batch_norm=False):
+        # folding and a static input shape recreate the model, which needs the custom objects of the backbone
+        with keras.utils.custom_object_scope(backbone.custom_objects):
+            return models.convert_model(
+                model,
+                nms=args.nms,
+                class_specific_filter=args.class_specific_filter,
+                anchor_params=anchor_parameters,
+                preprocess=args.preprocess,
+                image_min_side=args.image_min_side,
+                image_max_side=args.image_max_side,
+                preprocess_mode=preprocess_mode,
+                fold_batch_norm=fold_batch_norm,
+                input_shape=input_shape
+            )
+
+    converted_model = convert(args.static_shape, args.fold_batch_norm)
+    if args.fold_batch_norm:
+        inputs = check_inputs(converted_model, sample_images(image_paths(args.check_images or [], args.check_limit), args), args, preprocess_mode or backbone.preprocess_image)
+        check_folding(convert(args.static_shape), converted_model, inputs, args)
+    if args.static_shape:
+        inputs = sample_inputs(image_paths(args.check_images or [], args.check_limit), args, preprocess_mode or backbone.preprocess_image)
+        check_static_shape(converted_model, convert(None, args.fold_batch_norm), inputs, args)
+    model = converted_model
 
     # save model
     model.save(args.model_out)
 
+    # export it for other runtimes
+    exported = export_model(model, args.model_out, args.export, input_shape=args.export_shape, opset=args.onnx_opset)
+    for export_format, path in exported:
+        print('exported {} model to {}'.format(export_format, path))
+
+    if args.check_images and exported:
+        inputs = check_inputs(model, sample_images(image_paths(args.check_images, args.check_limit), args), args, preprocess_mode or backbone.preprocess_image)
+        check_exports(model, exported, inputs, args)
+
 
 if __name__ == '__main__':
     main()
@@ -17,6 +17,11 @@ limitations under the License.
 import argparse
 import os
 import sys
+from functools import partial
+
+import keras
+import numpy as np
+import tensorflow as tf
 
 # Allow relative imports when being executed as script.
 if __name__ == "__main__" and __package__ is None:
@@ -30,6 +35,8 @@ from ..preprocessing.csv_generator import CSVGenerator
 from ..preprocessing.pascal_voc import PascalVocGenerator
 from ..preprocessing.pascal_voc_grid_crops import PascalVocGridCropsGenerator
 from ..utils.config import read_config_file, parse_anchor_parameters
+from ..utils.cpu import add_cpu_arguments, apply_cpu_config, calibrate_in_subprocess, cpu_config_from_args, data_affinity, model_affinity, parse_cpu_parameters
+from ..utils.engine import ENGINES, create_engine
 from ..utils.eval import evaluate
 from ..utils.gpu import setup_gpu
 from ..utils.keras_version import check_keras_version
@@ -90,6 +97,43 @@ def create_generator(args):
     return validation_generator
 
 
+def load_model(args):
+    """ Loads the model to evaluate, converting it if requested.
+    """
+    # optionally load anchor parameters
+    anchor_params = None
+    if args.config and 'anchor_parameters' in args.config:
+        anchor_params = parse_anchor_parameters(args.config)
+
+    print('Loading model, this may take a second...')
+    model = models.load_model(args.model, backbone_name=args.backbone)
+
+    # optionally convert the model
+    if args.convert_model:
+        model = models.convert_model(model, anchor_params=anchor_params)
+    return model
+
+
+def calibration_setup(args):
+    """ Loads the generator and the model for the CPU calibration, which runs in a forked process.
+    """
+    if args.gpu:
+        setup_gpu(args.gpu)
+    generator    = create_generator(args)
+    model        = load_model(args)
+    preprocessed = models.has_preprocessing(model)
+
+    def load():
+        image = generator.load_image(0)
+        if not preprocessed:
+            image, _ = generator.preprocess_and_resize_image(image)
+            if keras.backend.image_data_format() == 'channels_first':
+                image = image.transpose((2, 0, 1))
+        return np.expand_dims(image, axis=0)
+
+    return load, model.predict_on_batch
+
+
 def parse_args(args):
     """ Parse the arguments.
     """
@@ -123,6 +167,7 @@ def parse_args(args):
     parser.add_argument('model',              help='Path to RetinaNet model.')
     parser.add_argument('--convert-model',    help='Convert the model to an inference model (ie. the input is a training model).', action='store_true')
     parser.add_argument('--backbone',         help='The backbone of the model.', default='resnet50')
+    parser.add_argument('--engine',           help='Inference engines to evaluate one after another, tf, tflite and onnxruntime run the exports of convert_model.py --export next to the model (coco only supports keras).', nargs='+', choices=list(ENGINES), default=['keras'])
     parser.add_argument('--gpu',              help='Id of the GPU to use (as reported by nvidia-smi).')
     parser.add_argument('--score-threshold',  help='Threshold on score to filter detections with (defaults to 0.05).', default=0.05, type=float)
     parser.add_argument('--iou-threshold',    help='IoU Threshold to count for a positive detection (defaults to 0.5).', default=0.5, type=float)
@@ -130,7 +175,9 @@ def parse_args(args):
     parser.add_argument('--save-path',        help='Path for saving images with detections (doesn\'t work for COCO).')
     parser.add_argument('--image-min-side',   help='Rescale the image so the smallest side is min_side.', type=int, default=800)
     parser.add_argument('--image-max-side',   help='Rescale the image if the largest side is larger than max_side.', type=int, default=1333)
-    parser.add_argument('--config',           help='Path to a configuration parameters .ini file (only used with --convert-model).')
+    parser.add_argument('--config',           help='Path to a configuration parameters .ini file (anchors are only used with --convert-model).')
+    parser.add_argument('--data-workers',     help='Number of threads loading images while the model runs (defaults to the data workers of the CPU split, or 0).', type=int, default=0)
+    add_cpu_arguments(parser)
 
     return parser.parse_args(args)
 
@@ -145,10 +192,6 @@ def main(args=None):
     check_keras_version()
     check_tf_version()
 
-    # optionally choose specific GPU
-    if args.gpu:
-        setup_gpu(args.gpu)
-
     # make save path if it doesn't exist
     if args.save_path is not None and not os.path.exists(args.save_path):
         os.makedirs(args.save_path)
@@ -157,38 +200,63 @@ def main(args=None):
     if args.config:
         args.config = read_config_file(args.config)
 
-    # create the generator
-    generator = create_generator(args)
-
-    # optionally load anchor parameters
-    anchor_params = None
-    if args.config and 'anchor_parameters' in args.config:
-        anchor_params = parse_anchor_parameters(args.config)
-
-    # load the model
-    print('Loading model, this may take a second...')
-    model = models.load_model(args.model, backbone_name=args.backbone)
+    # optionally split the cores between image loading and tensorflow, before any session exists
+    cpu = cpu_config_from_args(
+        args,
+        parse_cpu_parameters(args.config) if args.config and 'cpu' in args.config else None,
+        data_workers=args.data_workers,
+        calibrate=partial(calibrate_in_subprocess, partial(calibration_setup, args))
+    )
+    if cpu is not None:
+        args.data_workers = cpu.data_workers
 
-    # optionally convert the model
-    if args.convert_model:
-        model = models.convert_model(model, anchor_params=anchor_params)
+    # optionally choose specific GPU
+    with model_affinity(cpu):
+        # the first session of the process sizes the tensorflow thread pools
+        session_config = apply_cpu_config(cpu) if cpu is not None else None
+        if args.gpu:
+            setup_gpu(args.gpu, session_config)
+        if session_config is not None:
+            keras.backend.set_session(tf.Session(config=session_config))
 
-    # print model summary
-    # print(model.summary())
+    # create the generator
+    generator = create_generator(args)
 
     # start evaluation
     if args.dataset_type == 'coco':
         from ..utils.coco_eval import evaluate_coco
-        evaluate_coco(generator, model, args.score_threshold)
-    else:
-        average_precisions, inference_time = evaluate(
-            generator,
-            model,
-            iou_threshold=args.iou_threshold,
-            score_threshold=args.score_threshold,
-            max_detections=args.max_detections,
-            save_path=args.save_path
-        )
+        evaluate_coco(generator, load_model(args), args.score_threshold)
+        return
+
+    results = []
+    for engine in args.engine:
+        if engine == 'keras':
+            model = load_model(args)
+        else:
+            # the threads of the runtime run on the model cores
+            with model_affinity(cpu):
+                model = create_engine(
+                    args.model,
+                    engine,
+                    backbone_name=args.backbone,
+                    config=session_config,
+                    threads=session_config.intra_op_parallelism_threads if session_config is not None else 0
+                )
+        print('Evaluating with the {} engine'.format(engine))
+
+        # the loading threads are started within and inherit the data cores
+        with data_affinity(cpu):
+            average_precisions, inference_time = evaluate(
+                generator,
+                model,
+                iou_threshold=args.iou_threshold,
+                score_threshold=args.score_threshold,
+                max_detections=args.max_detections,
+                save_path=args.save_path,
+                workers=args.data_workers
+            )
+        if engine != 'keras':
+            model.close()
 
         # print evaluation
         total_instances = []
@@ -205,9 +273,15 @@ def main(args=None):
 
         print('Inference time for {:.0f} images: {:.4f}'.format(generator.size(), inference_time))
 
+        mean_ap = sum(precisions) / sum(x > 0 for x in total_instances)
         print('mAP using the weighted average of precisions among classes: {:.4f}'.format(sum([a * b for a, b in zip(total_instances, precisions)]) / sum(total_instances)))
-        print('mAP: {:.4f}'.format(sum(precisions) / sum(x > 0 for x in total_instances)))
+        print('mAP: {:.4f}'.format(mean_ap))
+        results.append((engine, mean_ap, inference_time))
 
+    if len(results) > 1:
+        print('{:12s} | {:>6s} | {:>10s} | {:>7s}'.format('engine', 'mAP', 'latency', 'speedup'))
+        for engine, mean_ap, inference_time in results:
+            print('{:12s} | {:6.4f} | {:7.1f} ms | {:6.2f}x'.format(engine, mean_ap, inference_time * 1000, results[0][2] / inference_time))
 
 if __name__ == '__main__':
     main()
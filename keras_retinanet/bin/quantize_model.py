@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import argparse
+import os
+import sys
+import tempfile
+
+import keras
+
+# Allow relative imports when being executed as script.
+if __name__ == "__main__" and __package__ is None:
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+    import keras_retinanet.bin  # noqa: F401
+    __package__ = "keras_retinanet.bin"
+
+# Change these to absolute imports if you copy this script outside the keras_retinanet package.
+from .. import models
+from ..preprocessing.pascal_voc import PascalVocGenerator
+from ..utils.engine import create_engine, export_path, model_size_bytes
+from ..utils.eval import evaluate
+from ..utils.export import export_model
+from ..utils.gpu import setup_gpu
+from ..utils.keras_version import check_keras_version
+from ..utils.quantization import QUANTIZATION_FORMATS, calibration_images, move_exported, quantize_onnx, quantize_tflite, quantized_path
+from ..utils.shape_buckets import parse_buckets
+from ..utils.tf_version import check_tf_version
+
+
+def mean_average_precision(average_precisions):
+    """ Returns the mAP of the classes with test instances, like evaluate.py.
+    """
+    precisions = [average_precision for average_precision, num_annotations in average_precisions.values() if num_annotations > 0]
+    return sum(precisions) / len(precisions) if precisions else 0.0
+
+
+def evaluate_export(path, generator, args):
+    """ Evaluates an exported model, returns its mAP and mean inference time per image.
+    """
+    engine = create_engine(path)
+    try:
+        average_precisions, inference_time = evaluate(
+            generator,
+            engine,
+            iou_threshold=args.iou_threshold,
+            score_threshold=args.score_threshold,
+            max_detections=args.max_detections
+        )
+    finally:
+        engine.close()
+    return mean_average_precision(average_precisions), inference_time
+
+
+def parse_args(args):
+    parser = argparse.ArgumentParser(description='Script for int8 post-training quantization of a converted model, which is only written if it stays accurate.')
+
+    parser.add_argument('model', help='The converted model to quantize (see convert_model.py).')
+    parser.add_argument('pascal_path', help='Path to the LaDD dataset directory (Pascal VOC layout) to calibrate and evaluate on.')
+    parser.add_argument('--backbone', help='The backbone of the model.', default='resnet50')
+    parser.add_argument('--formats', help='Runtimes to quantize the model for.', nargs='+', choices=QUANTIZATION_FORMATS, default=['tflite'])
+    parser.add_argument('--calibration-set', help='Image set the activation ranges are calibrated on.', default='trainval')
+    parser.add_argument('--calibration-images', help='Number of images drawn from the calibration set.', type=int, default=100)
+    parser.add_argument('--seed', help='Seed of the drawn calibration images.', type=int, default=0)
+    parser.add_argument('--evaluation-set', help='Image set the float and the int8 models are evaluated on.', default='test')
+    parser.add_argument('--max-map-drop', help='Largest mAP loss of the int8 model against the float model of the same runtime, larger losses keep the int8 model from being written.', type=float, default=0.01)
+    parser.add_argument('--export-shape', help='WIDTHxHEIGHT of the images a TFLite model takes (defaults to LaDD photos resized for the network).', type=lambda spec: parse_buckets(spec)[0], default='1067x800')
+    parser.add_argument('--onnx-opset', help='ONNX opset of the ONNX export.', type=int, default=11)
+    parser.add_argument('--image-min-side', help='Rescale the image so the smallest side is min_side.', type=int, default=800)
+    parser.add_argument('--image-max-side', help='Rescale the image if the largest side is larger than max_side.', type=int, default=1333)
+    parser.add_argument('--score-threshold', help='Threshold on score to filter detections with (defaults to 0.05).', default=0.05, type=float)
+    parser.add_argument('--iou-threshold', help='IoU Threshold to count for a positive detection (defaults to 0.5).', default=0.5, type=float)
+    parser.add_argument('--max-detections', help='Max Detections per image (defaults to 100).', default=100, type=int)
+
+    return parser.parse_args(args)
+
+
+def main(args=None):
+    # parse arguments
+    if args is None:
+        args = sys.argv[1:]
+    args = parse_args(args)
+
+    # make sure keras and tensorflow are the minimum required version
+    check_keras_version()
+    check_tf_version()
+
+    # set modified tf session to avoid using the GPUs, the quantized models are for CPU inference
+    setup_gpu('cpu')
+
+    # exported graphs are frozen in inference mode
+    keras.backend.set_learning_phase(0)
+
+    # load the model
+    model = models.load_model(args.model, backbone_name=args.backbone)
+
+    common_args = {
+        'image_min_side' : args.image_min_side,
+        'image_max_side' : args.image_max_side,
+        'shuffle_groups' : False,
+    }
+    calibration_generator = PascalVocGenerator(args.pascal_path, args.calibration_set, **common_args)
+    evaluation_generator  = PascalVocGenerator(args.pascal_path, args.evaluation_set, **common_args)
+
+    images = calibration_images(calibration_generator, args.calibration_images, models.has_preprocessing(model), seed=args.seed)
+    print('calibrating on {} images of {}'.format(len(images), args.calibration_set))
+
+    refused = []
+    with tempfile.TemporaryDirectory() as directory:
+        # the float models of every runtime are the reference of their int8 models
+        float_exports = export_model(
+            model,
+            os.path.join(directory, os.path.basename(args.model)),
+            args.formats,
+            input_shape=args.export_shape,
+            opset=args.onnx_opset
+        )
+
+        for export_format, float_path in float_exports:
+            int8_path = quantized_path(float_path)
+            if export_format == 'tflite':
+                quantize_tflite(model, int8_path, args.export_shape, images)
+            else:
+                quantize_onnx(float_path, int8_path, images)
+
+            float_map, float_latency = evaluate_export(float_path, evaluation_generator, args)
+            int8_map, int8_latency   = evaluate_export(int8_path, evaluation_generator, args)
+            float_size, int8_size    = model_size_bytes(float_path), model_size_bytes(int8_path)
+
+            print('{:8s}: float mAP {:.4f}, {:.1f} ms, {:.1f} MB | int8 mAP {:.4f}, {:.1f} ms, {:.1f} MB | {:.2f}x faster, {:.2f}x smaller'.format(
+                export_format,
+                float_map, float_latency * 1000, float_size / 2 ** 20,
+                int8_map, int8_latency * 1000, int8_size / 2 ** 20,
+                float_latency / int8_latency,
+                float_size / int8_size,
+            ))
+
+            if float_map - int8_map > args.max_map_drop:
+                print('{:8s}: mAP drops by {:.4f}, more than {:.4f}, the int8 model is not written'.format(export_format, float_map - int8_map, args.max_map_drop))
+                refused.append(export_format)
+                continue
+
+            destination = quantized_path(export_path(args.model, export_format))
+            move_exported(int8_path, destination)
+            print('{:8s}: wrote the int8 model to {}'.format(export_format, destination))
+
+    if refused:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -20,6 +20,7 @@ import argparse
 import os
 import sys
 import warnings
+from functools import partial
 
 import keras
 import keras.preprocessing.image
@@ -47,6 +48,8 @@ from ..preprocessing.pascal_voc_grid_crops import PascalVocGridCropsGenerator
 from ..utils.anchors import make_shapes_callback
 from ..utils.config import read_config_file, parse_anchor_parameters, parse_random_transform_parameters, \
     parse_visual_effect_parameters
+from ..utils.cpu import add_cpu_arguments, apply_cpu_config, calibrate_in_subprocess, cpu_config_from_args, data_affinity, model_affinity, \
+    parse_cpu_parameters
 from ..utils.gpu import setup_gpu
 from ..utils.keras_version import check_keras_version
 from ..utils.model import freeze as freeze_model
@@ -403,6 +406,24 @@ def create_generators(args, preprocess_image):
     return train_generator, validation_generator
 
 
+def calibration_setup(args, backbone):
+    """ Creates the training generator and a model with random weights for the CPU calibration.
+
+    Runs in the forked calibration process, the model is not trained so its weights do not matter.
+    """
+    if args.gpu:
+        setup_gpu(args.gpu)
+    train_generator, _ = create_generators(args, backbone.preprocess_image)
+    _, training_model, _ = create_models(
+        backbone_retinanet=backbone.retinanet,
+        num_classes=train_generator.num_classes(),
+        weights=None,
+        freeze_backbone=args.freeze_backbone,
+        config=args.config
+    )
+    return (lambda: train_generator[0]), (lambda batch: training_model.predict_on_batch(batch[0]))
+
+
 def check_args(parsed_args):
     """ Function to check for inherent contradictions within parsed arguments.
     For example, batch_size < num_gpus
@@ -536,13 +557,15 @@ def parse_args(args):
 
     # Fit generator arguments
     parser.add_argument('--multiprocessing', help='Use multiprocessing in fit_generator.', action='store_true')
-    parser.add_argument('--workers', help='Number of generator workers.', type=int, default=1)
+    parser.add_argument('--workers', help='Number of generator workers (defaults to the data workers of the CPU split, or 1).', type=int, default=0)
     parser.add_argument('--max-queue-size', help='Queue length for multiprocessing workers in fit_generator.', type=int,
                         default=10)
 
     # Finetuning arguments
     parser.add_argument('--silent', help='Do not print training progress.', action='store_false')
 
+    add_cpu_arguments(parser)
+
     return check_args(parser.parse_args(args))
 
 
@@ -559,14 +582,30 @@ def main(args=None):
     check_keras_version()
     check_tf_version()
 
-    # optionally choose specific GPU
-    if args.gpu:
-        setup_gpu(args.gpu)
-
     # optionally load config parameters
     if args.config:
         args.config = read_config_file(args.config)
 
+    # optionally split the cores between the generator workers and tensorflow, before any session exists
+    cpu = cpu_config_from_args(
+        args,
+        parse_cpu_parameters(args.config) if args.config and 'cpu' in args.config else None,
+        data_workers=args.workers,
+        # a training step costs about three forward passes
+        calibrate=partial(calibrate_in_subprocess, partial(calibration_setup, args, backbone), run_cost=3)
+    )
+    if cpu is not None:
+        args.workers = cpu.data_workers
+
+    # optionally choose specific GPU
+    with model_affinity(cpu):
+        # the first session of the process sizes the tensorflow thread pools
+        session_config = apply_cpu_config(cpu) if cpu is not None else None
+        if args.gpu:
+            setup_gpu(args.gpu, session_config)
+        if session_config is not None:
+            keras.backend.set_session(tf.Session(config=session_config))
+
     # create the generators
     train_generator, validation_generator = create_generators(args, backbone.preprocess_image)
 
@@ -622,19 +661,20 @@ def main(args=None):
     if not args.compute_val_loss:
         validation_generator = None
 
-    # start training
-    return training_model.fit_generator(
-        generator=train_generator,
-        steps_per_epoch=args.steps,
-        epochs=args.epochs,
-        verbose=int(args.silent),
-        callbacks=callbacks,
-        workers=args.workers,
-        use_multiprocessing=args.multiprocessing,
-        max_queue_size=args.max_queue_size,
-        validation_data=validation_generator,
-        initial_epoch=args.initial_epoch
-    )
+    # start training, the generator workers are started within and inherit the data cores
+    with data_affinity(cpu):
+        return training_model.fit_generator(
+            generator=train_generator,
+            steps_per_epoch=args.steps,
+            epochs=args.epochs,
+            verbose=int(args.silent),
+            callbacks=callbacks,
+            workers=args.workers or 1,
+            use_multiprocessing=args.multiprocessing,
+            max_queue_size=args.max_queue_size,
+            validation_data=validation_generator,
+            initial_epoch=args.initial_epoch
+        )
 
 
 if __name__ == '__main__':
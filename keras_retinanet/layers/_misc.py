@@ -23,6 +23,9 @@ import numpy as np
 
 class Anchors(keras.layers.Layer):
     """ Keras layer for generating achors for a given shape.
+
+    Features of a static shape (a model with a static input shape) get the anchors as a constant instead of shifting
+    and tiling them on every call, of shape (1, N, 4) which the batch shares by broadcasting if the batch size is unknown.
     """
 
     def __init__(self, size, stride, ratios=None, scales=None, *args, **kwargs):
@@ -59,6 +62,14 @@ class Anchors(keras.layers.Layer):
 
     def call(self, inputs, **kwargs):
         features = inputs
+        static_shape = keras.backend.int_shape(features)
+        spatial      = static_shape[2:4] if keras.backend.image_data_format() == 'channels_first' else static_shape[1:3]
+        if None not in spatial:
+            anchors = np.expand_dims(self.static_anchors(spatial), axis=0)
+            if static_shape[0] is not None:
+                anchors = np.tile(anchors, (static_shape[0], 1, 1))
+            return keras.backend.constant(anchors)
+
         features_shape = keras.backend.shape(features)
 
         # generate proposals from bbox deltas and shifted anchors
@@ -70,6 +81,12 @@ class Anchors(keras.layers.Layer):
 
         return anchors
 
+    def static_anchors(self, shape):
+        """ Returns the anchors of a (height, width) feature map as np.array of shape (N, 4), like call.
+        """
+        anchors = utils_anchors.generate_anchors(base_size=self.size, ratios=self.ratios, scales=self.scales)
+        return utils_anchors.shift(shape, self.stride, anchors).astype(keras.backend.floatx())
+
     def compute_output_shape(self, input_shape):
         if None not in input_shape[1:]:
             if keras.backend.image_data_format() == 'channels_first':
@@ -150,7 +167,8 @@ class RegressBoxes(keras.layers.Layer):
         return backend.bbox_transform_inv(anchors, regression, mean=self.mean, std=self.std)
 
     def compute_output_shape(self, input_shape):
-        return input_shape[0]
+        # constant anchors are shared by the batch, the batch size is that of the regression
+        return (input_shape[1][0],) + tuple(input_shape[0][1:])
 
     def get_config(self):
         config = super(RegressBoxes, self).get_config()
@@ -183,3 +201,102 @@ class ClipBoxes(keras.layers.Layer):
 
     def compute_output_shape(self, input_shape):
         return input_shape[1]
+
+
+def _resize_scale(image, min_side, max_side):
+    """ Computes the scale of utils.image.compute_resize_scale for a batch of (B, H, W, C) images as a tensor.
+    """
+    shape         = keras.backend.cast(keras.backend.shape(image), keras.backend.floatx())
+    height, width = shape[1], shape[2]
+    return keras.backend.minimum(
+        min_side / keras.backend.minimum(height, width),
+        max_side / keras.backend.maximum(height, width),
+    )
+
+
+class PreprocessImage(keras.layers.Layer):
+    """ Keras layer resizing uint8 BGR images to min_side / max_side and subtracting the mean, like utils.image does in numpy.
+
+    The input is always (B, H, W, 3), the output follows keras.backend.image_data_format().
+    """
+
+    def __init__(self, min_side=800, max_side=1333, mode='caffe', *args, **kwargs):
+        """ Initializer for the PreprocessImage layer.
+
+        Args
+            min_side: The image's min side will be equal to min_side after resizing.
+            max_side: If after resizing the image's max side is above max_side, resize until the max side is equal to max_side.
+            mode: One of "caffe" or "tf", see utils.image.preprocess_image.
+        """
+        if mode not in ('caffe', 'tf'):
+            raise ValueError('Expected mode to be "caffe" or "tf". Received: {}'.format(mode))
+
+        self.min_side = min_side
+        self.max_side = max_side
+        self.mode     = mode
+        super(PreprocessImage, self).__init__(*args, **kwargs)
+
+    def call(self, inputs, **kwargs):
+        image = keras.backend.cast(inputs, keras.backend.floatx())
+        scale = _resize_scale(image, self.min_side, self.max_side)
+        shape = keras.backend.cast(keras.backend.shape(image), keras.backend.floatx())
+        size  = keras.backend.cast(keras.backend.round(shape[1:3] * scale), 'int32')
+
+        # resizing is linear, so it can be done before the mean subtraction
+        image = backend.resize_images(image, size, method='bilinear')
+        if self.mode == 'tf':
+            image = image / 127.5 - 1.
+        else:
+            image = image - keras.backend.constant([103.939, 116.779, 123.68], dtype=keras.backend.floatx())
+
+        if keras.backend.image_data_format() == 'channels_first':
+            image = backend.transpose(image, (0, 3, 1, 2))
+        return image
+
+    def compute_output_shape(self, input_shape):
+        if keras.backend.image_data_format() == 'channels_first':
+            return (input_shape[0], input_shape[3], None, None)
+        return (input_shape[0], None, None, input_shape[3])
+
+    def get_config(self):
+        config = super(PreprocessImage, self).get_config()
+        config.update({
+            'min_side' : self.min_side,
+            'max_side' : self.max_side,
+            'mode'     : self.mode,
+        })
+
+        return config
+
+
+class RescaleBoxes(keras.layers.Layer):
+    """ Keras layer mapping boxes on an image resized by PreprocessImage back to the original image.
+    """
+
+    def __init__(self, min_side=800, max_side=1333, *args, **kwargs):
+        """ Initializer for the RescaleBoxes layer.
+
+        Args
+            min_side: The min_side of the PreprocessImage layer.
+            max_side: The max_side of the PreprocessImage layer.
+        """
+        self.min_side = min_side
+        self.max_side = max_side
+        super(RescaleBoxes, self).__init__(*args, **kwargs)
+
+    def call(self, inputs, **kwargs):
+        image, boxes = inputs
+        scale = _resize_scale(image, self.min_side, self.max_side)
+        return boxes / scale
+
+    def compute_output_shape(self, input_shape):
+        return input_shape[1]
+
+    def get_config(self):
+        config = super(RescaleBoxes, self).get_config()
+        config.update({
+            'min_side' : self.min_side,
+            'max_side' : self.max_side,
+        })
+
+        return config
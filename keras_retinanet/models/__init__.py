@@ -5,6 +5,9 @@ import sys
 class Backbone(object):
     """ This class stores additional information on backbones.
     """
+    # mode of utils.image.preprocess_image used by preprocess_image, None if the backbone preprocesses differently
+    preprocess_mode = None
+
     def __init__(self, backbone):
         # a dictionary mapping custom layer names to the correct classes
         from .. import layers
@@ -17,6 +20,8 @@ class Backbone(object):
             'FilterDetections' : layers.FilterDetections,
             'Anchors'          : layers.Anchors,
             'ClipBoxes'        : layers.ClipBoxes,
+            'PreprocessImage'  : layers.PreprocessImage,
+            'RescaleBoxes'     : layers.RescaleBoxes,
             '_smooth_l1'       : losses.smooth_l1(),
             '_focal'           : losses.focal(),
         }
@@ -71,6 +76,29 @@ def backbone(backbone_name):
     return b(backbone_name)
 
 
+# preprocess_image modes of the backbones using utils.image.preprocess_image, matched like in backbone
+# but known without importing the backbone (and keras), so exported models can be served without it
+_PREPROCESS_MODES = [
+    ('resnet', 'caffe'),
+    ('mobilenet', 'tf'),
+    ('vgg', 'caffe'),
+    ('densenet', 'tf'),
+]
+
+
+def backbone_preprocessing(backbone_name):
+    """ Returns how images are preprocessed for a backbone.
+
+    Returns
+        The preprocess_image mode ("caffe" or "tf") of the backbone, or its preprocess_image method if it preprocesses differently.
+        Either can be passed as mode to utils.image.preprocess_and_resize.
+    """
+    for name, mode in _PREPROCESS_MODES:
+        if name in backbone_name:
+            return mode
+    return backbone(backbone_name).preprocess_image
+
+
 def load_model(filepath, backbone_name='resnet50'):
     """ Loads a retinanet model using the correct custom objects.
 
@@ -91,7 +119,80 @@ def load_model(filepath, backbone_name='resnet50'):
     return keras.models.load_model(filepath, custom_objects=backbone(backbone_name).custom_objects)
 
 
-def convert_model(model, nms=True, class_specific_filter=True, anchor_params=None):
+def read_model_weights(filepath):
+    """ Reads the architecture and weights of a saved model without creating it in a session.
+
+    This only uses h5py, so it is safe to call before forking worker processes.
+
+    Args
+        filepath: Path to a model saved with model.save().
+
+    Returns
+        A tuple (model_config, weights) where model_config is the JSON architecture and
+        weights is an OrderedDict mapping layer names to lists of np.arrays.
+    """
+    import collections
+    import h5py
+    import numpy as np
+
+    def _decode(value):
+        return value.decode('utf8') if isinstance(value, bytes) else value
+
+    with h5py.File(filepath, mode='r') as f:
+        if 'model_config' not in f.attrs:
+            raise ValueError('No model found in config file: {}'.format(filepath))
+        model_config = _decode(f.attrs['model_config'])
+
+        group   = f['model_weights'] if 'model_weights' in f else f
+        weights = collections.OrderedDict()
+        for layer_name in group.attrs['layer_names']:
+            layer_name  = _decode(layer_name)
+            layer_group = group[layer_name]
+            weights[layer_name] = [np.asarray(layer_group[_decode(name)]) for name in layer_group.attrs['weight_names']]
+
+    return model_config, weights
+
+
+def model_from_weights(model_config, weights, backbone_name='resnet50'):
+    """ Creates a retinanet model from the output of read_model_weights.
+
+    Args
+        model_config  : The JSON architecture of the model.
+        weights       : OrderedDict mapping layer names to lists of np.arrays.
+        backbone_name : Backbone with which the model was trained.
+
+    Returns
+        A keras.models.Model object.
+    """
+    import keras.backend
+    import keras.models
+
+    model = keras.models.model_from_json(model_config, custom_objects=backbone(backbone_name).custom_objects)
+
+    weight_value_tuples = []
+    for layer in model.layers:
+        if layer.name not in weights:
+            continue
+        # same order as used by keras when saving the weights
+        symbolic_weights = layer.trainable_weights + layer.non_trainable_weights
+        weight_value_tuples += zip(symbolic_weights, weights[layer.name])
+    keras.backend.batch_set_value(weight_value_tuples)
+
+    return model
+
+
+def convert_model(
+    model,
+    nms                   = True,
+    class_specific_filter = True,
+    anchor_params         = None,
+    preprocess            = False,
+    image_min_side        = 800,
+    image_max_side        = 1333,
+    preprocess_mode       = 'caffe',
+    fold_batch_norm       = False,
+    input_shape           = None,
+):
     """ Converts a training model to an inference model.
 
     Args
@@ -99,6 +200,13 @@ def convert_model(model, nms=True, class_specific_filter=True, anchor_params=Non
         nms                   : Boolean, whether to add NMS filtering to the converted model.
         class_specific_filter : Whether to use class specific filtering or filter for the best scoring class only.
         anchor_params         : Anchor parameters object. If omitted, default values are used.
+        preprocess            : Whether to resize and preprocess the images inside the model.
+                                The model then takes uint8 BGR images of any size and returns boxes in their coordinates.
+        image_min_side        : Resizing parameter of the in-graph preprocessing, see utils.image.resize_image.
+        image_max_side        : Resizing parameter of the in-graph preprocessing, see utils.image.resize_image.
+        preprocess_mode       : One of "caffe" or "tf", the mode of the backbone's preprocess_image.
+        fold_batch_norm       : Whether to fold the batch normalizations into the convolutions before them (see utils.fold_batch_norm).
+        input_shape           : Optional static (height, width) of the images the model takes, which bakes the anchors in as a constant.
 
     Returns
         A keras.models.Model object.
@@ -107,8 +215,22 @@ def convert_model(model, nms=True, class_specific_filter=True, anchor_params=Non
         ImportError: if h5py is not available.
         ValueError: In case of an invalid savefile.
     """
-    from .retinanet import retinanet_bbox
-    return retinanet_bbox(model=model, nms=nms, class_specific_filter=class_specific_filter, anchor_params=anchor_params)
+    from .retinanet import retinanet_bbox, retinanet_preprocessed
+    if preprocess and input_shape is not None:
+        raise ValueError('A model with in-graph preprocessing takes images of any size and can not have a static input shape.')
+    if fold_batch_norm:
+        from ..utils.fold_batch_norm import fold_batch_norms
+        model = fold_batch_norms(model)
+    model = retinanet_bbox(model=model, nms=nms, class_specific_filter=class_specific_filter, anchor_params=anchor_params, input_shape=input_shape)
+    if preprocess:
+        model = retinanet_preprocessed(model, image_min_side=image_min_side, image_max_side=image_max_side, preprocess_mode=preprocess_mode)
+    return model
+
+
+def has_preprocessing(model):
+    """ Returns whether a model was converted with preprocess=True, so it takes uint8 images of any size and returns boxes in their coordinates.
+    """
+    return any(layer.name == 'preprocess_image' for layer in model.layers)
 
 
 def assert_training_model(model):
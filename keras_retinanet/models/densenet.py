@@ -33,6 +33,7 @@ allowed_backbones = {
 class DenseNetBackbone(Backbone):
     """ Describes backbone information and provides utility functions.
     """
+    preprocess_mode = 'tf'
 
     def retinanet(self, *args, **kwargs):
         """ Returns a retinanet model using the correct backbone.
@@ -67,7 +68,7 @@ class DenseNetBackbone(Backbone):
     def preprocess_image(self, inputs):
         """ Takes as input an image and prepares it for being passed through the network.
         """
-        return preprocess_image(inputs, mode='tf')
+        return preprocess_image(inputs, mode=self.preprocess_mode)
 
 
 def densenet_retinanet(num_classes, backbone='densenet121', inputs=None, modifier=None, **kwargs):
@@ -26,6 +26,7 @@ from . import Backbone
 class MobileNetBackbone(Backbone):
     """ Describes backbone information and provides utility functions.
     """
+    preprocess_mode = 'tf'
 
     allowed_backbones = ['mobilenet128', 'mobilenet160', 'mobilenet192', 'mobilenet224']
 
@@ -74,7 +75,7 @@ class MobileNetBackbone(Backbone):
     def preprocess_image(self, inputs):
         """ Takes as input an image and prepares it for being passed through the network.
         """
-        return preprocess_image(inputs, mode='tf')
+        return preprocess_image(inputs, mode=self.preprocess_mode)
 
 
 def mobilenet_retinanet(num_classes, backbone='mobilenet224_1.0', inputs=None, modifier=None, **kwargs):
@@ -27,6 +27,7 @@ from ..utils.image import preprocess_image
 class ResNetBackbone(Backbone):
     """ Describes backbone information and provides utility functions.
     """
+    preprocess_mode = 'caffe'
 
     def __init__(self, backbone):
         super(ResNetBackbone, self).__init__(backbone)
@@ -72,7 +73,7 @@ class ResNetBackbone(Backbone):
     def preprocess_image(self, inputs):
         """ Takes as input an image and prepares it for being passed through the network.
         """
-        return preprocess_image(inputs, mode='caffe')
+        return preprocess_image(inputs, mode=self.preprocess_mode)
 
 
 def resnet_retinanet(num_classes, backbone='resnet50', inputs=None, modifier=None, **kwargs):
@@ -18,6 +18,7 @@ import keras
 from .. import initializers
 from .. import layers
 from ..utils.anchors import AnchorParameters
+from ..utils.rebuild import rebuild_model
 from . import assert_training_model
 
 
@@ -284,12 +285,38 @@ def retinanet(
     return keras.models.Model(inputs=inputs, outputs=pyramids, name=name)
 
 
+def static_input_model(model, input_shape, custom_objects=None):
+    """ Recreates a retinanet training model with a static input shape, so every layer has static shapes.
+
+    Args
+        model          : A retinanet training model.
+        input_shape    : (height, width) of the images the model will take.
+        custom_objects : Additional custom objects to recreate the model with.
+
+    Returns
+        A keras.models.Model with the weights of model.
+    """
+    def rewrite(config):
+        for layer_config in config['layers']:
+            if layer_config['class_name'] != 'InputLayer':
+                continue
+            batch_input_shape = list(layer_config['config']['batch_input_shape'])
+            if keras.backend.image_data_format() == 'channels_first':
+                batch_input_shape[2:4] = input_shape
+            else:
+                batch_input_shape[1:3] = input_shape
+            layer_config['config']['batch_input_shape'] = tuple(batch_input_shape)
+
+    return rebuild_model(model, rewrite, custom_objects=custom_objects)
+
+
 def retinanet_bbox(
     model                 = None,
     nms                   = True,
     class_specific_filter = True,
     name                  = 'retinanet-bbox',
     anchor_params         = None,
+    input_shape           = None,
     **kwargs
 ):
     """ Construct a RetinaNet model on top of a backbone and adds convenience functions to output boxes directly.
@@ -303,6 +330,7 @@ def retinanet_bbox(
         class_specific_filter : Whether to use class specific filtering or filter for the best scoring class only.
         name                  : Name of the model.
         anchor_params         : Struct containing anchor parameters. If None, default values are used.
+        input_shape           : Optional static (height, width) of the images, the anchors are then a constant of the graph.
         *kwargs               : Additional kwargs to pass to the minimal retinanet model.
 
     Returns
@@ -326,6 +354,9 @@ def retinanet_bbox(
     else:
         assert_training_model(model)
 
+    if input_shape is not None:
+        model = static_input_model(model, input_shape)
+
     # compute the anchors
     features = [model.get_layer(p_name).output for p_name in ['P3', 'P4', 'P5', 'P6', 'P7']]
     anchors  = __build_anchors(anchor_params, features)
@@ -350,3 +381,43 @@ def retinanet_bbox(
 
     # construct the model
     return keras.models.Model(inputs=model.inputs, outputs=detections, name=name)
+
+
+def retinanet_preprocessed(
+    model,
+    image_min_side  = 800,
+    image_max_side  = 1333,
+    preprocess_mode = 'caffe',
+    name            = 'retinanet-preprocessed',
+):
+    """ Wraps a retinanet_bbox model with the resizing and mean subtraction of utils.image inside the graph.
+
+    The returned model takes a batch of uint8 BGR images of any (equal) size, so callers skip
+    preprocess_image and resize_image, and returns the boxes in the coordinates of those images.
+
+    Args
+        model           : A retinanet_bbox model.
+        image_min_side  : See utils.image.resize_image.
+        image_max_side  : See utils.image.resize_image.
+        preprocess_mode : One of "caffe" or "tf", the mode of the backbone's preprocess_image.
+        name            : Name of the model.
+
+    Returns
+        A keras.models.Model with the same outputs as model.
+    """
+    image = keras.layers.Input(shape=(None, None, 3), dtype='uint8', name='image')
+    x     = layers.PreprocessImage(
+        min_side = image_min_side,
+        max_side = image_max_side,
+        mode     = preprocess_mode,
+        name     = 'preprocess_image'
+    )(image)
+
+    outputs = model(x)
+    boxes   = layers.RescaleBoxes(
+        min_side = image_min_side,
+        max_side = image_max_side,
+        name     = 'rescaled_boxes'
+    )([image, outputs[0]])
+
+    return keras.models.Model(inputs=image, outputs=[boxes] + outputs[1:], name=name)
@@ -26,6 +26,7 @@ from ..utils.image import preprocess_image
 class VGGBackbone(Backbone):
     """ Describes backbone information and provides utility functions.
     """
+    preprocess_mode = 'caffe'
 
     def retinanet(self, *args, **kwargs):
         """ Returns a retinanet model using the correct backbone.
@@ -63,7 +64,7 @@ class VGGBackbone(Backbone):
     def preprocess_image(self, inputs):
         """ Takes as input an image and prepares it for being passed through the network.
         """
-        return preprocess_image(inputs, mode='caffe')
+        return preprocess_image(inputs, mode=self.preprocess_mode)
 
 
 def vgg_retinanet(num_classes, backbone='vgg16', inputs=None, modifier=None, **kwargs):
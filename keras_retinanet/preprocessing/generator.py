@@ -30,6 +30,7 @@ from ..utils.image import (
     TransformParameters,
     adjust_transform_for_image,
     apply_transform,
+    preprocess_and_resize,
     preprocess_image,
     resize_image,
 )
@@ -252,14 +253,21 @@ class Generator(keras.utils.Sequence):
         else:
             return resize_image(image, min_side=self.image_min_side, max_side=self.image_max_side)
 
+    def preprocess_and_resize_image(self, image):
+        """ Resize an image using image_min_side and image_max_side and preprocess it, resizing the uint8 image first.
+        """
+        return preprocess_and_resize(
+            image,
+            min_side=None if self.no_resize else self.image_min_side,
+            max_side=self.image_max_side,
+            mode=self.preprocess_image
+        )
+
     def preprocess_group_entry(self, image, annotations):
         """ Preprocess image and its annotations.
         """
-        # preprocess the image
-        image = self.preprocess_image(image)
-
-        # resize image
-        image, image_scale = self.resize_image(image)
+        # preprocess and resize the image
+        image, image_scale = self.preprocess_and_resize_image(image)
 
         # apply resizing to annotations too
         annotations['bboxes'] *= image_scale
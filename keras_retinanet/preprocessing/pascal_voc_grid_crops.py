@@ -7,7 +7,7 @@ import random
 
 from ..preprocessing.pascal_voc import PascalVocGenerator
 from ..utils.grid_cropper import ImageGridCropper
-from ..utils.image import compute_resize_scale, resize_image
+from ..utils.image import compute_resize_scale, preprocess_and_resize, resize_image
 
 
 class CropReference(NamedTuple):
@@ -123,6 +123,11 @@ class PascalVocGridCropsGenerator(PascalVocGenerator):
         """
         return image, 1
 
+    def preprocess_and_resize_image(self, image):
+        """ Overloads base generator method, only preprocesses as the crops are cut from resized images
+        """
+        return preprocess_and_resize(image, min_side=None, mode=self.preprocess_image)
+
     def load_image(self, image_index):
         """ Overloads base method, loading an crop instead of image with image_index.
         """
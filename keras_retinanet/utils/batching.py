@@ -0,0 +1,280 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import itertools
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+
+import numpy as np
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK        = 1
+
+
+class QueueFullError(RuntimeError):
+    """ Raised when a request is submitted to a scheduler whose queue is full.
+    """
+    pass
+
+
+class DeadlineExceededError(RuntimeError):
+    """ Raised when a request is dropped because its deadline passed before it reached the model.
+    """
+    pass
+
+
+def check_deadline(deadline):
+    """ Raises DeadlineExceededError if deadline (a time.time() timestamp or None for no deadline) has passed.
+    """
+    if deadline is not None and time.time() > deadline:
+        raise DeadlineExceededError('Deadline exceeded by {:.3f} s.'.format(time.time() - deadline))
+
+
+class BatchStatistics(object):
+    """ Thread safe counters describing how well the batches are filled.
+
+    Args
+        max_batch_size: The batch size the scheduler is allowed to reach.
+    """
+
+    def __init__(self, max_batch_size):
+        self.max_batch_size = max_batch_size
+        self._lock          = threading.Lock()
+        self.batches        = 0
+        self.requests       = 0
+        self.rejected       = 0
+        self.expired        = 0
+        self.wait_time      = 0.0
+        self.predict_time   = 0.0
+        self.sizes          = {}
+
+    def record_batch(self, size, wait_time, predict_time):
+        with self._lock:
+            self.batches      += 1
+            self.requests     += size
+            self.wait_time    += wait_time
+            self.predict_time += predict_time
+            self.sizes[size]   = self.sizes.get(size, 0) + 1
+
+    def record_rejected(self):
+        with self._lock:
+            self.rejected += 1
+
+    def record_expired(self):
+        with self._lock:
+            self.expired += 1
+
+    def as_dict(self):
+        """ Returns a snapshot of the statistics as a JSON serializable dict.
+        """
+        with self._lock:
+            batches = max(self.batches, 1)
+            return {
+                'max_batch_size'   : self.max_batch_size,
+                'batches'          : self.batches,
+                'requests'         : self.requests,
+                'rejected'         : self.rejected,
+                'expired'          : self.expired,
+                'mean_batch_size'  : self.requests / batches,
+                'mean_fill'        : self.requests / (batches * self.max_batch_size),
+                'mean_wait_time'   : self.wait_time / max(self.requests, 1),
+                'mean_predict_time': self.predict_time / batches,
+                'batch_sizes'      : {str(size): count for size, count in sorted(self.sizes.items())},
+            }
+
+
+class _Request(object):
+    __slots__ = ('image', 'future', 'enqueued', 'deadline')
+
+    def __init__(self, image, deadline=None):
+        self.image    = image
+        self.future   = Future()
+        self.enqueued = time.time()
+        self.deadline = deadline
+
+
+class BatchScheduler(object):
+    """ Collects single image requests and runs them through the model in batches.
+
+    Requests are collected until either max_batch_size requests are pending or max_wait seconds
+    passed since the first one arrived. The collected requests are grouped by image shape, every
+    group is sent to `predict` as one batch and each caller receives its own slice of the outputs.
+    Pending requests are taken in priority order, so bulk work never delays waiting interactive requests.
+    Requests whose deadline passed while they were waiting are dropped before they reach `predict`.
+
+    Args
+        predict        : Function taking a batch of images (np.array of shape (B, H, W, C)) and returning a list of outputs with batch size B.
+        max_batch_size : Maximum number of images sent to `predict` at once.
+        max_wait       : Maximum time (in seconds) to wait for a batch to fill up.
+        max_queue_size : Maximum number of pending requests, further requests are rejected with QueueFullError.
+    """
+
+    def __init__(self, predict, max_batch_size=8, max_wait=0.005, max_queue_size=64):
+        if max_batch_size < 1:
+            raise ValueError('max_batch_size should be at least 1, received: {}'.format(max_batch_size))
+
+        self.predict        = predict
+        self.max_batch_size = max_batch_size
+        self.max_wait       = max_wait
+        self.statistics     = BatchStatistics(max_batch_size)
+
+        self._queue   = queue.PriorityQueue(maxsize=max_queue_size)
+        self._counter = itertools.count()
+        self._thread  = None
+        self._running = False
+
+    def start(self):
+        """ Starts the background thread which runs the batches.
+        """
+        if self._thread is not None:
+            return self
+        self._running = True
+        self._thread  = threading.Thread(target=self._run, name='batch-scheduler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """ Stops the background thread after the pending requests are processed.
+        """
+        if self._thread is None:
+            return
+        self._running = False
+        # the sentinel sorts after every request, so pending requests are still processed
+        self._queue.put((sys.maxsize, next(self._counter), None))
+        self._thread.join()
+        self._thread = None
+
+    def queue_size(self):
+        return self._queue.qsize()
+
+    def submit(self, image, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """ Queues a single preprocessed image.
+
+        Args
+            image    : np.array of shape (H, W, C).
+            priority : Requests with a lower value are run first (PRIORITY_INTERACTIVE or PRIORITY_BULK).
+            deadline : Optional time.time() timestamp, if the image is not sent to the model before it the
+                       future fails with DeadlineExceededError.
+
+        Returns
+            A concurrent.futures.Future resolving to the list of outputs for this image (each with batch size 1).
+
+        Raises
+            QueueFullError: if max_queue_size requests are already pending.
+            DeadlineExceededError: if the deadline already passed.
+        """
+        try:
+            check_deadline(deadline)
+        except DeadlineExceededError:
+            self.statistics.record_expired()
+            raise
+
+        request = _Request(image, deadline)
+        try:
+            self._queue.put_nowait((priority, next(self._counter), request))
+        except queue.Full:
+            self.statistics.record_rejected()
+            raise QueueFullError('Batch queue is full ({} pending requests).'.format(self._queue.maxsize))
+        return request.future
+
+    def predict_on_image(self, image, timeout=None, priority=PRIORITY_INTERACTIVE, deadline=None):
+        """ Blocking version of submit, returns the outputs of the model for a single image.
+        """
+        return self.submit(image, priority=priority, deadline=deadline).result(timeout=timeout)
+
+    def _drop_expired(self, request):
+        """ Fails a request whose deadline passed, returns True if it was dropped.
+        """
+        try:
+            check_deadline(request.deadline)
+        except DeadlineExceededError as e:
+            self.statistics.record_expired()
+            request.future.set_exception(e)
+            return True
+        return False
+
+    def _collect(self):
+        """ Blocks until at least one request is available and collects a batch of requests.
+        """
+        requests = []
+        deadline = None
+        while len(requests) < self.max_batch_size:
+            if not requests:
+                _, _, request = self._queue.get()
+                if request is None:
+                    return []
+            else:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    _, _, request = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if request is None:
+                    # keep the sentinel for the main loop
+                    self._running = False
+                    break
+
+            # expired requests do not count towards the batch
+            if self._drop_expired(request):
+                continue
+            if deadline is None:
+                deadline = time.time() + self.max_wait
+            requests.append(request)
+
+        return requests
+
+    def _run_group(self, requests):
+        # requests may have expired while the batch filled up
+        requests = [r for r in requests if not self._drop_expired(r)]
+        if not requests:
+            return
+
+        start = time.time()
+        try:
+            batch   = np.stack([r.image for r in requests], axis=0)
+            outputs = self.predict(batch)
+        except Exception as e:
+            for r in requests:
+                r.future.set_exception(e)
+            return
+
+        end       = time.time()
+        wait_time = sum(start - r.enqueued for r in requests)
+        self.statistics.record_batch(len(requests), wait_time, end - start)
+
+        for i, r in enumerate(requests):
+            r.future.set_result([output[i:i + 1] for output in outputs])
+
+    def _run(self):
+        while self._running or not self._queue.empty():
+            requests = self._collect()
+
+            # images with a different shape can not be stacked, so run them as separate batches
+            groups = OrderedDict()
+            for r in requests:
+                groups.setdefault(r.image.shape, []).append(r)
+
+            for group in groups.values():
+                self._run_group(group)
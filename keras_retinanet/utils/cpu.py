@@ -0,0 +1,341 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import multiprocessing
+import os
+import time
+import traceback
+from collections import namedtuple
+from contextlib import contextmanager
+
+import cv2
+
+DEFAULT_DATA_FRACTION = 0.25
+
+CpuConfig = namedtuple('CpuConfig', [
+    'data_workers',
+    'opencv_threads',
+    'intra_op_threads',
+    'inter_op_threads',
+    'data_cores',
+    'model_cores',
+    'pin',
+])
+
+
+def available_cores():
+    """ Returns the sorted list of cores this process is allowed to run on.
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def split_cores(num_parts, cores=None):
+    """ Splits cores into num_parts contiguous, nearly equal sets.
+
+    If there are less cores than parts, every part gets a single core and cores are shared.
+
+    Args
+        num_parts : Number of core sets to create.
+        cores     : List of cores to split (defaults to available_cores()).
+
+    Returns
+        A list of num_parts lists of cores.
+    """
+    if cores is None:
+        cores = available_cores()
+    if num_parts < 1:
+        raise ValueError('num_parts should be at least 1, received: {}'.format(num_parts))
+
+    if len(cores) < num_parts:
+        return [[cores[i % len(cores)]] for i in range(num_parts)]
+
+    size, remainder = divmod(len(cores), num_parts)
+    parts = []
+    start = 0
+    for i in range(num_parts):
+        end = start + size + (1 if i < remainder else 0)
+        parts.append(list(cores[start:end]))
+        start = end
+    return parts
+
+
+def pin_to_cores(cores):
+    """ Restricts the current process (and threads created afterwards) to the given cores.
+
+    Returns
+        True if the affinity was set, False if the platform does not support it.
+    """
+    if not hasattr(os, 'sched_setaffinity'):
+        return False
+    os.sched_setaffinity(0, cores)
+    return True
+
+
+def session_config(intra_op_threads=0, inter_op_threads=0, allow_growth=True):
+    """ Creates a tf.ConfigProto with the given thread pool sizes (0 lets TensorFlow decide).
+    """
+    import tensorflow as tf
+
+    config = tf.ConfigProto(
+        intra_op_parallelism_threads=intra_op_threads,
+        inter_op_parallelism_threads=inter_op_threads,
+    )
+    config.gpu_options.allow_growth = allow_growth
+    return config
+
+
+def plan_cpu(data_fraction=DEFAULT_DATA_FRACTION, cores=None, data_workers=0, opencv_threads=0, intra_op_threads=0, inter_op_threads=0, pin=False):
+    """ Splits cores between data loading (decoding, augmentation) and the TensorFlow thread pools of the model.
+
+    Settings left at 0 are derived from the split, so the data workers, their OpenCV threads and the TensorFlow
+    pools together use every core once instead of each of them assuming it has the whole machine.
+
+    Args
+        data_fraction    : Fraction of the cores used for data loading, both sides get at least one core.
+        cores            : List of cores to split (defaults to available_cores()).
+        data_workers     : Number of data loading workers (defaults to one per data core).
+        opencv_threads   : Threads of OpenCV in every data worker (defaults to the data cores per worker).
+        intra_op_threads : TensorFlow intra-op threads (defaults to the number of model cores).
+        inter_op_threads : TensorFlow inter-op threads (defaults to 1, or 2 with at least 8 model cores).
+        pin              : Whether data loading and the model are pinned to their cores.
+
+    Returns
+        A CpuConfig.
+    """
+    if cores is None:
+        cores = available_cores()
+    cores = list(cores)
+    if not 0 <= data_fraction <= 1:
+        raise ValueError('data_fraction should be between 0 and 1, received: {}'.format(data_fraction))
+
+    if len(cores) == 1:
+        data_cores = model_cores = cores
+    else:
+        count       = min(max(int(round(len(cores) * data_fraction)), 1), len(cores) - 1)
+        data_cores  = cores[:count]
+        model_cores = cores[count:]
+
+    data_workers = data_workers or len(data_cores)
+    return CpuConfig(
+        data_workers=data_workers,
+        # the workers already load images in parallel, OpenCV only gets the cores left over per worker
+        opencv_threads=opencv_threads or max(len(data_cores) // data_workers, 1),
+        intra_op_threads=intra_op_threads or len(model_cores),
+        inter_op_threads=inter_op_threads or (2 if len(model_cores) >= 8 else 1),
+        data_cores=data_cores,
+        model_cores=model_cores,
+        pin=pin,
+    )
+
+
+def _cpu_time(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.process_time()
+        function()
+        times.append(time.process_time() - start)
+    return min(times)
+
+
+def calibrate_data_fraction(load, run, repeat=3, run_cost=1.0):
+    """ Picks the data_fraction of plan_cpu from a short calibration run.
+
+    load() loads one batch on a single core and run(batch) runs the model on it. After a warm up call, the
+    CPU time (of all threads) of each is measured repeat times and the cores are split in proportion to the
+    smallest CPU times, so neither side waits for the other. A model running on a GPU needs little CPU time,
+    which leaves most cores to data loading.
+
+    Args
+        load     : Function returning a batch, like generator[0] or decoding and preprocessing an image.
+        run      : Function running the model on a batch returned by load.
+        repeat   : Number of measured calls of load and run.
+        run_cost : Factor for the CPU time of run, like 3 when run is a forward pass but training also runs the backward pass.
+
+    Returns
+        The fraction of the cores data loading needs.
+    """
+    threads = cv2.getNumThreads()
+    cv2.setNumThreads(1)
+    try:
+        batch     = load()
+        load_time = _cpu_time(load, repeat)
+    finally:
+        cv2.setNumThreads(threads)
+
+    run(batch)
+    run_time = _cpu_time(lambda: run(batch), repeat) * run_cost
+    return load_time / max(load_time + run_time, 1e-9)
+
+
+def calibrate_in_subprocess(setup, repeat=3, run_cost=1.0):
+    """ Runs calibrate_data_fraction in a forked process.
+
+    TensorFlow sizes its thread pools once per process, with the first session, so the calibration
+    (which needs a session) has to run before the process creates the session it keeps.
+
+    Args
+        setup : Function called in the forked process, returning the (load, run) functions of the calibration.
+        The other arguments are passed to calibrate_data_fraction.
+
+    Returns
+        The fraction of the cores data loading needs.
+
+    Raises
+        RuntimeError: if the calibration failed.
+    """
+    context = multiprocessing.get_context('fork')
+    receiver, sender = context.Pipe(duplex=False)
+
+    def _calibrate():
+        try:
+            load, run = setup()
+            sender.send(('ok', calibrate_data_fraction(load, run, repeat=repeat, run_cost=run_cost)))
+        except Exception:
+            sender.send(('error', traceback.format_exc()))
+
+    process = context.Process(target=_calibrate, name='cpu-calibration')
+    process.start()
+    # only the child may hold the sending end, so a crashed child ends recv
+    sender.close()
+    try:
+        status, result = receiver.recv()
+    except EOFError:
+        status, result = 'error', 'The calibration process exited with code {}.'.format(process.exitcode)
+    finally:
+        process.join()
+        receiver.close()
+
+    if status == 'error':
+        raise RuntimeError('CPU calibration failed: {}'.format(result))
+    return result
+
+
+@contextmanager
+def pinned(cores):
+    """ Pins the calling thread to cores while the context is active.
+
+    Threads and processes started meanwhile (like the TensorFlow thread pools of a new session or
+    data loading workers) keep the affinity. Nothing is pinned if cores is empty or None.
+    """
+    if not cores or not hasattr(os, 'sched_setaffinity'):
+        yield
+        return
+
+    previous = os.sched_getaffinity(0)
+    os.sched_setaffinity(0, cores)
+    try:
+        yield
+    finally:
+        os.sched_setaffinity(0, previous)
+
+
+def data_affinity(config):
+    """ Pins the calling thread to the data cores of config, if it is a CpuConfig with pinning enabled.
+    """
+    return pinned(config.data_cores if config is not None and config.pin else None)
+
+
+def model_affinity(config):
+    """ Pins the calling thread to the model cores of config, if it is a CpuConfig with pinning enabled.
+    """
+    return pinned(config.model_cores if config is not None and config.pin else None)
+
+
+def apply_cpu_config(config):
+    """ Sets the OpenCV threads of config and returns the tf.ConfigProto of its thread pools.
+
+    The session should be created in model_affinity(config), before any other session of the process.
+    """
+    cv2.setNumThreads(config.opencv_threads)
+    return session_config(config.intra_op_threads, config.inter_op_threads)
+
+
+def add_cpu_arguments(parser):
+    """ Adds the arguments of cpu_config_from_args to an argparse parser.
+    """
+    group = parser.add_argument_group('CPU resources', 'Split of the cores between data loading and the TensorFlow thread pools. '
+                                      'Settings which are not given are read from the [cpu] section of --config or derived from the split.')
+    group.add_argument('--cpu-split', help='Fraction of the cores used for data loading, or auto to measure it with a short calibration run.')
+    group.add_argument('--opencv-threads', help='OpenCV threads in every data loading worker.', type=int, default=0)
+    group.add_argument('--intra-op-threads', help='TensorFlow intra-op threads.', type=int, default=0)
+    group.add_argument('--inter-op-threads', help='TensorFlow inter-op threads.', type=int, default=0)
+    group.add_argument('--pin-cores', help='Pin data loading and the model to their own cores.', action='store_true')
+    return parser
+
+
+def parse_cpu_parameters(config):
+    """ Returns the plan_cpu arguments set in the [cpu] section of a configparser config.
+    """
+    section = config['cpu']
+    kwargs = dict()
+    if 'split' in section:
+        split = section['split'].strip()
+        kwargs['data_fraction'] = split if split == 'auto' else float(split)
+    for key in ('data_workers', 'opencv_threads', 'intra_op_threads', 'inter_op_threads'):
+        if key in section:
+            kwargs[key] = int(section[key])
+    if 'pin' in section:
+        kwargs['pin'] = section.getboolean('pin')
+
+    return kwargs
+
+
+def cpu_config_from_args(args, parameters=None, data_workers=0, calibrate=None):
+    """ Creates the CpuConfig of the arguments added by add_cpu_arguments.
+
+    Args
+        args         : Parsed arguments, they take precedence over parameters.
+        parameters   : Optional dict of plan_cpu arguments (like the output of parse_cpu_parameters), data_fraction may be 'auto'.
+        data_workers : Number of data loading workers given on the command line, 0 if not given. It is used by a plan,
+                       but does not create one on its own.
+        calibrate    : Function returning the data fraction for 'auto', like a partial of calibrate_in_subprocess.
+
+    Returns
+        A CpuConfig, or None if no CPU setting (thread counts, pinning, split or [cpu] parameters) was given, so the
+        libraries keep their defaults and the caller keeps its worker count.
+    """
+    kwargs = dict(parameters or {})
+    for key in ('opencv_threads', 'intra_op_threads', 'inter_op_threads'):
+        if getattr(args, key):
+            kwargs[key] = getattr(args, key)
+    if args.pin_cores:
+        kwargs['pin'] = True
+    if args.cpu_split is not None:
+        kwargs['data_fraction'] = args.cpu_split
+    # a worker count alone is no CPU setting, it only sizes the data loading of a plan
+    if not kwargs:
+        return None
+    if data_workers:
+        kwargs['data_workers'] = data_workers
+
+    data_fraction = kwargs.pop('data_fraction', DEFAULT_DATA_FRACTION)
+    if data_fraction == 'auto':
+        if calibrate is None:
+            raise ValueError('Calibration of the CPU split is not supported here.')
+        data_fraction = calibrate()
+        print('calibrated CPU split: {:.2f} of the cores for data loading'.format(data_fraction))
+
+    config = plan_cpu(float(data_fraction), **kwargs)
+    print('CPU: {} data workers with {} OpenCV threads on cores {}, {} intra-op and {} inter-op threads on cores {}{}'.format(
+        config.data_workers, config.opencv_threads, config.data_cores,
+        config.intra_op_threads, config.inter_op_threads, config.model_cores,
+        ' (pinned)' if config.pin else ''
+    ))
+    return config
@@ -0,0 +1,170 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+
+def image_key(image, model_identity):
+    """ Computes a content address for a decoded image and the model that processes it.
+
+    Args
+        image          : The decoded image (np.array).
+        model_identity : String identifying the model and its detection settings.
+
+    Returns
+        A hex digest usable as cache key and file name.
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update('{}|{}|{}|'.format(model_identity, image.shape, image.dtype).encode('utf8'))
+    digest.update(memoryview(np.ascontiguousarray(image)).cast('B'))
+    return digest.hexdigest()
+
+
+class DetectionCache(object):
+    """ LRU cache of raw detections, bounded by the memory used by the cached arrays.
+
+    The detections are stored before any score cut (only the -1 padding of the model is dropped),
+    so a cached entry can answer a request with any score threshold.
+    If cache_dir is given, entries are also written to disk and survive restarts and memory evictions.
+
+    Args
+        max_bytes : Memory budget for the in-memory tier.
+        cache_dir : Optional directory for the on-disk tier.
+    """
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, cache_dir=None):
+        self.max_bytes = max_bytes
+        self.cache_dir = cache_dir
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self._entries   = OrderedDict()
+        self._lock      = threading.Lock()
+        self.bytes      = 0
+        self.hits       = 0
+        self.disk_hits  = 0
+        self.misses     = 0
+        self.evictions  = 0
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key + '.npz')
+
+    def _insert(self, key, entry):
+        """ Inserts an entry in the memory tier and evicts the least recently used entries. Requires the lock.
+        """
+        size = sum(array.nbytes for array in entry)
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self.bytes -= sum(array.nbytes for array in self._entries.pop(key))
+        self._entries[key] = entry
+        self.bytes += size
+
+        while self.bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.bytes     -= sum(array.nbytes for array in evicted)
+            self.evictions += 1
+
+    def _read_disk(self, key):
+        if self.cache_dir is None:
+            return None
+        try:
+            with np.load(self._path(key)) as data:
+                return data['boxes'], data['scores'], data['labels']
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+
+    def _write_disk(self, key, entry):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # write to a temporary file first so readers never see a partial file
+        handle, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                np.savez(f, boxes=entry[0], scores=entry[1], labels=entry[2])
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, key):
+        """ Returns the cached (boxes, scores, labels) for key, or None.
+
+        The arrays have a batch dimension of 1 and must not be modified.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._insert(key, entry)
+        return entry
+
+    def put(self, key, boxes, scores, labels):
+        """ Caches the detections of an image.
+
+        Args
+            key    : Key from image_key.
+            boxes  : np.array of shape (1, N, 4).
+            scores : np.array of shape (1, N).
+            labels : np.array of shape (1, N).
+        """
+        valid = scores[0] > -1
+        entry = (
+            np.ascontiguousarray(boxes[:, valid]),
+            np.ascontiguousarray(scores[:, valid]),
+            np.ascontiguousarray(labels[:, valid]),
+        )
+        for array in entry:
+            array.setflags(write=False)
+
+        with self._lock:
+            self._insert(key, entry)
+        if self.cache_dir is not None:
+            self._write_disk(key, entry)
+        return entry
+
+    def statistics(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'entries'   : len(self._entries),
+                'bytes'     : self.bytes,
+                'max_bytes' : self.max_bytes,
+                'hits'      : self.hits,
+                'disk_hits' : self.disk_hits,
+                'misses'    : self.misses,
+                'evictions' : self.evictions,
+                'hit_rate'  : (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,361 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+""" Inference engines, which run a converted model with Keras or one of its exports (see utils.export).
+
+The runtimes are imported when an engine is created, so ONNX Runtime or TFLite models run
+without Keras and TensorFlow being installed.
+"""
+
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from .. import models
+from .filter_detections import filter_batch
+from .shape_buckets import ShapeBuckets
+
+EXPORT_FORMAT_ENGINES = {
+    'frozen'      : 'tf',
+    'saved_model' : 'tf',
+    'tflite'      : 'tflite',
+    'onnx'        : 'onnxruntime',
+}
+
+
+def export_path(model_path, export_format):
+    """ Returns the path of the export_format model next to the Keras model model_path.
+    """
+    base = os.path.splitext(model_path)[0]
+    return {
+        'frozen'      : base + '.pb',
+        'saved_model' : base + '_saved_model',
+        'tflite'      : base + '.tflite',
+        'onnx'        : base + '.onnx',
+    }[export_format]
+
+
+def metadata_path(path):
+    return path.rstrip('/\\') + '.json'
+
+
+def read_metadata(path):
+    """ Reads the metadata of an exported model.
+
+    Raises
+        FileNotFoundError: if path was not exported by utils.export.
+    """
+    with open(metadata_path(path)) as f:
+        return json.load(f)
+
+
+def model_size_bytes(path):
+    """ Returns the size of a model file, or of all files of a model directory like a SavedModel.
+    """
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+class InferenceEngine(object):
+    """ Runs a converted RetinaNet model on batches of images.
+
+    Attributes
+        name         : Name of the engine, as selected with create_engine.
+        preprocessed : Whether the model resizes and preprocesses uint8 images itself (see models.has_preprocessing).
+        memory_bytes : Approximate size of the weights of the model.
+        input_shape  : (height, width) of a model with a static input shape, None if it takes any shape.
+    """
+    name         = None
+    preprocessed = False
+    memory_bytes = 0
+    input_shape  = None
+
+    def predict(self, batch):
+        """ Runs the model on a batch of images of shape (B, H, W, 3).
+
+        Images of another shape than a static input_shape are padded or letterboxed to it (see ShapeBuckets).
+
+        Returns
+            boxes (B, N, 4), scores (B, N) and labels (B, N), like the first outputs of retinanet_bbox.
+        """
+        raise NotImplementedError()
+
+    def _fit(self, batch):
+        """ Fits a batch to the static input shape.
+
+        Returns
+            The fitted batch and the scales to divide its boxes by, None if the batch already has the input shape.
+        """
+        if self.input_shape is None or tuple(batch.shape[1:3]) == self.input_shape:
+            return batch, None
+        fitted = [self.buckets.fit(image) for image in batch]
+        return np.stack([image for image, _, _ in fitted], axis=0), np.array([scale for _, scale, _ in fitted], dtype=np.float32)
+
+    def _set_input_shape(self, input_shape):
+        if input_shape is not None and None not in input_shape:
+            self.input_shape = tuple(input_shape)
+            self.buckets     = ShapeBuckets([self.input_shape])
+
+    def close(self):
+        """ Frees the resources of the engine.
+        """
+        pass
+
+
+class _ExportedEngine(InferenceEngine):
+    """ Base class of the engines of exported models, which filter the detections of models ending before FilterDetections.
+    """
+
+    def __init__(self, path):
+        self.metadata     = read_metadata(path)
+        self.preprocessed = self.metadata['preprocessed']
+        self.memory_bytes = model_size_bytes(path)
+        self._set_input_shape(self.metadata['input_shape'])
+
+    def _run(self, batch):
+        """ Runs the exported model on a batch of its input shape and returns its outputs, boxes first.
+        """
+        raise NotImplementedError()
+
+    def predict(self, batch):
+        batch, scales = self._fit(batch)
+        outputs       = list(self._run(batch))
+        if scales is not None:
+            outputs[0] = outputs[0] / scales[:, None, None]
+        if self.metadata['filter_detections'] is None:
+            return tuple(outputs[:3])
+        boxes, classification = outputs
+        return filter_batch(boxes, classification, **self.metadata['filter_detections'])
+
+
+class KerasEngine(InferenceEngine):
+    """ Runs a Keras model.
+
+    Args
+        model   : A converted Keras model.
+        graph   : Graph of the model, None if it is in the default graph.
+        session : Session of the model, None if it is in the Keras session.
+    """
+    name = 'keras'
+
+    def __init__(self, model, graph=None, session=None):
+        self.model        = model
+        self.graph        = graph
+        self.session      = session
+        self.preprocessed = models.has_preprocessing(model)
+        # float32 weights
+        self.memory_bytes = model.count_params() * 4
+        self._set_input_shape(model.inputs[0].shape.as_list()[1:3])
+
+    @classmethod
+    def load(cls, path, backbone_name='resnet50', config=None, weights=None):
+        """ Loads a Keras model in its own graph and session, so several models can be used side by side.
+
+        Args
+            config  : tf.ConfigProto for the session.
+            weights : Optional (model_config, weights) from models.read_model_weights, used instead of reading path.
+        """
+        import tensorflow as tf
+
+        graph = tf.Graph()
+        with graph.as_default():
+            session = tf.Session(graph=graph, config=config)
+            with session.as_default():
+                if weights is not None:
+                    model = models.model_from_weights(*weights, backbone_name=backbone_name)
+                else:
+                    model = models.load_model(path, backbone_name=backbone_name)
+                model._make_predict_function()
+        return cls(model, graph=graph, session=session)
+
+    def predict(self, batch):
+        batch, scales = self._fit(batch)
+        if self.graph is None:
+            boxes, scores, labels = self.model.predict_on_batch(batch)[:3]
+        else:
+            with self.session.as_default():
+                with self.graph.as_default():
+                    boxes, scores, labels = self.model.predict_on_batch(batch)[:3]
+        if scales is not None:
+            boxes = boxes / scales[:, None, None]
+        return boxes, scores, labels
+
+    def close(self):
+        if self.session is not None:
+            self.session.close()
+
+
+class TensorFlowEngine(_ExportedEngine):
+    """ Runs a frozen graph or a SavedModel with TensorFlow, without Keras and the custom layers.
+
+    Args
+        path   : Path of the frozen graph or the SavedModel directory.
+        config : tf.ConfigProto for the session.
+    """
+    name = 'tf'
+
+    def __init__(self, path, config=None):
+        import tensorflow as tf
+
+        super(TensorFlowEngine, self).__init__(path)
+        self.graph   = tf.Graph()
+        self.session = tf.compat.v1.Session(graph=self.graph, config=config)
+        with self.graph.as_default():
+            if self.metadata['format'] == 'saved_model':
+                tf.compat.v1.saved_model.loader.load(self.session, [tf.compat.v1.saved_model.tag_constants.SERVING], path)
+            else:
+                graph_def = tf.compat.v1.GraphDef()
+                with open(path, 'rb') as f:
+                    graph_def.ParseFromString(f.read())
+                tf.import_graph_def(graph_def, name='')
+        self.inputs  = self.graph.get_tensor_by_name(self.metadata['input'] + ':0')
+        self.outputs = [self.graph.get_tensor_by_name(name + ':0') for name in self.metadata['outputs']]
+
+    def _run(self, batch):
+        return self.session.run(self.outputs, {self.inputs: batch})
+
+    def close(self):
+        self.session.close()
+
+
+class TFLiteEngine(_ExportedEngine):
+    """ Runs a TFLite model, with tflite_runtime if it is installed or else with TensorFlow.
+
+    The model takes one image of a static shape at a time.
+
+    Args
+        path    : Path of the TFLite model.
+        threads : Number of interpreter threads, 0 lets the interpreter decide.
+    """
+    name = 'tflite'
+
+    def __init__(self, path, threads=0):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            import tensorflow as tf
+            Interpreter = tf.lite.Interpreter
+
+        super(TFLiteEngine, self).__init__(path)
+        try:
+            self.interpreter = Interpreter(model_path=path, num_threads=threads or None)
+        except TypeError:
+            # older interpreters have no thread setting
+            self.interpreter = Interpreter(model_path=path)
+        self.interpreter.allocate_tensors()
+
+        outputs = {detail['name']: detail['index'] for detail in self.interpreter.get_output_details()}
+        self.input_index    = self.interpreter.get_input_details()[0]['index']
+        self.output_indices = [outputs[name] for name in self.metadata['outputs']]
+
+    def _run(self, batch):
+        outputs = []
+        for image in batch:
+            self.interpreter.set_tensor(self.input_index, image[None].astype(np.float32, copy=False))
+            self.interpreter.invoke()
+            outputs.append([self.interpreter.get_tensor(index) for index in self.output_indices])
+        return [np.concatenate(output, axis=0) for output in zip(*outputs)]
+
+
+class OnnxRuntimeEngine(_ExportedEngine):
+    """ Runs an ONNX model with ONNX Runtime.
+
+    Args
+        path    : Path of the ONNX model.
+        threads : Number of intra-op threads, 0 lets ONNX Runtime decide.
+    """
+    name = 'onnxruntime'
+
+    def __init__(self, path, threads=0):
+        import onnxruntime
+
+        super(OnnxRuntimeEngine, self).__init__(path)
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(path, options, providers=onnxruntime.get_available_providers())
+        self.input   = self.metadata['input'] + ':0'
+        self.outputs = [name + ':0' for name in self.metadata['outputs']]
+
+    def _run(self, batch):
+        return self.session.run(self.outputs, {self.input: batch})
+
+
+ENGINES = OrderedDict([
+    ('keras'       , KerasEngine),
+    ('tf'          , TensorFlowEngine),
+    ('tflite'      , TFLiteEngine),
+    ('onnxruntime' , OnnxRuntimeEngine),
+])
+
+
+def engine_name(path):
+    """ Returns the engine which runs the model at path: the engine of its export format, or keras.
+    """
+    if not os.path.exists(metadata_path(path)):
+        return 'keras'
+    return EXPORT_FORMAT_ENGINES[read_metadata(path)['format']]
+
+
+def resolve_model_path(path, engine):
+    """ Returns the path of the model engine runs for the model at path.
+
+    A Keras model is run by another engine through its export next to it (see convert_model.py --export),
+    for tf the frozen graph or else the SavedModel.
+
+    Raises
+        ValueError: if the Keras model has no export engine can run.
+    """
+    if engine == 'keras' or engine_name(path) != 'keras':
+        return path
+    for export_format, export_engine in EXPORT_FORMAT_ENGINES.items():
+        candidate = export_path(path, export_format)
+        if export_engine == engine and os.path.exists(metadata_path(candidate)):
+            return candidate
+    raise ValueError('No export of {} for the {} engine, create it with convert_model.py --export.'.format(path, engine))
+
+
+def create_engine(path, engine='auto', backbone_name='resnet50', config=None, weights=None, threads=0):
+    """ Loads the model at path with an inference engine.
+
+    Args
+        path          : Path of a converted Keras model or of an exported model.
+        engine        : Name of an engine in ENGINES, or 'auto' for the engine of the model at path.
+        backbone_name : Backbone of a Keras model.
+        config        : tf.ConfigProto for the session of the keras and tf engines.
+        weights       : Optional (model_config, weights) from models.read_model_weights for the keras engine.
+        threads       : Threads of the tflite and onnxruntime engines, 0 lets them decide.
+
+    Returns
+        An InferenceEngine.
+    """
+    if engine == 'auto':
+        engine = engine_name(path)
+    if engine not in ENGINES:
+        raise ValueError('Unknown inference engine: {}'.format(engine))
+
+    path = resolve_model_path(path, engine)
+    if engine == 'keras':
+        return KerasEngine.load(path, backbone_name=backbone_name, config=config, weights=weights)
+    if engine == 'tf':
+        return TensorFlowEngine(path, config=config)
+    return ENGINES[engine](path, threads=threads)
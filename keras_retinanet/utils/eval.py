@@ -15,6 +15,8 @@ limitations under the License.
 """
 
 from .anchors import compute_overlap
+from .engine import InferenceEngine, KerasEngine
+from .mission import process_unordered
 from .visualization import draw_detections, draw_annotations
 
 import keras
@@ -56,7 +58,35 @@ def _compute_ap(recall, precision):
     return ap
 
 
-def _get_detections(generator, model, score_threshold=0.05, max_detections=100, save_path=None):
+def _load_images(generator, preprocessed, workers=0):
+    """ Loads and preprocesses the images of the generator, ahead of the model in a pool of threads if workers > 0.
+
+    # Yields
+        Tuples (index, raw_image, image, scale), in index order only without workers.
+    """
+    def load(i):
+        raw_image = generator.load_image(i)
+        if preprocessed:
+            # the model resizes the uint8 image itself and returns boxes in its coordinates
+            return raw_image, raw_image, 1.0
+        image, scale = generator.preprocess_and_resize_image(raw_image)
+        if keras.backend.image_data_format() == 'channels_first':
+            image = image.transpose((2, 0, 1))
+        return raw_image, image, scale
+
+    if workers <= 0:
+        for i in range(generator.size()):
+            yield (i,) + load(i)
+        return
+
+    items = ((i, lambda i=i: i) for i in range(generator.size()))
+    for i, result, error in process_unordered(items, load, workers=workers):
+        if error is not None:
+            raise error
+        yield (i,) + result
+
+
+def _get_detections(generator, model, score_threshold=0.05, max_detections=100, save_path=None, workers=0):
     """ Get the detections from the model using the generator.
 
     The result is a list of lists such that the size is:
@@ -64,27 +94,24 @@ def _get_detections(generator, model, score_threshold=0.05, max_detections=100,
 
     # Arguments
         generator       : The generator used to run images through the model.
-        model           : The model to run on the images.
+        model           : The Keras model or the InferenceEngine to run on the images.
         score_threshold : The score confidence threshold to use.
         max_detections  : The maximum number of detections to use per image.
         save_path       : The path to save the images with visualized detections to.
+        workers         : Number of threads loading images while the model runs, 0 loads them in between.
     # Returns
         A list of lists containing the detections for each image in the generator.
     """
     all_detections = [[None for i in range(generator.num_classes()) if generator.has_label(i)] for j in range(generator.size())]
     all_inferences = [None for i in range(generator.size())]
+    engine         = model if isinstance(model, InferenceEngine) else KerasEngine(model)
+    images         = _load_images(generator, engine.preprocessed, workers=workers)
 
-    for i in progressbar.progressbar(range(generator.size()), prefix='Running network: '):
-        raw_image    = generator.load_image(i)
-        image        = generator.preprocess_image(raw_image.copy())
-        image, scale = generator.resize_image(image)
-
-        if keras.backend.image_data_format() == 'channels_first':
-            image = image.transpose((2, 0, 1))
+    for i, raw_image, image, scale in progressbar.progressbar(images, max_value=generator.size(), prefix='Running network: '):
 
         # run network
         start = time.time()
-        boxes, scores, labels = model.predict_on_batch(np.expand_dims(image, axis=0))[:3]
+        boxes, scores, labels = engine.predict(np.expand_dims(image, axis=0))
         inference_time = time.time() - start
 
         # correct boxes for image scale
@@ -156,22 +183,24 @@ def evaluate(
     iou_threshold=0.5,
     score_threshold=0.05,
     max_detections=100,
-    save_path=None
+    save_path=None,
+    workers=0
 ):
     """ Evaluate a given dataset using a given model.
 
     # Arguments
         generator       : The generator that represents the dataset to evaluate.
-        model           : The model to evaluate.
+        model           : The Keras model or the InferenceEngine to evaluate.
         iou_threshold   : The threshold used to consider when a detection is positive or negative.
         score_threshold : The score confidence threshold to use for detections.
         max_detections  : The maximum number of detections to use per image.
         save_path       : The path to save images with visualized detections to.
+        workers         : Number of threads loading images while the model runs.
     # Returns
         A dict mapping class names to mAP scores.
     """
     # gather all detections and annotations
-    all_detections, all_inferences = _get_detections(generator, model, score_threshold=score_threshold, max_detections=max_detections, save_path=save_path)
+    all_detections, all_inferences = _get_detections(generator, model, score_threshold=score_threshold, max_detections=max_detections, save_path=save_path, workers=workers)
     all_annotations    = _get_annotations(generator)
     average_precisions = {}
 
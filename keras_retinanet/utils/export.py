@@ -0,0 +1,348 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+""" Export of inference models to formats which load without Keras and the custom layers.
+
+Every exported model takes its images from a tensor named INPUT_NAME and returns OUTPUT_NAMES, except
+TFLite models: TFLite can not run the while loop of FilterDetections, so they end before it with
+RAW_OUTPUT_NAMES and utils.filter_detections filters their detections. A JSON file next to every
+exported model (see metadata_path) describes its inputs, outputs and that filtering. The exported
+models are run by the engines of utils.engine.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+
+import keras
+import numpy as np
+import tensorflow as tf
+
+from .. import models
+from .engine import export_path, metadata_path, read_metadata  # noqa: F401
+
+EXPORT_FORMATS = ('frozen', 'saved_model', 'tflite', 'onnx')
+
+INPUT_NAME       = 'image'
+OUTPUT_NAMES     = ('output_boxes', 'output_scores', 'output_labels')
+RAW_OUTPUT_NAMES = ('output_boxes', 'output_classification')
+
+FILTER_PARAMETERS = ('nms', 'class_specific_filter', 'nms_threshold', 'score_threshold', 'max_detections')
+
+
+def write_metadata(path, metadata):
+    with open(metadata_path(path), 'w') as f:
+        json.dump(metadata, f, indent=2, sort_keys=True)
+
+
+def filter_parameters(model):
+    """ Returns the arguments of utils.filter_detections which match the FilterDetections layer of a retinanet_bbox model.
+    """
+    config = model.get_layer('filtered_detections').get_config()
+    return {key: config[key] for key in FILTER_PARAMETERS}
+
+
+def raw_detection_model(model):
+    """ Returns the part of a retinanet_bbox model before FilterDetections, which outputs the clipped boxes and the classification.
+    """
+    if models.has_preprocessing(model):
+        raise ValueError('Only models without in-graph preprocessing can be cut before FilterDetections.')
+    boxes, classification = model.get_layer('filtered_detections').input[:2]
+    return keras.models.Model(inputs=model.inputs, outputs=[boxes, classification], name=model.name + '-raw')
+
+
+def _tensor_input(tensor):
+    """ Returns how a GraphDef node refers to tensor as its input.
+    """
+    name, index = tensor.name.split(':')
+    return name if index == '0' else tensor.name
+
+
+def _rename_node(graph_def, old, new):
+    for node in graph_def.node:
+        if node.name == old:
+            node.name = new
+        for i, name in enumerate(node.input):
+            # plain, output index and control inputs
+            if name == old or name.startswith(old + ':'):
+                node.input[i] = new + name[len(old):]
+            elif name == '^' + old:
+                node.input[i] = '^' + new
+
+
+def _fold_constants(graph_def, output_names):
+    """ Folds constant subgraphs (like the anchors of a fixed input shape) and batch norms into the weights, if graph_transforms is available.
+    """
+    try:
+        from tensorflow.tools.graph_transforms import TransformGraph
+    except ImportError:
+        return graph_def
+    return TransformGraph(graph_def, [INPUT_NAME], list(output_names), [
+        'fold_constants(ignore_errors=true)',
+        'fold_batch_norms',
+        'fold_old_batch_norms',
+        'sort_by_execution_order',
+    ])
+
+
+def freeze_model(model, output_names=OUTPUT_NAMES, session=None):
+    """ Freezes a Keras model into a constant folded tf.GraphDef.
+
+    The variables become constants, the input is renamed to INPUT_NAME and every output gets an Identity
+    node named by output_names. The graph of the session is not changed.
+
+    Args
+        model        : The Keras model, created with learning phase 0.
+        output_names : Names of the outputs of model.
+        session      : Session holding the weights (defaults to the Keras session).
+
+    Returns
+        The frozen tf.GraphDef.
+    """
+    if session is None:
+        session = keras.backend.get_session()
+    if len(output_names) != len(model.outputs):
+        raise ValueError('Expected {} output names, received: {}'.format(len(model.outputs), output_names))
+
+    graph_def = tf.compat.v1.graph_util.convert_variables_to_constants(
+        session,
+        session.graph.as_graph_def(),
+        [output.op.name for output in model.outputs]
+    )
+
+    for output, name in zip(model.outputs, output_names):
+        node = graph_def.node.add()
+        node.name = name
+        node.op   = 'Identity'
+        node.input.append(_tensor_input(output))
+        node.attr['T'].type = output.dtype.as_datatype_enum
+    _rename_node(graph_def, model.inputs[0].op.name, INPUT_NAME)
+
+    return _fold_constants(graph_def, output_names)
+
+
+def load_graph_def(path):
+    graph_def = tf.compat.v1.GraphDef()
+    with open(path, 'rb') as f:
+        graph_def.ParseFromString(f.read())
+    return graph_def
+
+
+def model_metadata(model, export_format, output_names=OUTPUT_NAMES, input_shape=None, filter_detections=None, quantization=None):
+    """ Returns the metadata of model exported as export_format.
+
+    Args
+        input_shape       : (height, width) of a model with a fixed input shape, defaults to the static input shape of model.
+        filter_detections : Arguments of utils.filter_detections if the model ends before FilterDetections.
+        quantization      : Description of the quantization of a quantized model (see utils.quantization).
+    """
+    if input_shape is None:
+        input_shape = model.inputs[0].shape.as_list()[1:3]
+        input_shape = None if None in input_shape else input_shape
+    return {
+        'format'            : export_format,
+        'input'             : INPUT_NAME,
+        'input_dtype'       : model.inputs[0].dtype.name,
+        'input_shape'       : list(input_shape) if input_shape else None,
+        'outputs'           : list(output_names),
+        'preprocessed'      : models.has_preprocessing(model),
+        'filter_detections' : filter_detections,
+        'quantization'      : quantization,
+    }
+
+
+def export_frozen_graph(model, path):
+    """ Writes the frozen GraphDef of a retinanet_bbox model.
+
+    Returns
+        The frozen tf.GraphDef.
+    """
+    graph_def = freeze_model(model)
+    with open(path, 'wb') as f:
+        f.write(graph_def.SerializeToString())
+    write_metadata(path, model_metadata(model, 'frozen'))
+    return graph_def
+
+
+def export_saved_model(model, path, graph_def=None):
+    """ Writes a SavedModel of the frozen graph of a retinanet_bbox model, with a serving_default signature.
+
+    The signature maps INPUT_NAME to boxes, scores and labels. An existing SavedModel at path is replaced.
+
+    Args
+        graph_def : The frozen graph of model, if it was frozen already.
+    """
+    if graph_def is None:
+        graph_def = freeze_model(model)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name='')
+        with tf.compat.v1.Session(graph=graph) as session:
+            tf.compat.v1.saved_model.simple_save(
+                session,
+                path,
+                inputs={INPUT_NAME: graph.get_tensor_by_name(INPUT_NAME + ':0')},
+                outputs={name[len('output_'):]: graph.get_tensor_by_name(name + ':0') for name in OUTPUT_NAMES}
+            )
+    write_metadata(path, model_metadata(model, 'saved_model'))
+
+
+def export_tflite(model, path, input_shape, representative_images=None, quantization=None):
+    """ Writes a TFLite model of a retinanet_bbox model for a fixed input shape and batch size 1.
+
+    The TFLite model ends before FilterDetections, the metadata holds the arguments to filter its detections with.
+
+    Args
+        input_shape           : (height, width) of the images the model will be run on.
+        representative_images : Optional images of input_shape the activation ranges of an int8 model are calibrated on,
+                                the model is float if not given.
+        quantization          : Description of the quantization for the metadata.
+    """
+    raw_model = raw_detection_model(model)
+    graph_def = freeze_model(raw_model, RAW_OUTPUT_NAMES)
+
+    with tempfile.TemporaryDirectory() as directory:
+        graph_path = os.path.join(directory, 'raw.pb')
+        with open(graph_path, 'wb') as f:
+            f.write(graph_def.SerializeToString())
+        converter = tf.compat.v1.lite.TFLiteConverter.from_frozen_graph(
+            graph_path,
+            input_arrays=[INPUT_NAME],
+            output_arrays=list(RAW_OUTPUT_NAMES),
+            input_shapes={INPUT_NAME: [1, input_shape[0], input_shape[1], 3]}
+        )
+        if representative_images is not None:
+            # int8 weights and activations, the input and the outputs stay float
+            converter.optimizations          = [tf.lite.Optimize.DEFAULT]
+            converter.representative_dataset = tf.lite.RepresentativeDataset(
+                lambda: ([np.expand_dims(image, axis=0).astype(np.float32)] for image in representative_images)
+            )
+        data = converter.convert()
+
+    with open(path, 'wb') as f:
+        f.write(data)
+    write_metadata(path, model_metadata(model, 'tflite', RAW_OUTPUT_NAMES, input_shape, filter_parameters(model), quantization))
+
+
+def export_onnx(model, path, graph_def=None, opset=11):
+    """ Writes an ONNX model of the frozen graph of a retinanet_bbox model, FilterDetections included.
+
+    Args
+        graph_def : The frozen graph of model, if it was frozen already.
+        opset     : ONNX opset, NonMaxSuppression and the loop over the batch need at least 11.
+    """
+    try:
+        from tf2onnx import convert
+    except ImportError:
+        raise ImportError('ONNX export needs tf2onnx, install it with: pip install tf2onnx')
+
+    if graph_def is None:
+        graph_def = freeze_model(model)
+    convert.from_graph_def(
+        graph_def,
+        input_names=[INPUT_NAME + ':0'],
+        output_names=[name + ':0' for name in OUTPUT_NAMES],
+        opset=opset,
+        output_path=path
+    )
+    write_metadata(path, model_metadata(model, 'onnx'))
+
+
+def export_model(model, model_path, export_formats, input_shape=None, opset=11):
+    """ Exports a retinanet_bbox model to every format of export_formats, next to model_path.
+
+    Args
+        model          : The model to export, created with learning phase 0.
+        model_path     : Path of the Keras model, see export_path.
+        export_formats : Formats from EXPORT_FORMATS.
+        input_shape    : (height, width) for the TFLite export.
+        opset          : ONNX opset.
+
+    Returns
+        A list of (format, path) tuples.
+    """
+    exported  = []
+    graph_def = None
+    for export_format in export_formats:
+        path = export_path(model_path, export_format)
+        if export_format == 'frozen':
+            graph_def = export_frozen_graph(model, path)
+        elif export_format == 'saved_model':
+            graph_def = graph_def or freeze_model(model)
+            export_saved_model(model, path, graph_def)
+        elif export_format == 'tflite':
+            if input_shape is None:
+                raise ValueError('TFLite export needs a fixed input shape.')
+            export_tflite(model, path, input_shape)
+        elif export_format == 'onnx':
+            graph_def = graph_def or freeze_model(model)
+            export_onnx(model, path, graph_def, opset=opset)
+        else:
+            raise ValueError('Unknown export format: {}'.format(export_format))
+        exported.append((export_format, path))
+    return exported
+
+
+def _iou(box, boxes):
+    width        = np.maximum(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0)
+    height       = np.maximum(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0)
+    intersection = width * height
+    union        = (box[2] - box[0]) * (box[3] - box[1]) + (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1]) - intersection
+    return intersection / np.maximum(union, 1e-12)
+
+
+def compare_detections(expected, actual, threshold=0.3, min_iou=0.5):
+    """ Compares the detections of an exported model with those of the Keras model on one image.
+
+    Every expected detection above threshold is matched with the actual detection of the same label which overlaps it most.
+
+    Args
+        expected  : boxes (N, 4), scores (N,) and labels (N,) of the Keras model.
+        actual    : boxes, scores and labels of the exported model.
+        threshold : Score threshold of the compared detections.
+        min_iou   : Minimum IoU of a match.
+
+    Returns
+        A dict with the number of expected detections, the number of unmatched ones, the smallest IoU and
+        the largest score difference of the matches.
+    """
+    expected_boxes, expected_scores, expected_labels = expected
+    actual_boxes, actual_scores, actual_labels       = actual
+
+    result = {'detections': 0, 'unmatched': 0, 'min_iou': 1.0, 'max_score_diff': 0.0}
+    for box, score, label in zip(expected_boxes, expected_scores, expected_labels):
+        if score < threshold:
+            continue
+        result['detections'] += 1
+
+        candidates = np.where((actual_labels == label) & (actual_scores >= 0))[0]
+        if len(candidates) == 0:
+            result['unmatched'] += 1
+            continue
+        overlaps = _iou(box, actual_boxes[candidates])
+        best     = np.argmax(overlaps)
+        if overlaps[best] < min_iou:
+            result['unmatched'] += 1
+            continue
+        result['min_iou']        = min(result['min_iou'], float(overlaps[best]))
+        result['max_score_diff'] = max(result['max_score_diff'], float(abs(actual_scores[candidates[best]] - score)))
+    return result
@@ -0,0 +1,121 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+""" Numpy implementation of layers.FilterDetections, for exported models which end before it.
+"""
+
+import numpy as np
+
+
+def non_max_suppression(boxes, scores, max_output_size, iou_threshold=0.5):
+    """ Greedy non maximum suppression like tf.image.non_max_suppression.
+
+    Args
+        boxes           : np.array of shape (N, 4) with (x1, y1, x2, y2) boxes.
+        scores          : np.array of shape (N,).
+        max_output_size : Maximum number of boxes to keep.
+        iou_threshold   : Boxes overlapping a kept box with a larger IoU are suppressed.
+
+    Returns
+        The indices of the kept boxes, by descending score.
+    """
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    order = np.argsort(-scores, kind='stable')
+
+    keep = []
+    while order.size > 0 and len(keep) < max_output_size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        width        = np.maximum(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0)
+        height       = np.maximum(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0)
+        intersection = width * height
+        union        = areas[i] + areas[rest] - intersection
+        iou          = np.where(union > 0, intersection / np.maximum(union, 1e-12), 0)
+        order        = rest[iou <= iou_threshold]
+
+    return np.array(keep, dtype=np.int64)
+
+
+def filter_detections(
+    boxes,
+    classification,
+    class_specific_filter = True,
+    nms                   = True,
+    score_threshold       = 0.05,
+    max_detections        = 300,
+    nms_threshold         = 0.5
+):
+    """ Filters the detections of one image, see layers.filter_detections.
+
+    Args
+        boxes          : np.array of shape (num_boxes, 4) with the (x1, y1, x2, y2) boxes.
+        classification : np.array of shape (num_boxes, num_classes) with the classification scores.
+        The other arguments are those of layers.FilterDetections.
+
+    Returns
+        boxes (max_detections, 4), scores (max_detections,) and labels (max_detections,) padded with -1.
+    """
+    def _filter(scores):
+        indices = np.where(scores > score_threshold)[0]
+        if nms:
+            indices = indices[non_max_suppression(boxes[indices], scores[indices], max_detections, nms_threshold)]
+        return indices
+
+    if class_specific_filter:
+        indices = []
+        labels  = []
+        for c in range(classification.shape[1]):
+            class_indices = _filter(classification[:, c])
+            indices.append(class_indices)
+            labels.append(np.full(len(class_indices), c, dtype=np.int64))
+        indices = np.concatenate(indices)
+        labels  = np.concatenate(labels)
+    else:
+        indices = _filter(np.max(classification, axis=1))
+        labels  = np.argmax(classification, axis=1)[indices]
+
+    # select top k
+    scores = classification[indices, labels]
+    top    = np.argsort(-scores, kind='stable')[:max_detections]
+    count  = len(top)
+
+    result_boxes  = np.full((max_detections, 4), -1, dtype=boxes.dtype)
+    result_scores = np.full((max_detections,), -1, dtype=classification.dtype)
+    result_labels = np.full((max_detections,), -1, dtype=np.int32)
+    result_boxes[:count]  = boxes[indices[top]]
+    result_scores[:count] = scores[top]
+    result_labels[:count] = labels[top]
+    return result_boxes, result_scores, result_labels
+
+
+def filter_batch(boxes, classification, **kwargs):
+    """ Filters the detections of a batch like layers.FilterDetections.
+
+    Args
+        boxes          : np.array of shape (batch, num_boxes, 4).
+        classification : np.array of shape (batch, num_boxes, num_classes).
+        kwargs         : Passed to filter_detections.
+
+    Returns
+        boxes (batch, max_detections, 4), scores (batch, max_detections) and labels (batch, max_detections).
+    """
+    results = [filter_detections(b, c, **kwargs) for b, c in zip(boxes, classification)]
+    return tuple(np.stack(output, axis=0) for output in zip(*results))
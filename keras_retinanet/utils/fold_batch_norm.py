@@ -0,0 +1,160 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+""" Folding of inference mode batch normalization into the convolution before it.
+
+In inference mode a BatchNormalization layer is a per channel affine transform with its moving statistics,
+so a convolution followed by it equals one convolution with scaled kernels and a shifted bias.
+"""
+
+from collections import Counter
+
+import keras
+import numpy as np
+
+from .rebuild import rebuild_model
+
+
+def fold_weights(kernel, bias, gamma, beta, mean, variance, epsilon, depthwise=False):
+    """ Folds the batch normalization of a convolution output into the weights of the convolution.
+
+    Args
+        kernel    : Convolution kernel, (kh, kw, in, out) or (kh, kw, in, multiplier) if depthwise.
+        bias      : Convolution bias of the output channels, or None.
+        gamma     : Scale of the batch normalization, or None if it does not scale.
+        beta      : Shift of the batch normalization, or None if it does not center.
+        mean      : Moving mean.
+        variance  : Moving variance.
+        epsilon   : Epsilon of the batch normalization.
+        depthwise : Whether the convolution is a DepthwiseConv2D.
+
+    Returns
+        The folded kernel and bias.
+    """
+    scale = 1 / np.sqrt(variance + epsilon)
+    if gamma is not None:
+        scale = scale * gamma
+    if bias is None:
+        bias = np.zeros_like(mean)
+
+    if depthwise:
+        kernel = kernel * scale.reshape(kernel.shape[2], kernel.shape[3])
+    else:
+        kernel = kernel * scale
+    bias = (bias - mean) * scale
+    if beta is not None:
+        bias = bias + beta
+    return kernel.astype(np.float32), bias.astype(np.float32)
+
+
+def _batch_norm_weights(layer):
+    """ Returns gamma, beta, moving mean and moving variance of a BatchNormalization layer, gamma and beta may be None.
+    """
+    weights = layer.get_weights()
+    gamma   = weights.pop(0) if layer.scale else None
+    beta    = weights.pop(0) if layer.center else None
+    return gamma, beta, weights[0], weights[1]
+
+
+def _inbound_layer_names(layer_config):
+    return [inbound[0] for node in layer_config['inbound_nodes'] for inbound in node]
+
+
+def foldable_pairs(model):
+    """ Finds the (convolution, batch normalization) layer pairs of a functional model which can be folded.
+
+    A pair is foldable if the batch normalization normalizes the last axis of the output of a Conv2D or
+    DepthwiseConv2D without activation, the convolution output is used by nothing else and neither layer is shared.
+
+    Returns
+        A list of (convolution name, batch normalization name) tuples.
+    """
+    config    = model.get_config()
+    consumers = Counter(name for layer_config in config['layers'] for name in _inbound_layer_names(layer_config))
+    outputs   = set(output[0] for output in config['output_layers'])
+
+    pairs = []
+    for layer_config in config['layers']:
+        layer = model.get_layer(layer_config['name'])
+        if not isinstance(layer, keras.layers.BatchNormalization):
+            continue
+        inbound = _inbound_layer_names(layer_config)
+        if len(layer_config['inbound_nodes']) != 1 or len(inbound) != 1:
+            continue
+        if layer.axis not in (-1, len(layer.input_shape) - 1):
+            continue
+
+        conv = model.get_layer(inbound[0])
+        if type(conv) not in (keras.layers.Conv2D, keras.layers.DepthwiseConv2D):
+            continue
+        if conv.name in outputs or consumers[conv.name] != 1 or len(conv._inbound_nodes) != 1:
+            continue
+        if conv.data_format != 'channels_last' or conv.get_config()['activation'] != 'linear':
+            continue
+        pairs.append((conv.name, layer.name))
+    return pairs
+
+
+def fold_batch_norms(model, custom_objects=None):
+    """ Returns a copy of a functional model in which batch normalizations are folded into the convolutions before them.
+
+    The copy computes the outputs of model in inference mode, with one elementwise pass less per folded layer.
+    Layers of nested models (like the retinanet submodels) are not folded.
+
+    Args
+        model          : A functional Keras model, like a retinanet training model.
+        custom_objects : Additional custom objects to recreate the model with, the classes used by model are found by themselves.
+
+    Returns
+        The folded model, or model itself if nothing can be folded.
+    """
+    pairs = foldable_pairs(model)
+    if not pairs:
+        return model
+    folded      = dict(pairs)
+    batch_norms = {batch_norm: conv for conv, batch_norm in pairs}
+
+    def rewrite(config):
+        layers = []
+        for layer_config in config['layers']:
+            if layer_config['name'] in batch_norms:
+                continue
+            if layer_config['name'] in folded:
+                layer_config['config']['use_bias'] = True
+            # the consumers of a batch normalization now take the output of the convolution, both have a single node
+            for node in layer_config['inbound_nodes']:
+                for inbound in node:
+                    inbound[0] = batch_norms.get(inbound[0], inbound[0])
+            layers.append(layer_config)
+        config['layers'] = layers
+        for output in config['output_layers']:
+            output[0] = batch_norms.get(output[0], output[0])
+
+    weights = {}
+    for conv_name, batch_norm_name in pairs:
+        conv         = model.get_layer(conv_name)
+        batch_norm   = model.get_layer(batch_norm_name)
+        conv_weights = conv.get_weights()
+        weights[conv_name] = fold_weights(
+            conv_weights[0],
+            conv_weights[1] if conv.use_bias else None,
+            *_batch_norm_weights(batch_norm),
+            epsilon=batch_norm.epsilon,
+            depthwise=isinstance(conv, keras.layers.DepthwiseConv2D)
+        )
+    return rebuild_model(model, rewrite, custom_objects=custom_objects, weights=weights)
@@ -21,7 +21,7 @@ import tensorflow as tf
 from .tf_version import tf_version_ok
 
 
-def setup_gpu(gpu_id):
+def setup_gpu(gpu_id, config=None):
     if tf_version_ok((2, 0, 0)):
         if gpu_id == 'cpu' or gpu_id == -1:
             tf.config.experimental.set_visible_devices([], 'GPU')
@@ -50,6 +50,7 @@ def setup_gpu(gpu_id):
             return
 
         os.environ['CUDA_VISIBLE_DEVICES'] = str(gpu_id)
-        config = tf.ConfigProto()
-        config.gpu_options.allow_growth = True
+        if config is None:
+            config = tf.ConfigProto()
+            config.gpu_options.allow_growth = True
         tf.keras.backend.set_session(tf.Session(config=config))
@@ -0,0 +1,263 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import bisect
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(escaped) + '}'
+
+
+class _Metric(object):
+    kind = None
+
+    def __init__(self, registry, name, documentation, labelnames=()):
+        self.name          = name
+        self.documentation = documentation
+        self.labelnames    = tuple(labelnames)
+
+        self._registry = registry
+        self._lock     = threading.Lock()
+        self._values   = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError('{} expects the labels {}, received: {}'.format(self.name, self.labelnames, sorted(labels)))
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        """ Returns a list of (suffix, label values, extra labels, value) tuples.
+        """
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._values.items())]
+
+
+class Counter(_Metric):
+    """ A value which only goes up, like the number of handled requests.
+    """
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._apply(key, amount)
+        self._registry._record(self.name, key, amount)
+
+    def _apply(self, key, amount):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """ A value which goes up and down, like the number of requests in progress.
+
+    If function is given, the gauge has no labels and its value is read from function() on every exposition.
+    """
+    kind = 'gauge'
+
+    def __init__(self, registry, name, documentation, labelnames=(), function=None):
+        super(Gauge, self).__init__(registry, name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    @contextmanager
+    def track_inprogress(self, **labels):
+        """ Increments the gauge while the block runs.
+        """
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def samples(self):
+        if self.function is not None:
+            return [('', (), (), self.function())]
+        return super(Gauge, self).samples()
+
+
+class Histogram(_Metric):
+    """ Counts observations (like latencies) in cumulative buckets.
+    """
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        if 'le' in labelnames:
+            raise ValueError('The label "le" is reserved for histogram buckets.')
+        super(Histogram, self).__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        self._apply(key, value)
+        self._registry._record(self.name, key, value)
+
+    def _apply(self, key, value):
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                # one count per bucket plus the +Inf bucket, followed by the sum
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[bisect.bisect_left(self.buckets, value)] += 1
+            entry[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """ Observes the duration of the block in seconds.
+        """
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(time.time() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            values = sorted((key, list(entry)) for key, entry in self._values.items())
+
+        samples = []
+        for key, entry in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), entry[:-1]):
+                cumulative += count
+                samples.append(('_bucket', key, (('le', _format_value(bound)),), cumulative))
+            samples.append(('_sum', key, (), entry[-1]))
+            samples.append(('_count', key, (), cumulative))
+        return samples
+
+
+class MetricsRegistry(object):
+    """ A set of metrics which can be exposed in the Prometheus text format.
+
+    A forked worker process can record the counter increments and histogram observations it makes
+    (see start_recording), send them to the parent and the parent replays them in its own registry,
+    so a single /metrics endpoint covers the work done in all processes.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._by_name = {}
+        self._lock    = threading.Lock()
+        self._samples = None
+
+    def _register(self, metric):
+        if metric.name in self._by_name:
+            raise ValueError('A metric named {} is already registered.'.format(metric.name))
+        self._metrics.append(metric)
+        self._by_name[metric.name] = metric
+        return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=(), function=None):
+        return self._register(Gauge(self, name, documentation, labelnames, function=function))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(self, name, documentation, labelnames, buckets=buckets))
+
+    def start_recording(self):
+        """ Starts recording counter increments and histogram observations for drain().
+        """
+        with self._lock:
+            self._samples = []
+
+    def _record(self, name, key, value):
+        if self._samples is None:
+            return
+        with self._lock:
+            self._samples.append((name, key, value))
+
+    def drain(self):
+        """ Returns and clears the recorded (name, label values, value) tuples.
+        """
+        with self._lock:
+            if self._samples is None:
+                return []
+            samples, self._samples = self._samples, []
+        return samples
+
+    def replay(self, samples):
+        """ Applies samples returned by drain() in another registry with the same metrics.
+        """
+        for name, key, value in samples:
+            self._by_name[name]._apply(tuple(key), value)
+
+    def expose(self):
+        """ Returns all metrics in the Prometheus text exposition format (version 0.0.4).
+        """
+        lines = []
+        for metric in self._metrics:
+            lines.append('# HELP {} {}'.format(metric.name, metric.documentation.replace('\\', '\\\\').replace('\n', '\\n')))
+            lines.append('# TYPE {} {}'.format(metric.name, metric.kind))
+            for suffix, key, extra, value in metric.samples():
+                lines.append('{}{}{} {}'.format(metric.name, suffix, _format_labels(metric.labelnames, key, extra), _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+def process_rss_bytes(pid=None):
+    """ Returns the resident memory of a process in bytes (the current process by default), or 0 if it is not known.
+    """
+    try:
+        with open('/proc/{}/statm'.format(pid or 'self')) as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+
+    if pid is not None:
+        return 0
+    try:
+        # without procfs only the peak resident memory of the current process is available
+        import resource
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+    except (ImportError, OSError):
+        return 0
@@ -0,0 +1,134 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import os
+import tarfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tif', '.tiff')
+
+
+def is_image_name(name):
+    """ Checks whether a file name has an image extension and is not hidden (like macOS resource forks).
+    """
+    base = os.path.basename(name)
+    return not base.startswith('.') and base.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def iter_tar(fileobj):
+    """ Iterates the images of a (optionally compressed) tar archive without seeking.
+
+    Every image is read when the iteration reaches it, so the archive can be streamed from a socket.
+
+    Yields
+        Tuples (name, load) where load() returns the encoded image bytes.
+    """
+    with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+        for member in tar:
+            if not member.isfile() or not is_image_name(member.name):
+                continue
+            data = tar.extractfile(member).read()
+            yield member.name, (lambda data=data: data)
+
+
+def iter_zip(fileobj):
+    """ Iterates the images of a zip archive, fileobj must be seekable.
+
+    Yields
+        Tuples (name, load) where load() returns the encoded image bytes.
+    """
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not is_image_name(info.filename):
+                continue
+            data = archive.read(info)
+            yield info.filename, (lambda data=data: data)
+
+
+def resolve_path(root, path):
+    """ Resolves a path relative to root.
+
+    Raises
+        ValueError: if the path points outside of root.
+    """
+    root      = os.path.realpath(root)
+    full_path = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full_path]) != root:
+        raise ValueError('Path is outside of the mission root: {}'.format(path))
+    return full_path
+
+
+def iter_paths(paths, root):
+    """ Iterates images given by paths relative to root, the files are read lazily by load().
+
+    Raises
+        ValueError: if a path points outside of root.
+
+    Yields
+        Tuples (name, load) where load() returns the encoded image bytes.
+    """
+    for path in paths:
+        full_path = resolve_path(root, path)
+
+        def load(full_path=full_path):
+            with open(full_path, 'rb') as f:
+                return f.read()
+
+        yield path, load
+
+
+def _load_and_process(process, load):
+    return process(load())
+
+
+def process_unordered(items, process, workers=4, max_pending=None):
+    """ Processes items in a thread pool and yields the results in completion order.
+
+    At most max_pending items are loaded or in progress at once, so a mission of any size
+    is never held in memory as a whole.
+
+    Args
+        items       : Iterable of (name, load) tuples.
+        process     : Function called with the result of load() in a pool thread.
+        workers     : Number of pool threads.
+        max_pending : Maximum number of items in flight (defaults to 2 * workers).
+
+    Yields
+        Tuples (name, result, error), error is None if process succeeded.
+    """
+    if max_pending is None:
+        max_pending = 2 * workers
+
+    def _collect(futures):
+        for future in futures:
+            name  = pending.pop(future)
+            error = future.exception()
+            yield name, (None if error else future.result()), error
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for name, load in items:
+            if len(pending) >= max_pending:
+                done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+                yield from _collect(done)
+            pending[executor.submit(_load_and_process, process, load)] = name
+
+        while pending:
+            done, _ = wait(list(pending), return_when=FIRST_COMPLETED)
+            yield from _collect(done)
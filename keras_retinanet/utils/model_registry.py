@@ -0,0 +1,286 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import os
+import threading
+import time
+import traceback
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
+
+ModelSpec = namedtuple('ModelSpec', ['path', 'backbone_name'])
+
+
+def parse_model_spec(spec):
+    """ Parses a NAME=BACKBONE:PATH model definition, like 'mobilenet=mobilenet224_1.0:snapshots/mobilenet.h5'.
+
+    Returns
+        A tuple (name, ModelSpec).
+    """
+    name, sep, rest = spec.partition('=')
+    backbone_name, sep2, path = rest.partition(':')
+    if not sep or not sep2 or not name or not backbone_name or not path:
+        raise ValueError('Invalid model definition, expected NAME=BACKBONE:PATH: {}'.format(spec))
+    return name, ModelSpec(path, backbone_name)
+
+
+def _modified_time(path):
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+class _Slot(object):
+    __slots__ = ('entry', 'mtime', 'refs', 'retired')
+
+    def __init__(self, entry, mtime):
+        self.entry   = entry
+        self.mtime   = mtime
+        self.refs    = 0
+        self.retired = False
+
+
+class ModelRegistry(object):
+    """ Loads named models on demand, keeps the most recently used ones within a memory budget and swaps in new snapshots.
+
+    A model is loaded by loader(name, spec), which returns an object with a memory_bytes attribute and a close() method.
+    The loader should also warm the model up, because a (re)loaded model serves requests as soon as it is returned.
+
+    Models are used within `with registry.use(name) as entry:`. A model which is evicted or replaced while it is
+    in use keeps serving the requests that already hold it and is closed when the last of them is done.
+
+    Args
+        loader    : Function creating a model as loader(name, spec).
+        max_bytes : Memory budget of the loaded models, the least recently used models are evicted above it (None for no limit).
+                    The model which was loaded last is never evicted, even if it alone exceeds the budget.
+    """
+
+    def __init__(self, loader, max_bytes=None):
+        self.loader    = loader
+        self.max_bytes = max_bytes
+
+        self._specs        = OrderedDict()
+        self._slots        = OrderedDict()
+        self._lock         = threading.Lock()
+        self._load_locks   = {}
+        self._loads        = 0
+        self._reloads      = 0
+        self._evictions    = 0
+        self._errors       = 0
+        self._last_error   = None
+        self._watch_thread = None
+        self._watching     = False
+
+    def add(self, name, spec):
+        """ Makes a model available under name, it is loaded on first use.
+        """
+        with self._lock:
+            self._specs[name] = spec
+            self._load_locks.setdefault(name, threading.Lock())
+
+    def names(self):
+        with self._lock:
+            return list(self._specs)
+
+    def spec(self, name):
+        with self._lock:
+            return self._specs[name]
+
+    def loaded(self):
+        """ Returns (name, model) tuples of the loaded models, least recently used first.
+        """
+        with self._lock:
+            return [(name, slot.entry) for name, slot in self._slots.items()]
+
+    def _release(self, slot):
+        with self._lock:
+            slot.refs -= 1
+            close = slot.retired and slot.refs == 0
+        if close:
+            slot.entry.close()
+
+    def _retire(self, slot):
+        """ Removes a slot from service and returns whether it can be closed right away. Requires the lock.
+        """
+        slot.retired = True
+        return slot.refs == 0
+
+    def _evict(self, keep):
+        """ Evicts the least recently used models until the budget is met. Requires the lock.
+
+        Returns
+            The slots which have to be closed.
+        """
+        closing = []
+        if self.max_bytes is None:
+            return closing
+        while sum(slot.entry.memory_bytes for slot in self._slots.values()) > self.max_bytes:
+            name = next((n for n in self._slots if n != keep), None)
+            if name is None:
+                break
+            slot = self._slots.pop(name)
+            self._evictions += 1
+            if self._retire(slot):
+                closing.append(slot)
+        return closing
+
+    def _install(self, name, entry, mtime):
+        """ Puts a freshly loaded model in service, replacing and evicting older models.
+        """
+        with self._lock:
+            closing = []
+            old = self._slots.pop(name, None)
+            if old is not None and self._retire(old):
+                closing.append(old)
+            slot = self._slots[name] = _Slot(entry, mtime)
+            closing += self._evict(keep=name)
+        for old in closing:
+            old.entry.close()
+        return slot
+
+    def _load(self, name, spec):
+        mtime = _modified_time(spec.path)
+        return self.loader(name, spec), mtime
+
+    @contextmanager
+    def use(self, name):
+        """ Yields the loaded model registered under name, loading it if needed.
+
+        Raises
+            KeyError: if no model is registered under name.
+        """
+        with self._lock:
+            spec = self._specs[name]
+            load_lock = self._load_locks[name]
+
+        while True:
+            with self._lock:
+                slot = self._slots.get(name)
+                if slot is not None:
+                    self._slots.move_to_end(name)
+                    slot.refs += 1
+                    break
+
+            # concurrent requests for the same model wait for a single load
+            with load_lock:
+                if name in self._slots:
+                    continue
+                entry, mtime = self._load(name, spec)
+                with self._lock:
+                    self._loads += 1
+                self._install(name, entry, mtime)
+
+        try:
+            yield slot.entry
+        finally:
+            self._release(slot)
+
+    def reload(self, name, spec=None):
+        """ Loads a new snapshot of a model and swaps it in once it is ready.
+
+        Requests keep using the current model while the new one loads. If loading fails the current model stays in service.
+
+        Args
+            name : Name of a registered model.
+            spec : Optional new ModelSpec, defaults to the current one (to load a new snapshot written to the same path).
+
+        Returns
+            True if the model was reloaded.
+        """
+        with self._lock:
+            spec = spec or self._specs[name]
+            load_lock = self._load_locks[name]
+
+        with load_lock:
+            try:
+                entry, mtime = self._load(name, spec)
+            except Exception:
+                with self._lock:
+                    self._errors    += 1
+                    self._last_error = traceback.format_exc()
+                print('reloading model {} from {} failed:\n{}'.format(name, spec.path, self._last_error))
+                return False
+            with self._lock:
+                self._specs[name] = spec
+                self._reloads    += 1
+            self._install(name, entry, mtime)
+        print('model {} reloaded from {}'.format(name, spec.path))
+        return True
+
+    def reload_in_background(self, name, spec=None):
+        thread = threading.Thread(target=self.reload, args=(name, spec), name='reload-{}'.format(name), daemon=True)
+        thread.start()
+        return thread
+
+    def changed(self):
+        """ Returns the names of loaded models whose snapshot file was modified since they were loaded.
+        """
+        with self._lock:
+            loaded = [(name, self._specs[name].path, slot.mtime) for name, slot in self._slots.items()]
+        return [name for name, path, mtime in loaded if _modified_time(path) not in (None, mtime)]
+
+    def _watch(self, interval):
+        while self._watching:
+            time.sleep(interval)
+            for name in self.changed():
+                self.reload(name)
+
+    def watch(self, interval=10.0):
+        """ Starts a thread reloading loaded models whose snapshot file changes, checked every interval seconds.
+        """
+        if self._watch_thread is not None:
+            return
+        self._watching     = True
+        self._watch_thread = threading.Thread(target=self._watch, args=(interval,), name='model-watch', daemon=True)
+        self._watch_thread.start()
+
+    def stop(self):
+        """ Stops watching and closes all loaded models.
+        """
+        self._watching = False
+        with self._lock:
+            slots = list(self._slots.values())
+            self._slots.clear()
+            closing = [slot for slot in slots if self._retire(slot)]
+        for slot in closing:
+            slot.entry.close()
+
+    def statistics(self):
+        """ Returns the registered models, which of them are loaded and the load, reload and eviction counters.
+        """
+        with self._lock:
+            return {
+                'models'       : {
+                    name: {
+                        'path'         : spec.path,
+                        'backbone'     : spec.backbone_name,
+                        'loaded'       : name in self._slots,
+                        'memory_bytes' : self._slots[name].entry.memory_bytes if name in self._slots else 0,
+                        'in_use'       : self._slots[name].refs if name in self._slots else 0,
+                    }
+                    for name, spec in self._specs.items()
+                },
+                'memory_bytes' : sum(slot.entry.memory_bytes for slot in self._slots.values()),
+                'max_bytes'    : self.max_bytes,
+                'loads'        : self._loads,
+                'reloads'      : self._reloads,
+                'evictions'    : self._evictions,
+                'errors'       : self._errors,
+                'last_error'   : self._last_error,
+            }
@@ -0,0 +1,259 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import threading
+
+import cv2
+import numpy as np
+
+KEYFRAME = 'keyframe'
+MOTION   = 'motion'
+REGION   = 'region'
+TRACKED  = 'tracked'
+
+
+def _empty_detections():
+    return np.zeros((0, 4), dtype=np.float32), np.zeros((0,), dtype=np.float32), np.zeros((0,), dtype=np.int32)
+
+
+def _as_batch(boxes, scores, labels):
+    """ Sorts detections by descending score and adds the batch dimension of 1 used by retinanet_bbox.
+    """
+    order = np.argsort(-scores, kind='stable')
+    return boxes[order][None], scores[order][None], labels[order][None]
+
+
+class BoxTracker(object):
+    """ Moves boxes from one frame to the next with sparse Lucas-Kanade optical flow.
+
+    Every box is shifted by the median motion of the corners found inside it. Boxes without trackable
+    corners (like a person in uniform grass) move with the median motion of all boxes, or not at all.
+
+    Args
+        max_points : Maximum number of corners tracked per box.
+    """
+
+    def __init__(self, max_points=16):
+        self.max_points = max_points
+        self.lk_params  = dict(winSize=(15, 15), maxLevel=2, criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 10, 0.03))
+
+    def track(self, previous, current, boxes):
+        """ Moves boxes given in the coordinates of the grayscale images previous and current.
+
+        Returns
+            The moved boxes (np.array of shape (N, 4)).
+        """
+        if len(boxes) == 0:
+            return boxes
+
+        height, width = previous.shape[:2]
+        points, owners = [], []
+        for i, box in enumerate(boxes):
+            x1, y1 = max(int(box[0]), 0), max(int(box[1]), 0)
+            x2, y2 = min(int(np.ceil(box[2])) + 1, width), min(int(np.ceil(box[3])) + 1, height)
+            if x2 - x1 < 3 or y2 - y1 < 3:
+                continue
+            corners = cv2.goodFeaturesToTrack(previous[y1:y2, x1:x2], self.max_points, 0.01, 2)
+            if corners is None:
+                continue
+            points.append(corners.reshape(-1, 2) + [x1, y1])
+            owners.append(np.full(len(corners), i))
+
+        shifts = np.full((len(boxes), 2), np.nan, dtype=np.float32)
+        if points:
+            points = np.concatenate(points).astype(np.float32)
+            owners = np.concatenate(owners)
+            moved, status, _ = cv2.calcOpticalFlowPyrLK(previous, current, points.reshape(-1, 1, 2), None, **self.lk_params)
+            valid = status.reshape(-1) == 1
+            motion = (moved.reshape(-1, 2) - points)[valid]
+            owners = owners[valid]
+            for i in np.unique(owners):
+                shifts[i] = np.median(motion[owners == i], axis=0)
+
+        known = ~np.isnan(shifts[:, 0])
+        fallback = np.median(shifts[known], axis=0) if known.any() else np.zeros(2, dtype=np.float32)
+        shifts[~known] = fallback
+
+        return boxes + np.concatenate([shifts, shifts], axis=1)
+
+
+class MotionGatedDetector(object):
+    """ Runs a detector on a live stream only where and when the image changed.
+
+    Every frame is compared with the last frame the detector saw, on a small blurred grayscale copy and after
+    compensating the global (camera) shift with phase correlation. Depending on the fraction of changed pixels:
+
+    - above full_threshold, or on every keyframe_interval-th frame, the whole frame is detected (bounded staleness),
+    - above motion_threshold, only the bounding region of the changes is detected and merged with the tracked boxes,
+    - otherwise the previous detections are carried forward with a BoxTracker.
+
+    Args
+        detect            : Function taking a BGR image and returning (boxes, scores, labels) with a batch dimension of 1.
+        keyframe_interval : Maximum number of frames between full detections.
+        motion_threshold  : Fraction of changed pixels above which the changed region is detected.
+        full_threshold    : Fraction of changed pixels above which the whole frame is detected.
+        pixel_threshold   : Gray level difference for a pixel to count as changed.
+        track_threshold   : Detections below this score are not carried forward.
+        width             : Width of the grayscale copy used for change detection and tracking.
+        min_region        : Minimum side (in image pixels) of a detected region, so the detector gets some context.
+    """
+
+    def __init__(
+        self,
+        detect,
+        keyframe_interval = 10,
+        motion_threshold  = 0.002,
+        full_threshold    = 0.3,
+        pixel_threshold   = 25,
+        track_threshold   = 0.3,
+        width             = 320,
+        min_region        = 256,
+    ):
+        self.detect            = detect
+        self.keyframe_interval = keyframe_interval
+        self.motion_threshold  = motion_threshold
+        self.full_threshold    = full_threshold
+        self.pixel_threshold   = pixel_threshold
+        self.track_threshold   = track_threshold
+        self.width             = width
+        self.min_region        = min_region
+        self.tracker           = BoxTracker()
+
+        self._reference  = None
+        self._previous   = None
+        self._since      = 0
+        self._detections = _empty_detections()
+
+        self._lock   = threading.Lock()
+        self._counts = {KEYFRAME: 0, MOTION: 0, REGION: 0, TRACKED: 0}
+
+    def _gray(self, image):
+        scale = min(self.width / image.shape[1], 1.0)
+        gray  = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY) if image.ndim == 3 else image
+        gray  = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        return cv2.GaussianBlur(gray, (5, 5), 0), scale
+
+    def change_mask(self, reference, gray):
+        """ Returns the mask of changed pixels between two grayscale images after removing their global shift.
+        """
+        (dx, dy), _ = cv2.phaseCorrelate(reference.astype(np.float32), gray.astype(np.float32))
+        shift  = np.float32([[1, 0, dx], [0, 1, dy]])
+        height, width = gray.shape[:2]
+        warped = cv2.warpAffine(reference, shift, (width, height), borderMode=cv2.BORDER_REPLICATE)
+        mask   = cv2.absdiff(warped, gray) > self.pixel_threshold
+
+        # the border uncovered by the shift has no reference
+        bx, by = int(np.ceil(abs(dx))), int(np.ceil(abs(dy)))
+        if bx:
+            mask[:, :bx] = False
+            mask[:, width - bx:] = False
+        if by:
+            mask[:by] = False
+            mask[height - by:] = False
+        return mask
+
+    def _region(self, mask, scale, image_shape):
+        """ Returns the bounding box of the changed pixels in image coordinates, grown to at least min_region.
+        """
+        ys, xs = np.nonzero(mask)
+        height, width = image_shape[:2]
+        x1, y1 = xs.min() / scale, ys.min() / scale
+        x2, y2 = (xs.max() + 1) / scale, (ys.max() + 1) / scale
+
+        # grow around the center, shifting back inside the image
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        w, h   = min(max(x2 - x1, self.min_region), width), min(max(y2 - y1, self.min_region), height)
+        x1, y1 = min(max(cx - w / 2, 0), width - w), min(max(cy - h / 2, 0), height - h)
+        return int(x1), int(y1), int(np.ceil(x1 + w)), int(np.ceil(y1 + h))
+
+    def _store(self, boxes, scores, labels):
+        keep = scores >= self.track_threshold
+        self._detections = (boxes[keep].astype(np.float32), scores[keep], labels[keep])
+
+    def _track(self, gray, scale):
+        boxes, scores, labels = self._detections
+        if self._previous is not None and self._previous.shape == gray.shape:
+            boxes = self.tracker.track(self._previous, gray, boxes * scale) / scale
+        self._detections = (boxes, scores, labels)
+        return self._detections
+
+    def __call__(self, image):
+        """ Detects objects in the next frame of the stream.
+
+        Returns
+            boxes, scores, labels with a batch dimension of 1, sorted by descending score.
+        """
+        gray, scale = self._gray(image)
+
+        kind = None
+        if self._reference is None or self._reference.shape != gray.shape or self._since + 1 >= self.keyframe_interval:
+            kind = KEYFRAME
+        else:
+            mask    = self.change_mask(self._reference, gray)
+            changed = mask.mean()
+            if changed > self.full_threshold:
+                kind = MOTION
+            elif changed > self.motion_threshold:
+                kind = REGION
+            else:
+                kind = TRACKED
+
+        if kind in (KEYFRAME, MOTION):
+            boxes, scores, labels = (d[0] for d in self.detect(image))
+            valid = scores >= 0
+            self._store(boxes[valid], scores[valid], labels[valid])
+        elif kind == REGION:
+            x1, y1, x2, y2 = self._region(mask, scale, image.shape)
+            boxes, scores, labels = (d[0] for d in self.detect(image[y1:y2, x1:x2]))
+            valid = scores >= 0
+            boxes = boxes[valid] + [x1, y1, x1, y1]
+
+            # tracked boxes outside the region stay, the region is replaced by the new detections
+            old_boxes, old_scores, old_labels = self._track(gray, scale)
+            cx, cy  = (old_boxes[:, 0] + old_boxes[:, 2]) / 2, (old_boxes[:, 1] + old_boxes[:, 3]) / 2
+            outside = (cx < x1) | (cx >= x2) | (cy < y1) | (cy >= y2)
+            self._store(
+                np.concatenate([old_boxes[outside], boxes]),
+                np.concatenate([old_scores[outside], scores[valid]]),
+                np.concatenate([old_labels[outside], labels[valid]]),
+            )
+        else:
+            self._track(gray, scale)
+
+        # only full detections reset the staleness of the carried boxes
+        self._since = 0 if kind in (KEYFRAME, MOTION) else self._since + 1
+        if kind != TRACKED:
+            # the new detections match this frame, later changes are measured against it
+            self._reference = gray
+        self._previous = gray
+
+        with self._lock:
+            self._counts[kind] += 1
+        return _as_batch(*self._detections)
+
+    def statistics(self):
+        """ Returns the number of frames per decision and the reduction of full-frame detector calls.
+        """
+        with self._lock:
+            counts = dict(self._counts)
+        frames = sum(counts.values())
+        full   = counts[KEYFRAME] + counts[MOTION]
+        counts['frames']              = frames
+        counts['detector_calls']      = full + counts[REGION]
+        counts['full_frame_fraction'] = full / frames if frames else 0.0
+        return counts
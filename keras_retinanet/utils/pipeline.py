@@ -0,0 +1,243 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+class DropOldestQueue(object):
+    """ A bounded FIFO queue for live frames: put never blocks, when the queue is full the oldest item is dropped.
+
+    This way a slow consumer always gets the newest items instead of an ever older backlog.
+
+    Args
+        maxsize : Maximum number of queued items.
+    """
+
+    def __init__(self, maxsize=1):
+        if maxsize < 1:
+            raise ValueError('maxsize should be at least 1, received: {}'.format(maxsize))
+        self.maxsize = maxsize
+        self.dropped = 0
+
+        self._items     = deque()
+        self._condition = threading.Condition()
+        self._closed    = False
+
+    def __len__(self):
+        with self._condition:
+            return len(self._items)
+
+    def put(self, item):
+        """ Appends an item and returns the dropped oldest item, or None if nothing was dropped.
+        """
+        dropped = None
+        with self._condition:
+            if len(self._items) >= self.maxsize:
+                dropped = self._items.popleft()
+                self.dropped += 1
+            self._items.append(item)
+            self._condition.notify()
+        return dropped
+
+    def get_many(self, max_items=1, timeout=None):
+        """ Waits for at least one item and returns up to max_items of the queued items, oldest first.
+
+        Returns
+            A list of items, which is empty if the timeout expired or the queue was closed.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self._items or self._closed, timeout=timeout)
+            return [self._items.popleft() for _ in range(min(max_items, len(self._items)))]
+
+    def get(self, timeout=None):
+        """ Waits for an item and returns it, or None if the timeout expired or the queue was closed.
+        """
+        items = self.get_many(1, timeout=timeout)
+        return items[0] if items else None
+
+    def close(self):
+        """ Wakes up all waiting consumers, later gets only return what is still queued.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+
+    @property
+    def closed(self):
+        return self._closed
+
+
+class StreamMultiplexer(object):
+    """ Drop-oldest queues of several streams read together with per-stream fairness.
+
+    Every stream keeps at most maxsize items. get_many takes the items round-robin over the streams, one per stream
+    per round, and starts the next call after the stream served last, so a fast stream can not starve a slow one.
+
+    Args
+        streams : Number of streams.
+        maxsize : Maximum number of queued items per stream.
+    """
+
+    def __init__(self, streams, maxsize=1):
+        if maxsize < 1:
+            raise ValueError('maxsize should be at least 1, received: {}'.format(maxsize))
+        self.maxsize = maxsize
+        self.dropped = [0] * streams
+
+        self._items     = [deque() for _ in range(streams)]
+        self._open      = set(range(streams))
+        self._next      = 0
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        with self._condition:
+            return sum(len(items) for items in self._items)
+
+    def put(self, stream, item):
+        """ Appends an item to a stream and returns the dropped oldest item of that stream, or None.
+        """
+        dropped = None
+        with self._condition:
+            items = self._items[stream]
+            if len(items) >= self.maxsize:
+                dropped = items.popleft()
+                self.dropped[stream] += 1
+            items.append(item)
+            self._condition.notify()
+        return dropped
+
+    def get_many(self, max_items=1, timeout=None):
+        """ Waits for at least one item and returns up to max_items items taken round-robin over the streams.
+
+        Returns
+            A list of items, which is empty if the timeout expired or all streams were closed.
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: any(self._items) or not self._open, timeout=timeout)
+            batch   = []
+            streams = len(self._items)
+            while len(batch) < max_items and any(self._items):
+                for offset in range(streams):
+                    stream = (self._next + offset) % streams
+                    if self._items[stream]:
+                        batch.append(self._items[stream].popleft())
+                        self._next = (stream + 1) % streams
+                        break
+            return batch
+
+    def close(self, stream=None):
+        """ Marks a stream (or all streams) as finished, consumers are woken up once all streams are finished.
+        """
+        with self._condition:
+            if stream is None:
+                self._open.clear()
+            else:
+                self._open.discard(stream)
+            self._condition.notify_all()
+
+    @property
+    def closed(self):
+        return not self._open
+
+
+class RateMeter(object):
+    """ Measures the rate of events (like frames per second) over a sliding time window.
+
+    Args
+        window : Length of the window in seconds.
+    """
+
+    def __init__(self, window=5.0):
+        self.window = window
+        self.total  = 0
+
+        self._events = deque()
+        self._lock   = threading.Lock()
+
+    def tick(self, count=1, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self.total += count
+            self._events.append((now, count))
+            while self._events and self._events[0][0] < now - self.window:
+                self._events.popleft()
+
+    def rate(self, now=None):
+        """ Returns the events per second within the window.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            events = [(t, c) for t, c in self._events if t >= now - self.window]
+        if len(events) < 2:
+            return 0.0
+        elapsed = now - events[0][0]
+        # the first event only marks the start of the measured interval
+        return sum(c for _, c in events[1:]) / elapsed if elapsed > 0 else 0.0
+
+
+class LatencyMeter(object):
+    """ Keeps the most recent latency samples and summarizes them.
+
+    Args
+        size : Number of samples kept.
+    """
+
+    def __init__(self, size=300):
+        self._samples = deque(maxlen=size)
+        self._lock    = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def summary(self):
+        """ Returns mean, p50, p95 and max of the recent samples in seconds (all 0 without samples).
+        """
+        with self._lock:
+            samples = np.array(self._samples, dtype=np.float64)
+        if samples.size == 0:
+            return {'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'max': 0.0}
+        return {
+            'mean' : float(samples.mean()),
+            'p50'  : float(np.percentile(samples, 50)),
+            'p95'  : float(np.percentile(samples, 95)),
+            'max'  : float(samples.max()),
+        }
+
+
+class Frame(object):
+    """ A captured frame on its way through a pipeline.
+
+    Args
+        index    : Number of the frame in its stream.
+        image    : The BGR image.
+        captured : time.time() when the frame was read from the source, the start of its glass-to-glass latency.
+        stream   : Identifier of the source stream.
+    """
+    __slots__ = ('index', 'image', 'captured', 'stream', 'detections')
+
+    def __init__(self, index, image, captured=None, stream=0):
+        self.index      = index
+        self.image      = image
+        self.captured   = time.time() if captured is None else captured
+        self.stream     = stream
+        self.detections = None
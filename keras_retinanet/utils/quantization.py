@@ -0,0 +1,126 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+""" Post-training int8 quantization of exported models, with activation ranges calibrated on dataset images.
+"""
+
+import os
+import shutil
+
+import numpy as np
+
+from .engine import metadata_path, read_metadata
+from .export import export_tflite, write_metadata
+from .shape_buckets import ShapeBuckets
+
+QUANTIZATION_FORMATS = ('tflite', 'onnx')
+
+
+def quantized_path(path):
+    """ Returns the path of the int8 model of the exported model at path.
+    """
+    base, extension = os.path.splitext(path.rstrip('/\\'))
+    return base + '_int8' + extension
+
+
+def move_exported(path, destination):
+    """ Moves an exported model and its metadata, replacing the model at destination.
+    """
+    shutil.move(path, destination)
+    shutil.move(metadata_path(path), metadata_path(destination))
+
+
+def calibration_images(generator, count, preprocessed=False, seed=0):
+    """ Draws images from a generator to calibrate the activation ranges on, preprocessed like the model takes them.
+
+    Args
+        generator    : The generator of the calibration set.
+        count        : Number of images, all images of the generator if it has fewer.
+        preprocessed : Whether the model preprocesses uint8 images itself.
+        seed         : Seed of the drawn sample.
+
+    Returns
+        A list of images.
+    """
+    random  = np.random.RandomState(seed)
+    indices = random.choice(generator.size(), min(count, generator.size()), replace=False)
+    images  = []
+    for i in sorted(indices):
+        image = generator.load_image(i)
+        if not preprocessed:
+            image, _ = generator.preprocess_and_resize_image(image)
+        images.append(image)
+    return images
+
+
+def quantization_description(images):
+    return {'type': 'int8', 'calibration_images': len(images)}
+
+
+def quantize_tflite(model, path, input_shape, images):
+    """ Writes an int8 TFLite model of a retinanet_bbox model, calibrated on images.
+
+    Args
+        input_shape : (height, width) of the TFLite model, the images are padded or letterboxed to it.
+        images      : Preprocessed calibration images from calibration_images.
+    """
+    buckets = ShapeBuckets([input_shape])
+    fitted  = [buckets.fit(image)[0] for image in images]
+    export_tflite(model, path, input_shape, representative_images=fitted, quantization=quantization_description(images))
+
+
+def quantize_onnx(float_path, path, images, per_channel=True):
+    """ Writes an int8 version of an exported ONNX model with ONNX Runtime, calibrated on images.
+
+    Args
+        float_path  : Path of the float ONNX model, see export.export_onnx.
+        images      : Calibration images from calibration_images, padded or letterboxed to the input shape of a static model.
+        per_channel : Quantize the convolution weights per output channel, which loses less accuracy.
+    """
+    try:
+        from onnxruntime.quantization import CalibrationDataReader, QuantType, quantize_static
+    except ImportError:
+        raise ImportError('ONNX quantization needs onnxruntime, install it with: pip install onnxruntime')
+
+    metadata = read_metadata(float_path)
+
+    # a model with a static input shape only takes images of that shape
+    if metadata.get('input_shape'):
+        buckets = ShapeBuckets([tuple(metadata['input_shape'])])
+        images  = [buckets.fit(image)[0] for image in images]
+
+    class ImageReader(CalibrationDataReader):
+        def __init__(self):
+            self.images = iter(images)
+
+        def get_next(self):
+            image = next(self.images, None)
+            if image is None:
+                return None
+            return {metadata['input'] + ':0': np.expand_dims(image, axis=0)}
+
+    quantize_static(
+        float_path,
+        path,
+        ImageReader(),
+        per_channel=per_channel,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8
+    )
+    metadata['quantization'] = quantization_description(images)
+    write_metadata(path, metadata)
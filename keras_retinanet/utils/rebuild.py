@@ -0,0 +1,68 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+""" Recreation of functional models from rewritten configs, with the weights of the original model.
+"""
+
+import copy
+
+import keras
+
+
+def model_custom_objects(model):
+    """ Returns the classes of the layers and initializers of a model (nested models included), to recreate it from its config.
+    """
+    custom_objects = {}
+    for layer in model.layers:
+        custom_objects[layer.__class__.__name__] = layer.__class__
+        for attribute in ('kernel_initializer', 'bias_initializer'):
+            initializer = getattr(layer, attribute, None)
+            if initializer is not None:
+                custom_objects[initializer.__class__.__name__] = initializer.__class__
+        if isinstance(layer, keras.models.Model):
+            custom_objects.update(model_custom_objects(layer))
+    return custom_objects
+
+
+def rebuild_model(model, rewrite, custom_objects=None, weights=None):
+    """ Creates a functional model from a rewritten copy of the config of model and copies the weights of model into it.
+
+    Args
+        model          : The functional Keras model.
+        rewrite        : Function changing a copy of model.get_config() in place.
+        custom_objects : Additional custom objects, the classes used by model are found by themselves.
+        weights        : Optional dict mapping layer names to the weights of those layers, other layers get the weights
+                         of the layer of model with the same name.
+
+    Returns
+        The new keras.models.Model.
+    """
+    config = copy.deepcopy(model.get_config())
+    rewrite(config)
+
+    objects = model_custom_objects(model)
+    objects.update(custom_objects or {})
+    rebuilt = keras.models.Model.from_config(config, custom_objects=objects)
+
+    weights = weights or {}
+    for layer in rebuilt.layers:
+        if layer.name in weights:
+            layer.set_weights(weights[layer.name])
+        else:
+            layer.set_weights(model.get_layer(layer.name).get_weights())
+    return rebuilt
@@ -0,0 +1,122 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import threading
+
+import cv2
+import numpy as np
+
+
+def parse_buckets(spec):
+    """ Parses a comma separated list of WIDTHxHEIGHT shapes, like '1067x800,1333x750'.
+
+    Returns
+        A list of (height, width) tuples.
+    """
+    buckets = []
+    for item in spec.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            width, height = (int(v) for v in item.lower().split('x'))
+        except ValueError:
+            raise ValueError('Invalid shape bucket, expected WIDTHxHEIGHT: {}'.format(item))
+        if width < 1 or height < 1:
+            raise ValueError('Invalid shape bucket, expected a positive size: {}'.format(item))
+        buckets.append((height, width))
+    return buckets
+
+
+def bucket_name(bucket):
+    return '{}x{}'.format(bucket[1], bucket[0])
+
+
+class ShapeBuckets(object):
+    """ Maps images of any size to a small set of fixed shapes, so the model only ever sees (and is warmed up for) these shapes.
+
+    An image fitting in a bucket is padded at the bottom and right to the smallest such bucket, which keeps the
+    box coordinates unchanged. A larger image is letterboxed: it is downscaled to fit in the bucket which keeps
+    the most resolution and then padded. Since the images are padded after preprocessing, zero padding equals
+    the mean color.
+
+    Args
+        buckets : List of (height, width) tuples.
+    """
+
+    def __init__(self, buckets):
+        if not buckets:
+            raise ValueError('At least one shape bucket is required.')
+        # smallest bucket first, so the first fitting bucket wastes the least padding
+        self.buckets = sorted(set(tuple(b) for b in buckets), key=lambda b: (b[0] * b[1], b))
+
+        self._lock  = threading.Lock()
+        self._stats = {b: [0, 0.0, 0] for b in self.buckets}
+
+    def select(self, height, width):
+        """ Returns the bucket for an image of the given size and the scale the image needs to fit in it.
+        """
+        for bucket in self.buckets:
+            if height <= bucket[0] and width <= bucket[1]:
+                return bucket, 1.0
+
+        scales = [min(b[0] / height, b[1] / width) for b in self.buckets]
+        best   = int(np.argmax(scales))
+        return self.buckets[best], scales[best]
+
+    def fit(self, image):
+        """ Pads or letterboxes a preprocessed image of shape (H, W, C) to its bucket.
+
+        Returns
+            The image with the shape of the bucket, the scale applied to it (1.0 if it was only padded)
+            and the fraction of the bucket which is padding.
+        """
+        height, width = image.shape[:2]
+        bucket, scale = self.select(height, width)
+        if scale < 1.0:
+            # never exceed the bucket because of rounding
+            width  = min(int(round(width * scale)), bucket[1])
+            height = min(int(round(height * scale)), bucket[0])
+            image  = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+            if image.ndim == 2:
+                image = image[..., None]
+
+        padded = np.zeros(bucket + image.shape[2:], dtype=image.dtype)
+        padded[:height, :width] = image
+
+        padding = 1.0 - (height * width) / (bucket[0] * bucket[1])
+        with self._lock:
+            stats     = self._stats[bucket]
+            stats[0] += 1
+            stats[1] += padding
+            stats[2] += scale < 1.0
+
+        return padded, scale, padding
+
+    def statistics(self):
+        """ Returns the number of images per bucket and the mean fraction of padding in them.
+        """
+        with self._lock:
+            return {
+                bucket_name(bucket): {
+                    'images'             : images,
+                    'letterboxed'        : letterboxed,
+                    'mean_padding_ratio' : padding / images if images else 0.0,
+                }
+                for bucket, (images, padding, letterboxed) in self._stats.items()
+            }
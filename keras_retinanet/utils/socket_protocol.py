@@ -0,0 +1,271 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+""" Length-prefixed binary protocol of the Unix domain socket detection server.
+
+Every message starts with a fixed little-endian header. A request is
+
+    REQUEST_HEADER (payload length, kind, priority, model name length, height, width, threshold, timeout in ms)
+    model name (utf8, may be empty for the default model)
+    payload
+
+where the payload is an encoded JPEG/PNG (KIND_ENCODED), height * width * 3 uint8 BGR pixels (KIND_RAW) or the
+utf8 name of a shared memory block holding those pixels (KIND_SHARED_MEMORY). A response is
+
+    RESPONSE_HEADER (status, count)
+    count float32 boxes (x1, y1, x2, y2), count float32 scores and count int32 labels   if status is STATUS_OK
+    count bytes of utf8 error message                                                 otherwise
+
+Only detections with a score of at least the threshold are returned, sorted by descending score.
+A connection can be used for any number of requests, one at a time. The server discards a request with a larger
+payload or model name than it allows without buffering it and answers it with STATUS_BAD_REQUEST.
+"""
+
+import socket
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # python < 3.8
+    shared_memory = None
+
+KIND_ENCODED       = 0
+KIND_RAW           = 1
+KIND_SHARED_MEMORY = 2
+
+STATUS_OK                = 0
+STATUS_BAD_REQUEST       = 1
+STATUS_NOT_FOUND         = 2
+STATUS_BUSY              = 3
+STATUS_DEADLINE_EXCEEDED = 4
+STATUS_ERROR             = 5
+
+MAX_MODEL_NAME_LENGTH = 256
+
+REQUEST_HEADER  = struct.Struct('<IBBHIIfI')
+RESPONSE_HEADER = struct.Struct('<BI')
+
+Request = namedtuple('Request', ['kind', 'priority', 'model_name', 'height', 'width', 'threshold', 'timeout', 'payload'])
+
+
+class SocketProtocolError(Exception):
+    """ Raised by the client when the server answers with an error status.
+    """
+
+    def __init__(self, status, message):
+        super(SocketProtocolError, self).__init__(message)
+        self.status = status
+
+
+class RequestTooLargeError(ValueError):
+    """ Raised by read_request when a request claims more bytes than allowed, after its message was discarded.
+    """
+    pass
+
+
+def recv_exactly(sock, size):
+    """ Receives exactly size bytes into a new buffer.
+
+    Returns
+        A bytearray, or None if the connection was closed before the first byte.
+
+    Raises
+        ConnectionError: if the connection was closed within the message.
+    """
+    buffer = bytearray(size)
+    view   = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            if received == 0:
+                return None
+            raise ConnectionError('Connection closed within a message.')
+        received += count
+    return buffer
+
+
+def discard_exactly(sock, size, chunk_size=2 ** 16):
+    """ Receives and drops size bytes in small chunks, so a message can be skipped without buffering it.
+
+    Raises
+        ConnectionError: if the connection was closed within the message.
+    """
+    buffer = bytearray(min(size, chunk_size))
+    while size > 0:
+        count = sock.recv_into(buffer, min(size, chunk_size))
+        if count == 0:
+            raise ConnectionError('Connection closed within a message.')
+        size -= count
+
+
+def send_request(sock, payload, kind=KIND_ENCODED, height=0, width=0, threshold=0.5, model_name=None, priority=0, timeout=0):
+    """ Sends a request, payload is any bytes-like object (like a contiguous np.array), sent without copying.
+    """
+    name    = (model_name or '').encode('utf8')
+    payload = memoryview(payload).cast('B')
+    header  = REQUEST_HEADER.pack(len(payload), kind, priority, len(name), height, width, threshold, int(timeout * 1000))
+    sock.sendall(header + name)
+    sock.sendall(payload)
+
+
+def read_request(sock, max_payload_size=None):
+    """ Reads the next request of a connection.
+
+    Args
+        sock             : The connected socket.
+        max_payload_size : Largest payload in bytes which is read, None for no limit.
+
+    Returns
+        A Request, or None if the client closed the connection.
+
+    Raises
+        RequestTooLargeError: if the payload or the model name is larger than allowed, the request is then discarded
+                              without allocating them and the next request can be read.
+    """
+    header = recv_exactly(sock, REQUEST_HEADER.size)
+    if header is None:
+        return None
+    length, kind, priority, name_length, height, width, threshold, timeout = REQUEST_HEADER.unpack(header)
+    error = None
+    if name_length > MAX_MODEL_NAME_LENGTH:
+        error = 'Model name of {} bytes is longer than {} bytes.'.format(name_length, MAX_MODEL_NAME_LENGTH)
+    elif max_payload_size is not None and length > max_payload_size:
+        error = 'Payload of {} bytes is larger than {} bytes.'.format(length, max_payload_size)
+    if error is not None:
+        discard_exactly(sock, name_length + length)
+        raise RequestTooLargeError(error)
+    name    = recv_exactly(sock, name_length) if name_length else b''
+    payload = recv_exactly(sock, length) if length else bytearray()
+    if name is None or payload is None:
+        raise ConnectionError('Connection closed within a message.')
+    return Request(kind, priority, name.decode('utf8') or None, height, width, threshold, timeout / 1000.0, payload)
+
+
+def send_detections(sock, boxes, scores, labels, threshold=0.0):
+    """ Sends the detections of one image, given with or without the batch dimension of retinanet_bbox.
+    """
+    boxes  = np.asarray(boxes).reshape(-1, 4)
+    scores = np.asarray(scores).reshape(-1)
+    labels = np.asarray(labels).reshape(-1)
+    keep   = scores >= threshold
+    boxes, scores, labels = boxes[keep], scores[keep], labels[keep]
+    order = np.argsort(-scores, kind='stable')
+    sock.sendall(b''.join((
+        RESPONSE_HEADER.pack(STATUS_OK, len(order)),
+        boxes[order].astype('<f4').tobytes(),
+        scores[order].astype('<f4').tobytes(),
+        labels[order].astype('<i4').tobytes(),
+    )))
+
+
+def send_error(sock, status, message):
+    message = str(message).encode('utf8')
+    sock.sendall(RESPONSE_HEADER.pack(status, len(message)) + message)
+
+
+def read_response(sock):
+    """ Reads the response to a request.
+
+    Returns
+        boxes (np.array of shape (N, 4)), scores (N,) and labels (N,).
+
+    Raises
+        SocketProtocolError: if the server answered with an error.
+        ConnectionError: if the server closed the connection.
+    """
+    header = recv_exactly(sock, RESPONSE_HEADER.size)
+    if header is None:
+        raise ConnectionError('Connection closed by the server.')
+    status, count = RESPONSE_HEADER.unpack(header)
+    if status != STATUS_OK:
+        message = recv_exactly(sock, count) if count else b''
+        raise SocketProtocolError(status, bytes(message).decode('utf8'))
+
+    data   = recv_exactly(sock, count * 24) if count else bytearray()
+    boxes  = np.frombuffer(data, dtype='<f4', count=count * 4).reshape(count, 4)
+    scores = np.frombuffer(data, dtype='<f4', count=count, offset=count * 16)
+    labels = np.frombuffer(data, dtype='<i4', count=count, offset=count * 20)
+    return boxes, scores, labels
+
+
+def attach_shared_memory(name):
+    """ Attaches to a shared memory block created by another process, without taking over its cleanup.
+    """
+    if shared_memory is None:
+        raise ValueError('Shared memory requires python 3.8 or newer.')
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # python < 3.13 registers attached blocks too, so they would be unlinked when this process exits
+        block = shared_memory.SharedMemory(name=name)
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(block._name, 'shared_memory')
+        return block
+
+
+class DetectionClient(object):
+    """ Client of the Unix domain socket detection server.
+
+    Args
+        path    : Path of the server socket.
+        timeout : Socket timeout in seconds, None to wait forever.
+    """
+
+    def __init__(self, path, timeout=None):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(timeout)
+        self.sock.connect(path)
+
+    def _call(self, payload, **kwargs):
+        send_request(self.sock, payload, **kwargs)
+        return read_response(self.sock)
+
+    def detect_encoded(self, data, threshold=0.5, model_name=None, priority=0, timeout=0):
+        """ Detects objects in an encoded JPEG/PNG image.
+        """
+        return self._call(data, kind=KIND_ENCODED, threshold=threshold, model_name=model_name, priority=priority, timeout=timeout)
+
+    def detect_image(self, image, threshold=0.5, model_name=None, priority=0, timeout=0):
+        """ Detects objects in a uint8 BGR image of shape (H, W, 3), sent as raw pixels.
+        """
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        return self._call(
+            image, kind=KIND_RAW, height=image.shape[0], width=image.shape[1],
+            threshold=threshold, model_name=model_name, priority=priority, timeout=timeout
+        )
+
+    def detect_shared_memory(self, name, height, width, threshold=0.5, model_name=None, priority=0, timeout=0):
+        """ Detects objects in a uint8 BGR image of shape (height, width, 3) stored in the shared memory block name.
+        """
+        return self._call(
+            name.encode('utf8'), kind=KIND_SHARED_MEMORY, height=height, width=width,
+            threshold=threshold, model_name=model_name, priority=priority, timeout=timeout
+        )
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
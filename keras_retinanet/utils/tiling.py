@@ -0,0 +1,185 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import threading
+import time
+
+import numpy as np
+
+from .grid_cropper import ImageGridCropper
+from .image import preprocess_image
+
+
+def non_max_suppression(boxes, scores, labels=None, threshold=0.5, metric='iou'):
+    """ Greedy non maximum suppression, the overlap of each kept box is computed against all remaining boxes at once.
+
+    Args
+        boxes     : np.array of shape (N, 4) with (x1, y1, x2, y2) boxes.
+        scores    : np.array of shape (N,) with the scores of the boxes.
+        labels    : Optional np.array of shape (N,), if given boxes only suppress boxes with the same label.
+        threshold : Boxes overlapping more than this with a higher scoring box are removed.
+        metric    : One of 'iou' (intersection over union) or 'ios' (intersection over the smaller box).
+                    'ios' also removes the partial boxes of objects cut by a tile border.
+
+    Returns
+        Indices of the kept boxes, sorted by descending score.
+    """
+    if metric not in ('iou', 'ios'):
+        raise ValueError('Unknown overlap metric: {}'.format(metric))
+
+    if len(boxes) == 0:
+        return np.empty((0,), dtype=np.int64)
+
+    boxes = boxes.astype(np.float64)
+    if labels is not None:
+        # move boxes with different labels apart so they never overlap
+        offset = boxes.max() + 1
+        boxes  = boxes + (labels.astype(np.float64) * offset)[:, None]
+
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = np.maximum(x2 - x1, 0) * np.maximum(y2 - y1, 0)
+    order = np.argsort(-scores, kind='stable')
+
+    keep = []
+    while order.size > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+
+        w     = np.maximum(0.0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h     = np.maximum(0.0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = w * h
+        if metric == 'iou':
+            denominator = areas[i] + areas[rest] - inter
+        else:
+            denominator = np.minimum(areas[i], areas[rest])
+        overlap = inter / np.maximum(denominator, np.finfo(np.float64).eps)
+
+        order = rest[overlap <= threshold]
+
+    return np.array(keep, dtype=np.int64)
+
+
+class TiledPredictor(object):
+    """ Runs a detection model on overlapping native resolution tiles of an image.
+
+    The image is cut with ImageGridCropper, the tiles are sent to the model in batches of batch_size
+    (the last batch is padded so every call has the same shape), the boxes are moved back to image
+    coordinates and duplicates from the overlap zones are removed with non_max_suppression.
+
+    Args
+        predict          : Function taking a batch of preprocessed tiles and returning (boxes, scores, labels) like retinanet_bbox.
+        tile_width       : Width of a tile.
+        tile_height      : Height of a tile.
+        overlap_width    : Horizontal overlap between neighbouring tiles.
+        overlap_height   : Vertical overlap between neighbouring tiles.
+        batch_size       : Number of tiles per model call.
+        score_threshold  : Detections below this score are discarded before merging.
+        nms_threshold    : Overlap above which detections from different tiles are merged.
+        nms_metric       : Overlap metric used for merging, see non_max_suppression.
+        preprocess_image : Function handler for preprocessing a tile for the network.
+    """
+
+    def __init__(
+        self,
+        predict,
+        tile_width       = 1024,
+        tile_height      = 1024,
+        overlap_width    = 128,
+        overlap_height   = 128,
+        batch_size       = 4,
+        score_threshold  = 0.05,
+        nms_threshold    = 0.5,
+        nms_metric       = 'ios',
+        preprocess_image = preprocess_image,
+    ):
+        self.predict          = predict
+        self.cropper          = ImageGridCropper(tile_width, tile_height, overlap_width, overlap_height, 0)
+        self.batch_size       = batch_size
+        self.score_threshold  = score_threshold
+        self.nms_threshold    = nms_threshold
+        self.nms_metric       = nms_metric
+        self.preprocess_image = preprocess_image
+
+        self._lock      = threading.Lock()
+        self._tiles     = 0
+        self._tile_time = 0.0
+
+    def _predict_tiles(self, image, tiles, **kwargs):
+        """ Runs the model on a list of tiles and returns the detections in image coordinates.
+        """
+        tile_w, tile_h = self.cropper.window_w, self.cropper.window_h
+        channels = image.shape[2]
+
+        all_boxes, all_scores, all_labels = [], [], []
+        for start in range(0, len(tiles), self.batch_size):
+            batch_tiles = tiles[start:start + self.batch_size]
+
+            # zero padding equals the mean color after preprocessing
+            batch = np.zeros((self.batch_size, tile_h, tile_w, channels), dtype=np.float32)
+            for i, tile in enumerate(batch_tiles):
+                crop = image[tile.ymin:tile.ymax, tile.xmin:tile.xmax]
+                batch[i, :crop.shape[0], :crop.shape[1]] = self.preprocess_image(crop)
+
+            boxes, scores, labels = self.predict(batch, **kwargs)[:3]
+
+            for i, tile in enumerate(batch_tiles):
+                indices = np.where(scores[i] > self.score_threshold)[0]
+                all_boxes.append(boxes[i, indices] + [tile.xmin, tile.ymin, tile.xmin, tile.ymin])
+                all_scores.append(scores[i, indices])
+                all_labels.append(labels[i, indices])
+
+        return np.concatenate(all_boxes), np.concatenate(all_scores), np.concatenate(all_labels)
+
+    def __call__(self, image, **kwargs):
+        """ Detects objects in a full resolution image.
+
+        Args
+            image  : np.array of shape (H, W, C), not preprocessed.
+            kwargs : Passed on to predict.
+
+        Returns
+            boxes, scores, labels with a batch dimension of 1 (like retinanet_bbox), sorted by descending score.
+        """
+        height, width = image.shape[:2]
+        tiles = self.cropper.get_image_grid(width, height)
+
+        start = time.time()
+        boxes, scores, labels = self._predict_tiles(image, tiles, **kwargs)
+        elapsed = time.time() - start
+
+        with self._lock:
+            self._tiles     += len(tiles)
+            self._tile_time += elapsed
+
+        # tiles exceeding the image may produce boxes in the padding
+        np.clip(boxes[:, 0::2], 0, width - 1, out=boxes[:, 0::2])
+        np.clip(boxes[:, 1::2], 0, height - 1, out=boxes[:, 1::2])
+
+        keep = non_max_suppression(boxes, scores, labels, threshold=self.nms_threshold, metric=self.nms_metric)
+
+        return boxes[keep][None], scores[keep][None], labels[keep][None]
+
+    def statistics(self):
+        """ Returns the number of processed tiles and the tile throughput.
+        """
+        with self._lock:
+            return {
+                'tiles'            : self._tiles,
+                'tiles_per_second' : self._tiles / self._tile_time if self._tile_time else 0.0,
+            }
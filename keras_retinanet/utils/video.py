@@ -0,0 +1,225 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import csv
+import io
+import json
+import multiprocessing
+import os
+from collections import deque, namedtuple
+
+import cv2
+
+from .image import compute_resize_scale, fast_resize
+
+VideoInfo = namedtuple('VideoInfo', ['fps', 'frame_count', 'width', 'height'])
+
+CSV_FIELDS = ['frame', 'time', 'name', 'score', 'xmin', 'ymin', 'xmax', 'ymax']
+
+
+def video_info(path):
+    """ Reads the frame rate, frame count and frame size of a video file.
+
+    Raises
+        IOError: if the video can not be opened.
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        if not cap.isOpened():
+            raise IOError('Unable to open video: {}'.format(path))
+        return VideoInfo(
+            fps=cap.get(cv2.CAP_PROP_FPS) or 25.0,
+            frame_count=int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+            width=int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            height=int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        )
+    finally:
+        cap.release()
+
+
+def sample_frames(frame_count, fps, target_fps=None, start=0):
+    """ Returns the indices of the frames to process, one per 1 / target_fps seconds (every frame if target_fps is None).
+
+    Args
+        frame_count : Number of frames in the video.
+        fps         : Frame rate of the video.
+        target_fps  : Desired sampling rate, at most fps.
+        start       : First frame index which may be returned.
+    """
+    if not target_fps or target_fps >= fps:
+        return list(range(start, frame_count))
+
+    step    = fps / target_fps
+    indices = []
+    k       = int(-(-start // step))  # first sample at or after start
+    while True:
+        index = int(round(k * step))
+        if index >= frame_count:
+            break
+        if index >= start:
+            indices.append(index)
+        k += 1
+    return indices
+
+
+def decode_frames(path, indices, min_side=800, max_side=1333, seek_gap=None):
+    """ Decodes the given (sorted) frames of a video and resizes them for the network.
+
+    The frames are resized as uint8 images, which makes them 4 times smaller to send between processes.
+
+    Args
+        path     : Path of the video.
+        indices  : Sorted frame indices to decode.
+        min_side : See resize_image, None keeps the frames at their original size.
+        max_side : See resize_image.
+        seek_gap : Frames further apart than this are reached by seeking instead of skipping (defaults to 2 seconds of video).
+
+    Returns
+        A list of (index, image, scale) tuples, frames which could not be read are left out.
+    """
+    cap = cv2.VideoCapture(path)
+    try:
+        if seek_gap is None:
+            seek_gap = int(2 * (cap.get(cv2.CAP_PROP_FPS) or 25))
+
+        frames   = []
+        position = None
+        for index in indices:
+            if position is None or index < position or index - position > seek_gap:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+                position = index
+            # skipped frames are not converted to BGR
+            while position < index and cap.grab():
+                position += 1
+            ret, image = cap.read()
+            if not ret:
+                break
+            position = index + 1
+
+            scale = 1 if min_side is None else compute_resize_scale(image.shape, min_side=min_side, max_side=max_side)
+            frames.append((index, fast_resize(image, scale), scale))
+        return frames
+    finally:
+        cap.release()
+
+
+def _decode_segment(args):
+    return decode_frames(*args)
+
+
+class ParallelDecoder(object):
+    """ Decodes segments of a video in worker processes and yields the frames in order.
+
+    At most 2 * workers segments are decoded or waiting at once, so memory stays bounded however long the video is.
+    The workers are forked when the decoder is created, so create it before loading a TensorFlow model.
+
+    Args
+        path         : Path of the video.
+        workers      : Number of decoding processes.
+        segment_size : Number of frames decoded per task.
+        min_side     : See resize_image.
+        max_side     : See resize_image.
+    """
+
+    def __init__(self, path, workers=4, segment_size=32, min_side=800, max_side=1333):
+        self.path         = path
+        self.workers      = workers
+        self.segment_size = segment_size
+        self.min_side     = min_side
+        self.max_side     = max_side
+        self._pool        = multiprocessing.get_context('fork').Pool(workers)
+
+    def decode(self, indices):
+        """ Yields (index, image, scale) for the given frame indices in order.
+        """
+        segments = (indices[i:i + self.segment_size] for i in range(0, len(indices), self.segment_size))
+        pending  = deque()
+        for segment in segments:
+            if len(pending) >= 2 * self.workers:
+                yield from pending.popleft().get()
+            pending.append(self._pool.apply_async(_decode_segment, ((self.path, segment, self.min_side, self.max_side),)))
+        while pending:
+            yield from pending.popleft().get()
+
+    def close(self):
+        self._pool.terminate()
+        self._pool.join()
+
+
+def _truncate_partial_line(path):
+    """ Removes an incomplete last line (from an interrupted write) and returns the complete lines.
+    """
+    with open(path, 'rb+') as f:
+        data = f.read()
+        end  = data.rfind(b'\n') + 1
+        if end != len(data):
+            f.truncate(end)
+    return data[:end].decode('utf8').splitlines()
+
+
+class DetectionWriter(object):
+    """ Appends per-frame detections to a JSON lines or CSV file and finds where an interrupted run stopped.
+
+    JSON lines files get one object {"frame", "time", "objects"} per frame. CSV files get one row per detection,
+    and a row with empty detection fields for frames without detections, so every finished frame is recorded.
+
+    Args
+        path   : Output file, the format follows the extension (.csv, anything else is JSON lines) unless fmt is given.
+        resume : Keep the frames already in the file and continue after them, otherwise the file is overwritten.
+        fmt    : 'json' or 'csv'.
+    """
+
+    def __init__(self, path, resume=True, fmt=None):
+        self.path       = path
+        self.fmt        = fmt or ('csv' if path.lower().endswith('.csv') else 'json')
+        self.last_frame = None
+
+        if self.fmt not in ('json', 'csv'):
+            raise ValueError('Unknown output format: {}'.format(self.fmt))
+
+        exists = resume and os.path.isfile(path) and os.path.getsize(path) > 0
+        if exists:
+            self.last_frame = self._last_frame(_truncate_partial_line(path))
+        self._file = open(path, 'a' if exists else 'w', newline='')
+        if self.fmt == 'csv':
+            self._csv = csv.writer(self._file)
+            if not exists:
+                self._csv.writerow(CSV_FIELDS)
+
+    def _last_frame(self, lines):
+        if self.fmt == 'json':
+            return json.loads(lines[-1])['frame'] if lines else None
+        rows = list(csv.reader(io.StringIO('\n'.join(lines[1:]))))
+        return int(rows[-1][0]) if rows else None
+
+    def write(self, frame, time, objects):
+        """ Writes the detections of a frame, objects is a list of dicts as returned by the servers.
+        """
+        if self.fmt == 'json':
+            self._file.write(json.dumps({'frame': frame, 'time': round(time, 3), 'objects': objects}, separators=(',', ':')) + '\n')
+        elif not objects:
+            self._csv.writerow([frame, round(time, 3), '', '', '', '', '', ''])
+        else:
+            for obj in objects:
+                self._csv.writerow([frame, round(time, 3)] + [obj[field] for field in CSV_FIELDS[2:]])
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
@@ -0,0 +1,176 @@
+'''
+https://github.com/lacmus-foundation/lacmus
+Copyright (C) 2019-2020 lacmus-foundation
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program. If not, see <https://www.gnu.org/licenses/>.
+'''
+
+import multiprocessing
+import queue
+import threading
+import traceback
+
+from .cpu import split_cores
+
+
+class WorkerError(RuntimeError):
+    """ Raised in the dispatcher when a worker failed to handle a request.
+    """
+    pass
+
+
+def _worker_loop(conn, index, cores, initializer, handler, forward_exceptions):
+    try:
+        initializer(index, cores)
+    except Exception:
+        conn.send(('error', traceback.format_exc()))
+        return
+    conn.send(('ready', None))
+
+    while True:
+        try:
+            payload = conn.recv()
+        except EOFError:
+            return
+        if payload is None:
+            return
+
+        try:
+            conn.send(('ok', handler(payload)))
+        except forward_exceptions as e:
+            conn.send(('raise', e))
+        except Exception:
+            conn.send(('error', traceback.format_exc()))
+
+
+class _Worker(object):
+    def __init__(self, index, cores):
+        self.index   = index
+        self.cores   = cores
+        self.conn    = None
+        self.process = None
+
+
+class WorkerPool(object):
+    """ A pool of forked worker processes, each request is dispatched to an idle worker.
+
+    Everything the parent holds before start() is shared copy-on-write with the workers, so large
+    read-only data (like model weights) should be loaded before starting the pool. The workers are
+    started with the 'fork' method, so the parent must not have created a TensorFlow session yet.
+
+    Args
+        initializer : Function called as initializer(index, cores) in every worker after forking.
+        handler     : Function called as handler(payload) in a worker for every request, its result is sent back.
+        num_workers        : Number of worker processes.
+        cores              : Cores to split between the workers (defaults to all available cores).
+        forward_exceptions : Tuple of (picklable) exception types which are raised as they are in the dispatcher
+                             when the handler raises them, instead of as a WorkerError.
+    """
+
+    def __init__(self, initializer, handler, num_workers, cores=None, forward_exceptions=()):
+        self.initializer        = initializer
+        self.handler            = handler
+        self.forward_exceptions = tuple(forward_exceptions)
+        self.workers     = [_Worker(i, c) for i, c in enumerate(split_cores(num_workers, cores))]
+
+        self._context   = multiprocessing.get_context('fork')
+        self._idle      = []
+        self._condition = threading.Condition()
+        self._lock      = threading.Lock()
+
+    def _spawn(self, worker):
+        parent_conn, child_conn = self._context.Pipe()
+        worker.conn    = parent_conn
+        worker.process = self._context.Process(
+            target=_worker_loop,
+            args=(child_conn, worker.index, worker.cores, self.initializer, self.handler, self.forward_exceptions),
+            name='worker-{}'.format(worker.index),
+            daemon=True,
+        )
+        worker.process.start()
+        child_conn.close()
+
+        status, error = worker.conn.recv()
+        if status != 'ready':
+            raise WorkerError('Worker {} failed to start:\n{}'.format(worker.index, error))
+
+    def start(self):
+        """ Forks the workers and waits until all of them are initialized.
+        """
+        for worker in self.workers:
+            self._spawn(worker)
+        for worker in self.workers:
+            self._release(worker)
+        return self
+
+    def stop(self):
+        """ Stops all workers.
+        """
+        for worker in self.workers:
+            if worker.process is None:
+                continue
+            try:
+                worker.conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+            worker.process = None
+
+    def idle_workers(self):
+        with self._condition:
+            return len(self._idle)
+
+    def _acquire(self, timeout, reserve):
+        with self._condition:
+            if not self._condition.wait_for(lambda: len(self._idle) > reserve, timeout=timeout):
+                raise queue.Empty()
+            return self._idle.pop()
+
+    def _release(self, worker):
+        with self._condition:
+            self._idle.append(worker)
+            self._condition.notify_all()
+
+    def run(self, payload, timeout=None, reserve=0):
+        """ Sends payload to the first idle worker and returns the result of its handler.
+
+        Args
+            payload : The request passed to the handler of the worker.
+            timeout : Maximum time (in seconds) to wait for an idle worker.
+            reserve : Only take a worker if more than this many are idle, which keeps workers free for more urgent requests.
+
+        Raises
+            queue.Empty: if no worker became idle within timeout seconds.
+            WorkerError: if the handler raised an exception or the worker died.
+            Any of forward_exceptions raised by the handler.
+        """
+        worker = self._acquire(timeout, reserve)
+        try:
+            worker.conn.send(payload)
+            status, result = worker.conn.recv()
+        except (EOFError, BrokenPipeError, OSError):
+            # the worker died, replace it before handing it out again
+            with self._lock:
+                self._spawn(worker)
+            raise WorkerError('Worker {} died while handling a request.'.format(worker.index))
+        finally:
+            self._release(worker)
+
+        if status == 'raise':
+            raise result
+        if status == 'error':
+            raise WorkerError(result)
+        return result
@@ -1,92 +1,242 @@
-import keras
-# import keras_retinanet
-import tensorflow as tf
-from keras_retinanet import models
-from keras_retinanet.utils.image import read_image_bgr, preprocess_image, resize_image
+from keras_retinanet.utils.cpu import session_config
+from keras_retinanet.utils.engine import ENGINES, create_engine, engine_name
+from keras_retinanet.utils.image import read_image_bgr, preprocess_and_resize
 from keras_retinanet.utils.visualization import draw_box, draw_caption
 from keras_retinanet.utils.colors import label_color
+from keras_retinanet.utils.pipeline import Frame, LatencyMeter, RateMeter, StreamMultiplexer
+from keras_retinanet.utils.motion import MotionGatedDetector
+from keras_retinanet.utils.video import DetectionWriter
 # import miscellaneous modules
-import matplotlib.pyplot as plt
 import cv2
 import argparse
 import sys
 import os
+import threading
 import numpy as np
 import time
+from collections import OrderedDict
+from functools import partial
 
-def run_detection_image(model, image):
-    with graph.as_default():
-        # preprocess image for network
-        image = preprocess_image(image)
-        image, scale = resize_image(image)
-
-        # process image
-        start = time.time()
-        boxes, scores, labels = model.predict_on_batch(np.expand_dims(image, axis=0))
+def run_detection_batch(model, images):
+    """ Runs the model on a list of BGR images and returns the detections of every image in image coordinates.
 
-        # correct for image scale
-        boxes /= scale
-        return boxes, scores, labels
+    Images which have the same shape after resizing are run as one batch.
+    """
+    groups = OrderedDict()
+    for i, image in enumerate(images):
+        if in_graph_preprocessing:
+            # the model resizes the uint8 image itself and returns boxes in its coordinates
+            scale = 1.0
+        else:
+            # resize and preprocess image for network
+            image, scale = preprocess_and_resize(image)
+        groups.setdefault(image.shape, []).append((i, image, scale))
+
+    detections = [None] * len(images)
+    for group in groups.values():
+        boxes, scores, labels = model.predict(np.stack([image for _, image, _ in group], axis=0))
+        for j, (i, _, scale) in enumerate(group):
+            # correct for image scale
+            detections[i] = (boxes[j:j + 1] / scale, scores[j:j + 1], labels[j:j + 1])
+    return detections
 
-def get_session():
-    config = tf.ConfigProto()
-    config.gpu_options.allow_growth = True
-    session = tf.Session(config=config)
-    return session
+def run_detection_image(model, image):
+    return run_detection_batch(model, [image])[0]
 
 def load_model(args):
-    keras.backend.tensorflow_backend.set_session(get_session())
     model_path = args.model
-    # load retinanet model
+    engine = args.engine if args.engine != 'auto' else engine_name(model_path)
+    # load retinanet model, onnxruntime and tflite run without tensorflow
     global model
-    model = models.load_model(model_path, backbone_name='resnet50')
+    model = create_engine(model_path, engine, backbone_name='resnet50', config=session_config() if engine in ('keras', 'tf') else None)
     # load label to names mapping for visualization purposes
     global labels_to_names
     labels_to_names = {0: 'Pedestrian'}
-    global graph
-    graph = tf.get_default_graph()
+    global in_graph_preprocessing
+    in_graph_preprocessing = model.preprocessed
     print('model loaded')
     return model, labels_to_names
 
+def capture_loop(cap, stream, frames, stop, capture_rate):
+    """ Reads frames of one stream as fast as the source delivers them, so they never pile up in the driver buffer.
+    """
+    index = 0
+    while not stop.is_set() and cap.isOpened():
+        ret, image = cap.read()
+        if not ret:
+            break
+        frames.put(stream, Frame(index, image, stream=stream))
+        capture_rate.tick()
+        index += 1
+    frames.close(stream)
+
+def inference_loop(frames, results, batch_size, inference_rates, gates=None):
+    """ Runs the model on the newest frames of all streams, up to batch_size at once taken round-robin over the streams,
+    or frame by frame through the motion gate of each stream.
+    """
+    while True:
+        batch = frames.get_many(batch_size)
+        if not batch:
+            if frames.closed:
+                break
+            continue
+        if gates is not None:
+            detections = [gates[frame.stream](frame.image) for frame in batch]
+        else:
+            detections = run_detection_batch(model, [frame.image for frame in batch])
+        for frame, frame_detections in zip(batch, detections):
+            frame.detections = frame_detections
+            results.put(frame.stream, frame)
+            inference_rates[frame.stream].tick()
+    results.close()
+
+def draw_detections(image, detections, threshold=0.5):
+    boxes, scores, labels = detections
+    for box, score, label in zip(boxes[0], scores[0], labels[0]):
+        # scores are sorted so we can break
+        if score < threshold:
+            break
+
+        color = label_color(label)
+
+        b = box.astype(int)
+        draw_box(image, b, color=color)
+
+        caption = "{} {:.3f}".format(labels_to_names[label], score)
+        draw_caption(image, b, caption)
+
+def format_objects(detections, threshold=0.5):
+    boxes, scores, labels = detections
+    objects = []
+    for box, score, label in zip(boxes[0], scores[0], labels[0]):
+        # scores are sorted so we can break
+        if score < threshold:
+            break
+        b = box.astype(int)
+        objects.append({
+            'name': labels_to_names[label],
+            'score': round(float(score), 4),
+            'xmin': int(b[0]),
+            'ymin': int(b[1]),
+            'xmax': int(b[2]),
+            'ymax': int(b[3])
+        })
+    return objects
+
+def report(captures, capture_rates, inference_rates, latencies, frames, results, gates=None):
+    for stream, capture in enumerate(captures):
+        summary = latencies[stream].summary()
+        print('[{}] capture {:.1f} fps | inference {:.1f} fps | glass-to-glass {:.0f} ms mean, {:.0f} ms p95 | dropped {} before inference, {} before render'.format(
+            capture, capture_rates[stream].rate(), inference_rates[stream].rate(), summary['mean'] * 1000, summary['p95'] * 1000,
+            frames.dropped[stream], results.dropped[stream]
+        ))
+        if gates is not None:
+            stats = gates[stream].statistics()
+            print('[{}] motion gate: {} frames, {} full detections ({} keyframes), {} region detections, {} tracked'.format(
+                capture, stats['frames'], stats['keyframe'] + stats['motion'], stats['keyframe'], stats['region'], stats['tracked']
+            ))
+
+def parse_capture(capture):
+    """ A number selects a camera, anything else is a file name or stream url.
+    """
+    return int(capture) if capture.isdigit() else capture
+
 def parse_args(args):
     """ Parse the arguments.
     """
     parser = argparse.ArgumentParser(description='Evaluation script for a RetinaNet network.')
     parser.add_argument('--model', help='Path to RetinaNet model.', default=os.path.join('snapshots', 'resnet50_liza_alert_v1_interface.h5'))
-    parser.add_argument('--capture', help='capture Id', default=0, type=int)
+    parser.add_argument('--engine', help='Inference engine: keras, or tf, tflite or onnxruntime for the exports of convert_model.py --export next to a Keras model (auto picks the engine of the model file).', choices=['auto'] + list(ENGINES), default='auto')
+    parser.add_argument('--capture', help='capture Id, video file or stream url, several sources are processed together', nargs='+', default=[0], type=parse_capture)
+    parser.add_argument('--batch-size', help='Maximum number of queued frames (of all sources) run through the model at once.', type=int, default=1)
+    parser.add_argument('--threshold', help='Score threshold for drawn detections.', type=float, default=0.5)
+    parser.add_argument('--report-interval', help='Seconds between fps and latency reports.', type=float, default=5.0)
+    parser.add_argument('--motion-gate', help='Only run the model on changed regions or keyframes and track the boxes in between.', action='store_true')
+    parser.add_argument('--keyframe-interval', help='Maximum number of frames between full detections with --motion-gate.', type=int, default=10)
+    parser.add_argument('--motion-threshold', help='Fraction of changed pixels which triggers a detection of the changed region with --motion-gate.', type=float, default=0.002)
+    parser.add_argument('--output-dir', help='Write the detections of every source to stream_<n>.jsonl in this directory.')
+    parser.add_argument('--no-display', help='Do not show the video, only report fps and latency.', dest='display', action='store_false')
     return parser.parse_args(args)
 
 def main(args=None):
     args = parse_args(args)
     load_model(args)
-    cap = cv2.VideoCapture(args.capture)
-    while(cap.isOpened()):
-        ret, frame = cap.read()
-
-        draw = frame.copy()
-        draw = cv2.cvtColor(draw, cv2.COLOR_BGR2RGB)
-
-        boxes, scores, labels = run_detection_image(model, frame)
-
-        for box, score, label in zip(boxes[0], scores[0], labels[0]):
-            # scores are sorted so we can break
-            if score < 0.5:
-                break
-
-            color = label_color(label)
-
-            b = box.astype(int)
-            draw_box(draw, b, color=color)
-
-            caption = "{} {:.3f}".format(labels_to_names[label], score)
-            draw_caption(draw, b, caption)
-
-        # Display the resulting frame
-        resized_image = cv2.resize(frame, (1280, 820))
-        cv2.imshow('Video', resized_image)
-
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+    streams = len(args.capture)
+    caps = []
+    for capture in args.capture:
+        cap = cv2.VideoCapture(capture)
+        # keep the driver from buffering frames the pipeline would only drop
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        caps.append(cap)
+
+    # every stream keeps its newest frames, a batch is filled round-robin over the streams
+    frames  = StreamMultiplexer(streams, maxsize=max(1, -(-args.batch_size // streams)))
+    results = StreamMultiplexer(streams, maxsize=1)
+    stop    = threading.Event()
+
+    capture_rates   = [RateMeter() for _ in range(streams)]
+    inference_rates = [RateMeter() for _ in range(streams)]
+    latencies       = [LatencyMeter() for _ in range(streams)]
+
+    gates = None
+    if args.motion_gate:
+        # every stream has its own reference frame and tracked boxes
+        gates = [MotionGatedDetector(
+            partial(run_detection_image, model),
+            keyframe_interval=args.keyframe_interval,
+            motion_threshold=args.motion_threshold,
+            track_threshold=min(args.threshold, 0.3)
+        ) for _ in range(streams)]
+
+    writers = None
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+        writers = [DetectionWriter(os.path.join(args.output_dir, 'stream_{}.jsonl'.format(stream)), resume=False) for stream in range(streams)]
+    started = time.time()
+
+    threads = [
+        threading.Thread(target=capture_loop, args=(cap, stream, frames, stop, capture_rates[stream]), name='capture-{}'.format(stream), daemon=True)
+        for stream, cap in enumerate(caps)
+    ]
+    threads.append(threading.Thread(target=inference_loop, args=(frames, results, args.batch_size, inference_rates, gates), name='inference', daemon=True))
+    for thread in threads:
+        thread.start()
+
+    # rendering stays in the main thread, which is required by the gui backends of opencv
+    last_report = time.time()
+    while True:
+        batch = results.get_many(streams, timeout=0.1)
+        if not batch and results.closed:
+            break
+        for frame in batch:
+            if writers is not None:
+                writers[frame.stream].write(frame.index, frame.captured - started, format_objects(frame.detections, args.threshold))
+            if args.display:
+                draw_detections(frame.image, frame.detections, args.threshold)
+                # Display the resulting frame
+                resized_image = cv2.resize(frame.image, (1280, 820))
+                cv2.imshow('Video' if streams == 1 else 'Video {}'.format(args.capture[frame.stream]), resized_image)
+            latencies[frame.stream].record(time.time() - frame.captured)
+
+        if args.display and cv2.waitKey(1) & 0xFF == ord('q'):
             break
+        if time.time() - last_report >= args.report_interval:
+            if writers is not None:
+                for writer in writers:
+                    writer.flush()
+            report(args.capture, capture_rates, inference_rates, latencies, frames, results, gates)
+            last_report = time.time()
+
+    stop.set()
+    frames.close()
+    for thread in threads:
+        thread.join(timeout=5)
+    for cap in caps:
+        cap.release()
+    if writers is not None:
+        for writer in writers:
+            writer.close()
+    report(args.capture, capture_rates, inference_rates, latencies, frames, results, gates)
 
 if __name__ == '__main__':
     main()
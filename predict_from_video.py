@@ -0,0 +1,161 @@
+from keras_retinanet import models
+from keras_retinanet.utils.cpu import session_config
+from keras_retinanet.utils.engine import ENGINES, create_engine, engine_name
+from keras_retinanet.utils.image import preprocess_and_resize
+from keras_retinanet.utils.pipeline import RateMeter
+from keras_retinanet.utils.video import DetectionWriter, ParallelDecoder, sample_frames, video_info
+# import miscellaneous modules
+import argparse
+import os
+import numpy as np
+import time
+
+def load_model(args):
+    engine = args.engine if args.engine != 'auto' else engine_name(args.model)
+    # load retinanet model, onnxruntime and tflite run without tensorflow
+    global model
+    model = create_engine(args.model, engine, backbone_name=args.backbone, config=session_config() if engine in ('keras', 'tf') else None)
+    # load label to names mapping
+    global labels_to_names
+    labels_to_names = {0: 'Pedestrian'}
+    global in_graph_preprocessing
+    in_graph_preprocessing = model.preprocessed
+    # the frames are preprocessed like the backbone was trained
+    global preprocess_mode
+    if not in_graph_preprocessing:
+        preprocess_mode = args.preprocess_mode or models.backbone_preprocessing(args.backbone)
+    print('model loaded')
+    return model, labels_to_names
+
+def format_objects(boxes, scores, labels, threshold=0.5):
+    """ Converts the detections of one frame above threshold to a list of dicts with numeric fields.
+    """
+    objects = []
+    for box, score, label in zip(boxes, scores, labels):
+        # scores are sorted so we can break
+        if score < threshold:
+            break
+        b = box.astype(int)
+        objects.append({
+            'name': labels_to_names[label],
+            'score': round(float(score), 4),
+            'xmin': int(b[0]),
+            'ymin': int(b[1]),
+            'xmax': int(b[2]),
+            'ymax': int(b[3])
+        })
+    return objects
+
+inputs = None
+
+def run_detection_batch(model, frames):
+    """ Runs the model on decoded (index, image, scale) frames, which are already resized and all have the same shape.
+
+    Returns
+        The boxes, scores and labels of the batch, with boxes in the coordinates of the original frames.
+    """
+    if in_graph_preprocessing:
+        # the model resizes the uint8 frames itself and returns boxes in their coordinates
+        return model.predict(np.stack([image for _, image, _ in frames], axis=0))
+    global inputs
+    shape = (len(frames),) + frames[0][1].shape
+    if inputs is None or inputs.shape != shape:
+        inputs = np.empty(shape, dtype=np.float32)
+    # the frames are preprocessed into the same buffer for every batch
+    for i, (_, image, _) in enumerate(frames):
+        preprocess_and_resize(image, min_side=None, mode=preprocess_mode, out=inputs[i])
+    boxes, scores, labels = model.predict(inputs)
+    # correct for image scale
+    scales = np.array([scale for _, _, scale in frames], dtype=np.float32)
+    return boxes / scales[:, None, None], scores, labels
+
+def batches(frames, batch_size):
+    """ Groups consecutive frames into batches, a change of the frame shape starts a new batch.
+    """
+    batch = []
+    for frame in frames:
+        if batch and (len(batch) >= batch_size or batch[0][1].shape != frame[1].shape):
+            yield batch
+            batch = []
+        batch.append(frame)
+    if batch:
+        yield batch
+
+def report(rate, done, total, started):
+    elapsed = time.time() - started
+    print('{}/{} frames | {:.1f} frames/s now | {:.1f} frames/s average'.format(
+        done, total, rate.rate(), done / elapsed if elapsed > 0 else 0.0
+    ))
+
+def parse_args(args):
+    """ Parse the arguments.
+    """
+    parser = argparse.ArgumentParser(description='Detection script for recorded video files.')
+    parser.add_argument('video', help='Path to the video file.')
+    parser.add_argument('--model', help='Path to RetinaNet model.', default=os.path.join('snapshots', 'resnet50_liza_alert_v1_interface.h5'))
+    parser.add_argument('--backbone', help='Backbone of the model.', default='resnet50')
+    parser.add_argument('--preprocess-mode', help='Preprocessing of the backbone (defaults to the preprocessing of --backbone).', choices=['caffe', 'tf'])
+    parser.add_argument('--engine', help='Inference engine: keras, or tf, tflite or onnxruntime for the exports of convert_model.py --export next to a Keras model (auto picks the engine of the model file).', choices=['auto'] + list(ENGINES), default='auto')
+    parser.add_argument('--output', help='Detections file, .csv for CSV, anything else for JSON lines (defaults to the video name with .jsonl).')
+    parser.add_argument('--format', help='Output format, overrides the extension of --output.', choices=['json', 'csv'])
+    parser.add_argument('--target-fps', help='Sample the video at this rate instead of processing every frame.', type=float)
+    parser.add_argument('--batch-size', help='Number of frames run through the model at once.', type=int, default=4)
+    parser.add_argument('--decode-workers', help='Number of processes decoding the video.', type=int, default=max(1, min(4, os.cpu_count() or 1)))
+    parser.add_argument('--segment-size', help='Number of frames decoded per task of a decode worker.', type=int, default=32)
+    parser.add_argument('--threshold', help='Score threshold for written detections.', type=float, default=0.5)
+    parser.add_argument('--image-min-side', help='Rescale the frames so the smallest side is min_side.', type=int, default=800)
+    parser.add_argument('--image-max-side', help='Rescale the frames if the largest side is larger than max_side.', type=int, default=1333)
+    parser.add_argument('--report-interval', help='Seconds between throughput reports.', type=float, default=10.0)
+    parser.add_argument('--no-resume', help='Overwrite the output instead of continuing after its last frame.', dest='resume', action='store_false')
+    return parser.parse_args(args)
+
+def main(args=None):
+    args   = parse_args(args)
+    output = args.output or os.path.splitext(args.video)[0] + ('.csv' if args.format == 'csv' else '.jsonl')
+    info   = video_info(args.video)
+
+    writer = DetectionWriter(output, resume=args.resume, fmt=args.format)
+    start  = 0 if writer.last_frame is None else writer.last_frame + 1
+    frames = sample_frames(info.frame_count, info.fps, args.target_fps, start=start)
+    if start:
+        print('resuming after frame {}'.format(writer.last_frame))
+    print('{}: {}x{} at {:.2f} fps, {} frames to process'.format(args.video, info.width, info.height, info.fps, len(frames)))
+
+    # the decoders are forked before tensorflow creates its session
+    decoder = ParallelDecoder(
+        args.video,
+        workers=args.decode_workers,
+        segment_size=args.segment_size,
+        min_side=args.image_min_side,
+        max_side=args.image_max_side,
+    )
+    try:
+        load_model(args)
+        if in_graph_preprocessing:
+            # the decoders are told per task, so they stop resizing from here on
+            decoder.min_side = None
+
+        rate        = RateMeter()
+        done        = 0
+        started     = time.time()
+        last_report = started
+        for batch in batches(decoder.decode(frames), args.batch_size):
+            boxes, scores, labels = run_detection_batch(model, batch)
+            for (index, _, _), frame_boxes, frame_scores, frame_labels in zip(batch, boxes, scores, labels):
+                writer.write(index, index / info.fps, format_objects(frame_boxes, frame_scores, frame_labels, args.threshold))
+            # a batch is finished once it is on disk, so a resumed run continues after it
+            writer.flush()
+            rate.tick(len(batch))
+            done += len(batch)
+
+            if time.time() - last_report >= args.report_interval:
+                report(rate, done, len(frames), started)
+                last_report = time.time()
+        report(rate, done, len(frames), started)
+    finally:
+        decoder.close()
+        writer.close()
+    print('detections written to {}'.format(output))
+
+if __name__ == '__main__':
+    main()
@@ -60,6 +60,8 @@ setuptools.setup(
             'retinanet-evaluate=keras_retinanet.bin.evaluate:main',
             'retinanet-debug=keras_retinanet.bin.debug:main',
             'retinanet-convert-model=keras_retinanet.bin.convert_model:main',
+            'retinanet-quantize-model=keras_retinanet.bin.quantize_model:main',
+            'retinanet-benchmark-decode=keras_retinanet.bin.benchmark_decode:main',
         ],
     },
     ext_modules    = extensions,
@@ -0,0 +1,186 @@
+import inference
+from inference import ServerBusyError, deadline_exceeded, metrics, requests_shed
+from keras_retinanet.utils.batching import DeadlineExceededError, QueueFullError, PRIORITY_BULK, PRIORITY_INTERACTIVE
+from keras_retinanet.utils.socket_protocol import (
+    KIND_ENCODED,
+    KIND_RAW,
+    KIND_SHARED_MEMORY,
+    STATUS_BAD_REQUEST,
+    STATUS_BUSY,
+    STATUS_DEADLINE_EXCEEDED,
+    STATUS_ERROR,
+    STATUS_NOT_FOUND,
+    RequestTooLargeError,
+    attach_shared_memory,
+    read_request,
+    send_detections,
+    send_error,
+)
+# import miscellaneous modules
+import numpy as np
+import os
+import socketserver
+import stat
+import threading
+import time
+import traceback
+
+socket_requests = metrics.counter('lacmus_socket_requests_total', 'Unix socket detection requests by status.', ['status'])
+socket_latency = metrics.histogram('lacmus_socket_request_duration_seconds', 'Time until a Unix socket response is sent.')
+
+STATUS_NAMES = {
+    STATUS_BAD_REQUEST       : 'bad_request',
+    STATUS_NOT_FOUND         : 'not_found',
+    STATUS_BUSY              : 'busy',
+    STATUS_DEADLINE_EXCEEDED : 'deadline_exceeded',
+    STATUS_ERROR             : 'error',
+}
+
+class BadRequestError(ValueError):
+    pass
+
+def request_deadline(request):
+    """ Returns the deadline of a socket request, its timeout defaults to --request-timeout like for HTTP.
+    """
+    timeout = request.timeout or inference.request_timeout
+    return time.time() + timeout if timeout > 0 else None
+
+def raw_image(request, buffer):
+    """ Returns the uint8 BGR image of shape (height, width, 3) stored in buffer, without copying it.
+    """
+    if len(buffer) < request.height * request.width * 3 or not request.height or not request.width:
+        raise BadRequestError('Expected {}x{}x3 pixels, received {} bytes.'.format(request.height, request.width, len(buffer)))
+    return np.ndarray((request.height, request.width, 3), dtype=np.uint8, buffer=buffer)
+
+def detect_request(request):
+    """ Runs a socket request through the same path as the HTTP requests.
+
+    Returns
+        The detections, or None if the image can not be decoded.
+    """
+    if request.model_name is not None and request.model_name not in inference.model_specs:
+        raise KeyError('Unknown model: {}'.format(request.model_name))
+    if request.priority not in (PRIORITY_INTERACTIVE, PRIORITY_BULK):
+        raise BadRequestError('Unknown priority: {}'.format(request.priority))
+    deadline = request_deadline(request)
+    detect = lambda data: inference.detect_encoded(data, priority=request.priority, model_name=request.model_name, deadline=deadline)
+
+    if request.kind == KIND_ENCODED:
+        return detect(request.payload)
+    if request.kind == KIND_RAW:
+        return detect(raw_image(request, request.payload))
+    if request.kind == KIND_SHARED_MEMORY:
+        try:
+            block = attach_shared_memory(bytes(request.payload).decode('utf8'))
+        except (FileNotFoundError, UnicodeDecodeError) as e:
+            raise BadRequestError('Unable to open the shared memory block: {}'.format(e))
+        try:
+            image = raw_image(request, block.buf)
+            try:
+                return detect(image)
+            finally:
+                # the block can only be closed once no array uses its buffer
+                del image
+        finally:
+            block.close()
+    raise BadRequestError('Unknown request kind: {}'.format(request.kind))
+
+class DetectionHandler(socketserver.BaseRequestHandler):
+    """ Serves the requests of one client connection until the client closes it.
+    """
+
+    def respond(self, request):
+        try:
+            with inference.admitted():
+                detections = detect_request(request)
+        except ServerBusyError as e:
+            requests_shed.inc(reason='pending_limit')
+            return STATUS_BUSY, e
+        except QueueFullError as e:
+            requests_shed.inc(reason='queue_full')
+            return STATUS_BUSY, e
+        except DeadlineExceededError as e:
+            deadline_exceeded.inc()
+            return STATUS_DEADLINE_EXCEEDED, e
+        except KeyError as e:
+            return STATUS_NOT_FOUND, e.args[0]
+        except BadRequestError as e:
+            return STATUS_BAD_REQUEST, e
+        except Exception:
+            traceback.print_exc()
+            return STATUS_ERROR, 'Internal server error.'
+        if detections is None:
+            return STATUS_BAD_REQUEST, 'Unable to decode the image.'
+        send_detections(self.request, *detections, threshold=request.threshold)
+        return None
+
+    def handle(self):
+        while True:
+            try:
+                request = read_request(self.request, max_payload_size=self.server.max_payload_size)
+            except ConnectionError:
+                return
+            except RequestTooLargeError as e:
+                send_error(self.request, STATUS_BAD_REQUEST, e)
+                socket_requests.inc(status=STATUS_NAMES[STATUS_BAD_REQUEST])
+                continue
+            if request is None:
+                return
+
+            start = time.time()
+            error = self.respond(request)
+            if error is not None:
+                send_error(self.request, *error)
+            socket_requests.inc(status='ok' if error is None else STATUS_NAMES[error[0]])
+            socket_latency.observe(time.time() - start)
+
+class DetectionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads   = True
+    # largest request payload in bytes, None for no limit
+    max_payload_size = None
+
+def remove_stale_socket(path):
+    """ Removes a socket file left behind by a previous server, but never a regular file.
+    """
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError('Not a socket: {}'.format(path))
+    os.remove(path)
+
+def parse_args(args):
+    """ Parse the arguments.
+    """
+    parser = inference.build_parser(description='Unix domain socket detection server for clients on the same machine.')
+    parser.add_argument('--socket', help='Path of the Unix domain socket.', default='/tmp/lacmus.sock')
+    parser.add_argument('--max-request-size', help='Largest request payload in MB, larger requests are refused before they are read. 0 means no limit.', type=float, default=128)
+    parser.add_argument('--http-port', help='Also serve the HTTP API on this port, 0 to serve the socket only.', type=int, default=0)
+    return parser.parse_args(args)
+
+def main(args=None):
+    args = parse_args(args)
+    inference.start_server(args)
+
+    remove_stale_socket(args.socket)
+    server = DetectionServer(args.socket, DetectionHandler)
+    if args.max_request_size > 0:
+        server.max_payload_size = int(args.max_request_size * 2 ** 20)
+    if args.http_port:
+        http = threading.Thread(
+            target=inference.app.run,
+            kwargs=dict(debug=False, host='0.0.0.0', port=args.http_port, threaded=True),
+            name='http',
+            daemon=True
+        )
+        http.start()
+    print('serving on {}'.format(args.socket))
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        os.remove(args.socket)
+
+if __name__ == '__main__':
+    main()
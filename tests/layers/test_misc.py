@@ -79,6 +79,34 @@ class TestAnchors(object):
         # test anchor values
         np.testing.assert_array_equal(anchors, expected)
 
+    def test_static_shape(self):
+        # create simple Anchors layer
+        anchors_layer = keras_retinanet.layers.Anchors(
+            size=32,
+            stride=8,
+            ratios=np.array([1], dtype=keras.backend.floatx()),
+            scales=np.array([1], dtype=keras.backend.floatx()),
+        )
+
+        # features of a static shape with an unknown batch size
+        features = keras.backend.placeholder(shape=(None, 2, 2, 1024))
+
+        # the anchors are a constant shared by the batch
+        anchors = anchors_layer.call(features)
+        assert keras.backend.int_shape(anchors) == (1, 4, 4)
+        anchors = keras.backend.eval(anchors)
+
+        # expected anchor values
+        expected = np.array([[
+            [-12, -12, 20, 20],
+            [-4 , -12, 28, 20],
+            [-12, -4 , 20, 28],
+            [-4 , -4 , 28, 28],
+        ]], dtype=keras.backend.floatx())
+
+        # test anchor values
+        np.testing.assert_array_equal(anchors, expected)
+
 
 class TestUpsampleLike(object):
     def test_simple(self):
@@ -209,3 +237,43 @@ class TestRegressBoxes(object):
         ], dtype=keras.backend.floatx())
 
         np.testing.assert_array_almost_equal(actual, expected, decimal=2)
+
+
+class TestPreprocessImage(object):
+    def test_simple(self):
+        # create simple PreprocessImage layer
+        preprocess_image_layer = keras_retinanet.layers.PreprocessImage(min_side=4, max_side=6, mode='caffe')
+
+        # create input, the min side is scaled to 4 unless the max side would exceed 6
+        image = np.full((1, 2, 4, 3), 200, dtype=np.uint8)
+        image = keras.backend.constant(image, dtype='uint8')
+
+        # compute output
+        actual = preprocess_image_layer.call(image)
+        actual = keras.backend.eval(actual)
+
+        # compute expected output
+        expected = np.tile(np.array([200 - 103.939, 200 - 116.779, 200 - 123.68], dtype=keras.backend.floatx()), (1, 3, 6, 1))
+
+        np.testing.assert_array_almost_equal(actual, expected, decimal=3)
+
+
+class TestRescaleBoxes(object):
+    def test_simple(self):
+        # create simple RescaleBoxes layer
+        rescale_boxes_layer = keras_retinanet.layers.RescaleBoxes(min_side=4, max_side=6)
+
+        # create input, which was resized by 1.5
+        image = np.zeros((1, 2, 4, 3), dtype=np.uint8)
+        image = keras.backend.constant(image, dtype='uint8')
+        boxes = np.array([[[0, 0, 3, 3], [1.5, 3, 6, 4.5]]], dtype=keras.backend.floatx())
+        boxes = keras.backend.variable(boxes)
+
+        # compute output
+        actual = rescale_boxes_layer.call([image, boxes])
+        actual = keras.backend.eval(actual)
+
+        # compute expected output
+        expected = np.array([[[0, 0, 2, 2], [1, 2, 4, 3]]], dtype=keras.backend.floatx())
+
+        np.testing.assert_array_almost_equal(actual, expected)
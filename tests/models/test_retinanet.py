@@ -0,0 +1,42 @@
+import keras
+import numpy as np
+
+from keras_retinanet.models.retinanet import retinanet, retinanet_bbox
+
+
+def tiny_training_model(num_classes=2):
+    """ A retinanet training model on a small backbone with C3, C4 and C5 at strides 8, 16 and 32.
+    """
+    inputs = keras.layers.Input(shape=(None, None, 3))
+    x      = inputs
+    layers = []
+    for stride, filters in zip((2, 4, 8, 16, 32), (4, 8, 8, 16, 16)):
+        x = keras.layers.Conv2D(filters, (3, 3), strides=2, padding='same', activation='relu', name='conv_{}'.format(stride))(x)
+        layers.append(x)
+    model = retinanet(inputs=inputs, backbone_layers=layers[2:], num_classes=num_classes)
+
+    # without the prior probability bias the scores are large enough to keep detections
+    classification = model.get_layer('classification_submodel').get_layer('pyramid_classification')
+    kernel, bias   = classification.get_weights()
+    classification.set_weights([kernel, np.zeros_like(bias)])
+    return model
+
+
+def test_static_input_shape():
+    model   = tiny_training_model()
+    dynamic = retinanet_bbox(model=model)
+    static  = retinanet_bbox(model=model, input_shape=(64, 96))
+
+    # every shape of the static model is known, the anchors are a constant shared by the batch
+    assert static.inputs[0].shape.as_list() == [None, 64, 96, 3]
+    assert static.get_layer('anchors').output.shape.as_list()[0] == 1
+    assert static.outputs[0]._keras_shape[0] is None
+
+    images = np.random.RandomState(0).uniform(-100, 100, (3, 64, 96, 3)).astype(np.float32)
+    expected = dynamic.predict_on_batch(images)
+    actual   = static.predict_on_batch(images)
+
+    # the detections of every image of the batch are those of the dynamic model
+    assert np.sum(expected[1] >= 0) > 0
+    for e, a in zip(expected, actual):
+        np.testing.assert_allclose(a, e, rtol=1e-4, atol=1e-4)
@@ -0,0 +1,80 @@
+import numpy as np
+
+import inference
+from keras_retinanet.utils.model_registry import ModelSpec
+
+
+class RecordingEngine(object):
+    """ Engine without detections which keeps the batches it is run on.
+    """
+    name         = 'keras'
+    preprocessed = False
+    memory_bytes = 0
+    input_shape  = None
+
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, batch):
+        self.batches.append(batch.copy())
+        return np.zeros((len(batch), 1, 4)), np.zeros((len(batch), 1)), np.zeros((len(batch), 1), dtype=int)
+
+    def close(self):
+        pass
+
+
+def test_tiles_use_the_backbone_preprocessing(tmpdir, monkeypatch):
+    engine = RecordingEngine()
+    monkeypatch.setattr(inference, 'create_engine', lambda *args, **kwargs: engine)
+    path = str(tmpdir.join('mobilenet.h5'))
+    open(path, 'wb').close()
+
+    args   = inference.parse_args(['--model', path, '--tiled', '--tile-width', '64', '--tile-height', '64', '--tile-overlap', '0'])
+    served = inference.ServedModel('mobilenet', ModelSpec(path, 'mobilenet224_1.0'), args)
+    try:
+        engine.batches = []
+        served.detect(np.full((64, 64, 3), 255, dtype=np.uint8))
+    finally:
+        served.close()
+
+    # mobilenet scales the pixels to [-1, 1] instead of subtracting the caffe mean
+    assert served.preprocess == 'tf'
+    np.testing.assert_allclose(engine.batches[0][0], 1.0)
+
+
+def test_images_use_the_backbone_preprocessing(tmpdir, monkeypatch):
+    engine = RecordingEngine()
+    monkeypatch.setattr(inference, 'create_engine', lambda *args, **kwargs: engine)
+    path = str(tmpdir.join('mobilenet.h5'))
+    open(path, 'wb').close()
+
+    args   = inference.parse_args(['--model', path])
+    served = inference.ServedModel('mobilenet', ModelSpec(path, 'mobilenet224_1.0'), args)
+    try:
+        engine.batches = []
+        served.detect(np.full((64, 64, 3), 255, dtype=np.uint8))
+    finally:
+        served.close()
+
+    assert served.preprocess == 'tf'
+    np.testing.assert_allclose(engine.batches[0][0], 1.0)
+
+
+def test_static_input_shape_ignores_shape_buckets(tmpdir, monkeypatch):
+    engine = RecordingEngine()
+    engine.input_shape = (64, 96)
+    monkeypatch.setattr(inference, 'create_engine', lambda *args, **kwargs: engine)
+    path = str(tmpdir.join('static.h5'))
+    open(path, 'wb').close()
+
+    args   = inference.parse_args(['--model', path, '--shape-buckets', '1067x800'])
+    served = inference.ServedModel('static', ModelSpec(path, 'resnet50'), args)
+    try:
+        engine.batches = []
+        served.detect(np.zeros((480, 640, 3), dtype=np.uint8))
+    finally:
+        served.close()
+
+    # the images are letterboxed to the input shape of the model only
+    assert served.shape_buckets.buckets == [(64, 96)]
+    assert engine.batches[0].shape == (1, 64, 96, 3)
@@ -0,0 +1,132 @@
+import os
+import time
+
+from keras_retinanet.utils.batching import QueueFullError
+
+from jobs import JobRunner, JobStore, job_items_from_paths, job_upload_dir, new_job_id, CANCELLED, DONE, QUEUED, RUNNING
+
+
+def make_images(tmpdir, count):
+    for i in range(count):
+        tmpdir.join('{}.jpg'.format(i)).write_binary(str(i).encode('utf8'))
+    return job_items_from_paths(['{}.jpg'.format(i) for i in range(count)], str(tmpdir))
+
+
+def wait_for_state(store, job_id, state, timeout=5):
+    end = time.time() + timeout
+    while time.time() < end:
+        if store.state(job_id) == state:
+            return True
+        time.sleep(0.01)
+    return False
+
+
+def process(data, threshold):
+    if data == b'2':
+        return None
+    return [{'value': int(data), 'threshold': threshold}]
+
+
+def test_job_runner(tmpdir):
+    store = JobStore(str(tmpdir.join('jobs.sqlite')))
+    job_id = store.create(make_images(tmpdir, 4), threshold=0.3)
+    assert store.status(job_id)['state'] == QUEUED
+
+    runner = JobRunner(store, process, workers=2).start()
+    try:
+        assert wait_for_state(store, job_id, DONE)
+    finally:
+        runner.stop()
+
+    status = store.status(job_id)
+    assert status['total'] == 4
+    assert status['done'] == 3
+    assert status['failed'] == 1
+
+    results = list(store.results(job_id))
+    assert [r['index'] for r in results] == [0, 1, 2, 3]
+    assert results[1]['objects'] == [{'value': 1, 'threshold': 0.3}]
+    assert 'error' in results[2]
+    assert [r['index'] for r in store.results(job_id, offset=2)] == [2, 3]
+
+
+def test_job_resumes_after_restart(tmpdir):
+    path = str(tmpdir.join('jobs.sqlite'))
+    store = JobStore(path)
+    job_id = store.create(make_images(tmpdir, 3))
+
+    # simulate a restart in the middle of the job
+    store.set_state(job_id, RUNNING)
+    store.finish_item(job_id, 0, DONE, [])
+
+    processed = []
+
+    def recording_process(data, threshold):
+        processed.append(data)
+        return []
+
+    store = JobStore(path)
+    runner = JobRunner(store, recording_process).start()
+    try:
+        assert wait_for_state(store, job_id, DONE)
+    finally:
+        runner.stop()
+    assert sorted(processed) == [b'1', b'2']
+
+
+def test_cancel_job(tmpdir):
+    store = JobStore(str(tmpdir.join('jobs.sqlite')))
+    job_id = store.create(make_images(tmpdir, 2))
+    runner = JobRunner(store, process)
+
+    assert runner.cancel(job_id)
+    assert store.state(job_id) == CANCELLED
+    assert not runner.cancel(job_id)
+    assert store.next_job() is None
+
+
+def test_busy_images_are_retried(tmpdir):
+    store = JobStore(str(tmpdir.join('jobs.sqlite')))
+    job_id = store.create(make_images(tmpdir, 3))
+
+    attempts = []
+
+    def busy_process(data, threshold):
+        # every image is rejected by a full queue once
+        attempts.append(data)
+        if attempts.count(data) == 1:
+            raise QueueFullError('Batch queue is full.')
+        return []
+
+    runner = JobRunner(store, busy_process, workers=1, retry_delay=0.01).start()
+    try:
+        assert wait_for_state(store, job_id, DONE)
+    finally:
+        runner.stop()
+
+    status = store.status(job_id)
+    assert status['done'] == 3
+    assert status['failed'] == 0
+    assert sorted(attempts) == [b'0', b'0', b'1', b'1', b'2', b'2']
+
+
+def test_uploads_are_removed(tmpdir):
+    store   = JobStore(str(tmpdir.join('jobs.sqlite')))
+    uploads = tmpdir.mkdir('uploads')
+
+    # the images of a finished job are removed
+    job_id = new_job_id()
+    items  = make_images(uploads.mkdir(job_id), 2)
+    store.create(items, job_id=job_id)
+    runner = JobRunner(store, process, uploads_dir=str(uploads)).start()
+    try:
+        assert wait_for_state(store, job_id, DONE)
+    finally:
+        runner.stop()
+    assert not os.path.exists(job_upload_dir(str(uploads), job_id))
+
+    # and those of a cancelled job
+    job_id = new_job_id()
+    store.create(make_images(uploads.mkdir(job_id), 2), job_id=job_id)
+    assert JobRunner(store, process, uploads_dir=str(uploads)).cancel(job_id)
+    assert not os.path.exists(job_upload_dir(str(uploads), job_id))
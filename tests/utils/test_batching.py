@@ -0,0 +1,123 @@
+import time
+
+import numpy as np
+import pytest
+
+from keras_retinanet.utils.batching import BatchScheduler, DeadlineExceededError, QueueFullError, PRIORITY_BULK
+
+
+def sum_predict(batch):
+    # one output per image: the sum of its pixels, plus the batch size it was run with
+    sums = batch.reshape(batch.shape[0], -1).sum(axis=1)
+    sizes = np.full((batch.shape[0],), batch.shape[0])
+    return [sums, sizes]
+
+
+def test_single_request():
+    scheduler = BatchScheduler(sum_predict, max_batch_size=4, max_wait=0.001).start()
+    try:
+        sums, sizes = scheduler.predict_on_image(np.ones((2, 3, 3)))
+        assert sums.shape == (1,)
+        assert sums[0] == 18
+        assert sizes[0] == 1
+    finally:
+        scheduler.stop()
+
+
+def test_concurrent_requests_are_batched():
+    scheduler = BatchScheduler(sum_predict, max_batch_size=8, max_wait=0.5)
+    futures = [scheduler.submit(np.full((2, 2, 3), i)) for i in range(8)]
+    scheduler.start()
+    try:
+        results = [f.result(timeout=5) for f in futures]
+    finally:
+        scheduler.stop()
+
+    for i, (sums, sizes) in enumerate(results):
+        assert sums[0] == i * 12
+        assert sizes[0] == 8
+
+    stats = scheduler.statistics.as_dict()
+    assert stats['batches'] == 1
+    assert stats['requests'] == 8
+    assert stats['mean_fill'] == 1.0
+
+
+def test_requests_are_grouped_by_shape():
+    scheduler = BatchScheduler(sum_predict, max_batch_size=8, max_wait=0.5)
+    small = [scheduler.submit(np.ones((2, 2, 3))) for _ in range(3)]
+    large = [scheduler.submit(np.ones((4, 4, 3))) for _ in range(2)]
+    scheduler.start()
+    try:
+        assert all(f.result(timeout=5)[1][0] == 3 for f in small)
+        assert all(f.result(timeout=5)[1][0] == 2 for f in large)
+    finally:
+        scheduler.stop()
+
+    assert scheduler.statistics.as_dict()['batch_sizes'] == {'2': 1, '3': 1}
+
+
+def test_queue_full():
+    scheduler = BatchScheduler(sum_predict, max_queue_size=1)
+    scheduler.submit(np.ones((1, 1, 3)))
+    with pytest.raises(QueueFullError):
+        scheduler.submit(np.ones((1, 1, 3)))
+    assert scheduler.statistics.as_dict()['rejected'] == 1
+
+
+def test_predict_exception_is_propagated():
+    def failing_predict(batch):
+        raise ValueError('failed')
+
+    scheduler = BatchScheduler(failing_predict, max_wait=0).start()
+    try:
+        with pytest.raises(ValueError):
+            scheduler.predict_on_image(np.ones((1, 1, 3)), timeout=5)
+    finally:
+        scheduler.stop()
+
+
+def test_interactive_requests_run_first():
+    order = []
+
+    def recording_predict(batch):
+        order.extend(int(image[0, 0, 0]) for image in batch)
+        return [batch]
+
+    scheduler = BatchScheduler(recording_predict, max_batch_size=1, max_wait=0)
+    bulk = [scheduler.submit(np.full((1, 1, 3), i), priority=PRIORITY_BULK) for i in range(3)]
+    interactive = scheduler.submit(np.full((1, 1, 3), 9))
+    scheduler.start()
+    try:
+        for f in bulk + [interactive]:
+            f.result(timeout=5)
+    finally:
+        scheduler.stop()
+
+    assert order == [9, 0, 1, 2]
+
+
+def test_expired_requests_are_dropped():
+    seen = []
+
+    def recording_predict(batch):
+        seen.append(len(batch))
+        return [batch]
+
+    scheduler = BatchScheduler(recording_predict, max_batch_size=4, max_wait=0)
+    expired = scheduler.submit(np.zeros((1, 1, 3)), deadline=time.time() + 0.01)
+    alive = scheduler.submit(np.zeros((1, 1, 3)), deadline=time.time() + 60)
+    time.sleep(0.05)
+    scheduler.start()
+    try:
+        with pytest.raises(DeadlineExceededError):
+            expired.result(timeout=5)
+        alive.result(timeout=5)
+    finally:
+        scheduler.stop()
+
+    assert seen == [1]
+    assert scheduler.statistics.as_dict()['expired'] == 1
+
+    with pytest.raises(DeadlineExceededError):
+        scheduler.submit(np.zeros((1, 1, 3)), deadline=time.time() - 1)
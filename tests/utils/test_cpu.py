@@ -0,0 +1,108 @@
+import argparse
+import configparser
+import os
+import time
+
+import pytest
+
+from keras_retinanet.utils.cpu import (
+    add_cpu_arguments,
+    calibrate_data_fraction,
+    calibrate_in_subprocess,
+    cpu_config_from_args,
+    parse_cpu_parameters,
+    pinned,
+    plan_cpu,
+)
+
+
+def busy(seconds):
+    end = time.process_time() + seconds
+    while time.process_time() < end:
+        pass
+
+
+def test_plan_cpu():
+    config = plan_cpu(0.25, cores=list(range(8)))
+    assert config.data_cores == [0, 1]
+    assert config.model_cores == [2, 3, 4, 5, 6, 7]
+    assert (config.data_workers, config.opencv_threads) == (2, 1)
+    assert (config.intra_op_threads, config.inter_op_threads) == (6, 1)
+
+    # OpenCV gets the data cores left over per worker
+    config = plan_cpu(0.5, cores=list(range(16)), data_workers=2)
+    assert (config.data_workers, config.opencv_threads) == (2, 4)
+    assert (config.intra_op_threads, config.inter_op_threads) == (8, 2)
+
+
+def test_plan_cpu_keeps_a_core_for_each_side():
+    assert plan_cpu(0, cores=[0, 1, 2]).data_cores == [0]
+    assert plan_cpu(1, cores=[0, 1, 2]).model_cores == [2]
+    config = plan_cpu(0.5, cores=[3])
+    assert config.data_cores == config.model_cores == [3]
+
+    with pytest.raises(ValueError):
+        plan_cpu(1.5)
+
+
+def test_calibrate_data_fraction():
+    fraction = calibrate_data_fraction(lambda: busy(0.01), lambda batch: busy(0.03), repeat=2)
+    assert fraction == pytest.approx(0.25, abs=0.05)
+
+    # waiting on a GPU costs no CPU time
+    fraction = calibrate_data_fraction(lambda: busy(0.01), lambda batch: time.sleep(0.03), repeat=2)
+    assert fraction > 0.8
+
+
+def test_calibrate_in_subprocess():
+    pids = []
+
+    def setup():
+        pids.append(os.getpid())
+        return (lambda: busy(0.01)), (lambda batch: busy(0.01))
+
+    assert calibrate_in_subprocess(setup, repeat=2, run_cost=3) == pytest.approx(0.25, abs=0.05)
+    assert pids == []
+
+    def failing_setup():
+        raise ValueError('no model')
+
+    with pytest.raises(RuntimeError, match='no model'):
+        calibrate_in_subprocess(failing_setup)
+
+
+@pytest.mark.skipif(not hasattr(os, 'sched_setaffinity'), reason='no affinity support')
+def test_pinned():
+    cores = os.sched_getaffinity(0)
+    with pinned([min(cores)]):
+        assert os.sched_getaffinity(0) == {min(cores)}
+    assert os.sched_getaffinity(0) == cores
+
+    with pinned(None):
+        assert os.sched_getaffinity(0) == cores
+
+
+def test_cpu_config_from_args():
+    parser = add_cpu_arguments(argparse.ArgumentParser())
+
+    assert cpu_config_from_args(parser.parse_args([])) is None
+    # a worker count alone keeps the library defaults
+    assert cpu_config_from_args(parser.parse_args([]), data_workers=4) is None
+
+    config = cpu_config_from_args(parser.parse_args(['--cpu-split', '0.5', '--pin-cores']), {'data_fraction': 0.25, 'intra_op_threads': 3})
+    assert config.pin and config.intra_op_threads == 3
+
+    config = cpu_config_from_args(parser.parse_args(['--cpu-split', 'auto']), data_workers=3, calibrate=lambda: 0.5)
+    assert config.data_workers == 3
+
+    with pytest.raises(ValueError):
+        cpu_config_from_args(parser.parse_args(['--cpu-split', 'auto']))
+
+
+def test_parse_cpu_parameters():
+    config = configparser.ConfigParser()
+    config.read_string('[cpu]\nsplit = auto\nintra_op_threads = 6\npin = true\n')
+    assert parse_cpu_parameters(config) == {'data_fraction': 'auto', 'intra_op_threads': 6, 'pin': True}
+
+    config.read_string('[cpu]\nsplit = 0.3\n')
+    assert parse_cpu_parameters(config)['data_fraction'] == 0.3
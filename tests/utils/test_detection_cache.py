@@ -0,0 +1,71 @@
+import numpy as np
+
+from keras_retinanet.utils.detection_cache import DetectionCache, image_key
+
+
+def detections(n, padding=2):
+    boxes  = np.zeros((1, n + padding, 4), dtype=np.float32)
+    scores = np.concatenate([np.linspace(0.9, 0.1, n), -np.ones(padding)]).astype(np.float32)[None]
+    labels = np.concatenate([np.zeros(n), -np.ones(padding)]).astype(np.int32)[None]
+    return boxes, scores, labels
+
+
+def test_image_key():
+    image = np.zeros((10, 10, 3), dtype=np.uint8)
+    other = image.copy()
+    other[0, 0, 0] = 1
+
+    assert image_key(image, 'model') == image_key(image.copy(), 'model')
+    assert image_key(image, 'model') != image_key(other, 'model')
+    assert image_key(image, 'model') != image_key(image, 'other-model')
+    assert image_key(image, 'model') != image_key(image.reshape(10, 30, 1), 'model')
+
+
+def test_cache_drops_padding():
+    cache = DetectionCache()
+    cache.put('a', *detections(3))
+    boxes, scores, labels = cache.get('a')
+    assert boxes.shape == (1, 3, 4)
+    assert scores.shape == (1, 3)
+    assert labels.shape == (1, 3)
+
+
+def test_cache_counters():
+    cache = DetectionCache()
+    assert cache.get('a') is None
+    cache.put('a', *detections(3))
+    assert cache.get('a') is not None
+
+    stats = cache.statistics()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['hit_rate'] == 0.5
+
+
+def test_cache_lru_eviction():
+    entry_size = sum(array.nbytes for array in DetectionCache().put('x', *detections(10)))
+    cache = DetectionCache(max_bytes=2 * entry_size)
+
+    cache.put('a', *detections(10))
+    cache.put('b', *detections(10))
+    cache.get('a')
+    cache.put('c', *detections(10))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.statistics()['evictions'] == 1
+    assert cache.statistics()['bytes'] <= cache.max_bytes
+
+
+def test_cache_disk_tier(tmpdir):
+    cache = DetectionCache(cache_dir=str(tmpdir))
+    cache.put('abcdef', *detections(3))
+
+    # a new cache (as after a restart) finds the entry on disk
+    restarted = DetectionCache(cache_dir=str(tmpdir))
+    boxes, scores, labels = restarted.get('abcdef')
+    assert scores.shape == (1, 3)
+    assert restarted.statistics()['disk_hits'] == 1
+    assert restarted.get('abcdef') is not None
+    assert restarted.statistics()['hits'] == 1
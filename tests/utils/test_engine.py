@@ -0,0 +1,48 @@
+import json
+import os
+
+import pytest
+
+from keras_retinanet.utils.engine import create_engine, engine_name, export_path, metadata_path, resolve_model_path
+
+
+def write_export(model_path, export_format):
+    path = export_path(model_path, export_format)
+    with open(path, 'wb'):
+        pass
+    with open(metadata_path(path), 'w') as f:
+        json.dump({'format': export_format}, f)
+    return path
+
+
+def test_engine_name(tmpdir):
+    model_path = os.path.join(str(tmpdir), 'model.h5')
+    open(model_path, 'wb').close()
+    onnx_path  = write_export(model_path, 'onnx')
+    frozen     = write_export(model_path, 'frozen')
+
+    assert engine_name(model_path) == 'keras'
+    assert engine_name(onnx_path) == 'onnxruntime'
+    assert engine_name(frozen) == 'tf'
+
+
+def test_resolve_model_path(tmpdir):
+    model_path = os.path.join(str(tmpdir), 'model.h5')
+    open(model_path, 'wb').close()
+    onnx_path  = write_export(model_path, 'onnx')
+    saved      = write_export(model_path, 'saved_model')
+
+    assert resolve_model_path(model_path, 'keras') == model_path
+    assert resolve_model_path(model_path, 'onnxruntime') == onnx_path
+    # without a frozen graph tf runs the SavedModel
+    assert resolve_model_path(model_path, 'tf') == saved
+    # exported models are run as they are
+    assert resolve_model_path(onnx_path, 'onnxruntime') == onnx_path
+
+    with pytest.raises(ValueError):
+        resolve_model_path(model_path, 'tflite')
+
+
+def test_create_engine_unknown(tmpdir):
+    with pytest.raises(ValueError):
+        create_engine(os.path.join(str(tmpdir), 'model.h5'), 'tensorrt')
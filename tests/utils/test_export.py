@@ -0,0 +1,29 @@
+import numpy as np
+
+from keras_retinanet.utils.export import compare_detections, export_path, metadata_path
+
+
+def test_export_path():
+    assert export_path('snapshots/model.h5', 'frozen') == 'snapshots/model.pb'
+    assert export_path('snapshots/model.h5', 'saved_model') == 'snapshots/model_saved_model'
+    assert metadata_path('snapshots/model_saved_model/') == 'snapshots/model_saved_model.json'
+
+
+def test_compare_detections():
+    expected = (
+        np.array([[0, 0, 10, 10], [20, 20, 30, 30], [0, 0, 5, 5], [-1, -1, -1, -1]], dtype=np.float32),
+        np.array([0.9, 0.8, 0.1, -1], dtype=np.float32),
+        np.array([0, 1, 0, -1]),
+    )
+    actual = (
+        np.array([[0, 0, 10, 11], [20, 20, 30, 30], [-1, -1, -1, -1]], dtype=np.float32),
+        np.array([0.89, 0.8, -1], dtype=np.float32),
+        np.array([0, 0, -1]),
+    )
+
+    result = compare_detections(expected, actual, threshold=0.3)
+    # the second box has another label, the third is below the threshold
+    assert result['detections'] == 2
+    assert result['unmatched'] == 1
+    assert np.isclose(result['min_iou'], 100 / 110)
+    assert np.isclose(result['max_score_diff'], 0.01)
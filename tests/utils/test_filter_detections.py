@@ -0,0 +1,73 @@
+import numpy as np
+
+from keras_retinanet.utils.filter_detections import filter_batch, filter_detections, non_max_suppression
+
+
+def test_non_max_suppression():
+    boxes  = np.array([[0, 0, 10, 10], [1, 1, 10, 10], [20, 20, 30, 30], [0, 0, 10, 9]], dtype=np.float32)
+    scores = np.array([0.8, 0.9, 0.7, 0.1], dtype=np.float32)
+    np.testing.assert_array_equal(non_max_suppression(boxes, scores, 10), [1, 2])
+    np.testing.assert_array_equal(non_max_suppression(boxes, scores, 10, iou_threshold=0.9), [1, 0, 2, 3])
+    np.testing.assert_array_equal(non_max_suppression(boxes, scores, 1), [1])
+
+
+def test_filter_detections():
+    # same as the simple test of layers.FilterDetections
+    boxes = np.array([
+        [0, 0, 10, 10],
+        [0, 0, 10, 10],  # this will be suppressed
+    ], dtype=np.float32)
+    classification = np.array([
+        [0, 0.9],  # this will be suppressed
+        [0, 1],
+    ], dtype=np.float32)
+
+    actual_boxes, actual_scores, actual_labels = filter_detections(boxes, classification)
+
+    expected_boxes = -1 * np.ones((300, 4), dtype=np.float32)
+    expected_boxes[0, :] = [0, 0, 10, 10]
+    expected_scores = -1 * np.ones((300,), dtype=np.float32)
+    expected_scores[0] = 1
+    expected_labels = -1 * np.ones((300,), dtype=np.int32)
+    expected_labels[0] = 1
+
+    np.testing.assert_array_equal(actual_boxes, expected_boxes)
+    np.testing.assert_array_equal(actual_scores, expected_scores)
+    np.testing.assert_array_equal(actual_labels, expected_labels)
+
+
+def test_filter_detections_per_class_and_top_k():
+    boxes = np.array([
+        [0, 0, 10, 10],
+        [0, 0, 10, 10],
+        [50, 50, 60, 60],
+    ], dtype=np.float32)
+    classification = np.array([
+        [0.6, 0.5],
+        [0.01, 0.9],
+        [0.7, 0.02],
+    ], dtype=np.float32)
+
+    # every class is suppressed on its own
+    boxes_, scores, labels = filter_detections(boxes, classification, max_detections=3)
+    np.testing.assert_allclose(scores, [0.9, 0.7, 0.6])
+    np.testing.assert_array_equal(labels, [1, 0, 0])
+    np.testing.assert_array_equal(boxes_, boxes[[1, 2, 0]])
+
+    # only the best class of a box counts
+    _, scores, labels = filter_detections(boxes, classification, class_specific_filter=False, max_detections=2)
+    np.testing.assert_allclose(scores, [0.9, 0.7])
+    np.testing.assert_array_equal(labels, [1, 0])
+
+    _, scores, _ = filter_detections(boxes, classification, nms=False, score_threshold=0.55)
+    np.testing.assert_allclose(scores[:4], [0.9, 0.7, 0.6, -1])
+
+
+def test_filter_batch():
+    boxes          = np.zeros((2, 3, 4), dtype=np.float32)
+    classification = np.zeros((2, 3, 1), dtype=np.float32)
+    classification[1, 2, 0] = 0.5
+
+    boxes, scores, labels = filter_batch(boxes, classification, max_detections=5)
+    assert boxes.shape == (2, 5, 4) and scores.shape == labels.shape == (2, 5)
+    assert scores[0, 0] == -1 and scores[1, 0] == 0.5
@@ -0,0 +1,69 @@
+import keras
+import numpy as np
+
+from keras_retinanet.utils.fold_batch_norm import fold_batch_norms, fold_weights, foldable_pairs
+
+
+def batch_norm(x, gamma, beta, mean, variance, epsilon):
+    return gamma * (x - mean) / np.sqrt(variance + epsilon) + beta
+
+
+def test_fold_weights():
+    random = np.random.RandomState(0)
+    kernel = random.randn(1, 1, 3, 4).astype(np.float32)
+    bias   = random.randn(4).astype(np.float32)
+    gamma, beta, mean = random.randn(3, 4).astype(np.float32)
+    variance          = random.rand(4).astype(np.float32) + 0.5
+    inputs            = random.randn(5, 3).astype(np.float32)
+
+    # a 1x1 convolution is a matrix product
+    expected     = batch_norm(inputs.dot(kernel[0, 0]) + bias, gamma, beta, mean, variance, 1e-3)
+    folded, fbias = fold_weights(kernel, bias, gamma, beta, mean, variance, 1e-3)
+    np.testing.assert_allclose(inputs.dot(folded[0, 0]) + fbias, expected, rtol=1e-5, atol=1e-5)
+
+    # without bias, scale and center
+    expected     = batch_norm(inputs.dot(kernel[0, 0]), 1, 0, mean, variance, 1e-3)
+    folded, fbias = fold_weights(kernel, None, None, None, mean, variance, 1e-3)
+    np.testing.assert_allclose(inputs.dot(folded[0, 0]) + fbias, expected, rtol=1e-5, atol=1e-5)
+
+
+def test_fold_weights_depthwise():
+    random = np.random.RandomState(1)
+    kernel = random.randn(1, 1, 2, 3).astype(np.float32)
+    gamma, beta, mean = random.randn(3, 6).astype(np.float32)
+    variance          = random.rand(6).astype(np.float32) + 0.5
+    inputs            = random.randn(5, 2).astype(np.float32)
+
+    # output channel c * multiplier + m is input channel c times kernel[..., c, m]
+    depthwise    = lambda k, b: (inputs[:, :, None] * k[0, 0][None]).reshape(5, 6) + b
+    expected     = batch_norm(depthwise(kernel, 0), gamma, beta, mean, variance, 1e-3)
+    folded, bias = fold_weights(kernel, None, gamma, beta, mean, variance, 1e-3, depthwise=True)
+    np.testing.assert_allclose(depthwise(folded, bias), expected, rtol=1e-5, atol=1e-5)
+
+
+def test_fold_batch_norms():
+    inputs = keras.layers.Input(shape=(None, None, 3))
+    x      = keras.layers.Conv2D(4, (3, 3), padding='same', use_bias=False, name='conv1')(inputs)
+    x      = keras.layers.BatchNormalization(name='bn1')(x)
+    x      = keras.layers.Activation('relu')(x)
+    y      = keras.layers.DepthwiseConv2D((3, 3), padding='same', name='depthwise')(x)
+    y      = keras.layers.BatchNormalization(name='bn2')(y)
+    # the convolution output is also used elsewhere, so its batch normalization stays
+    z      = keras.layers.Conv2D(4, (1, 1), name='conv2')(x)
+    w      = keras.layers.BatchNormalization(name='bn3')(z)
+    output = keras.layers.Add()([y, w, z])
+    model  = keras.models.Model(inputs=inputs, outputs=output)
+
+    random = np.random.RandomState(2)
+    for name in ('bn1', 'bn2', 'bn3'):
+        layer = model.get_layer(name)
+        layer.set_weights([random.randn(4), random.randn(4), random.randn(4), random.rand(4) + 0.5])
+
+    assert foldable_pairs(model) == [('conv1', 'bn1'), ('depthwise', 'bn2')]
+
+    folded = fold_batch_norms(model)
+    names  = [layer.name for layer in folded.layers]
+    assert 'bn1' not in names and 'bn2' not in names and 'bn3' in names
+
+    image = random.randn(1, 8, 8, 3).astype(np.float32)
+    np.testing.assert_allclose(folded.predict_on_batch(image), model.predict_on_batch(image), rtol=1e-4, atol=1e-4)
@@ -0,0 +1,80 @@
+import cv2
+import numpy as np
+import pytest
+
+from keras_retinanet.utils.image import (
+    decode_image_bgr,
+    fast_resize,
+    jpeg_size,
+    preprocess_and_resize,
+    preprocess_image,
+    read_image_bgr,
+    reduced_decode_flag,
+    resize_image,
+)
+
+
+def test_fast_resize_matches_resize_image_shape():
+    image = np.random.randint(0, 256, (1000, 1500, 3), dtype=np.uint8)
+    for scale in (0.2, 0.5, 0.8, 1.5):
+        expected = resize_image(image, min_side=int(1000 * scale), max_side=10000)[0]
+        assert fast_resize(image, scale).shape == expected.shape
+    assert fast_resize(image, 1) is image
+
+
+@pytest.mark.parametrize('mode', ['caffe', 'tf'])
+def test_preprocess_and_resize(mode):
+    image = np.random.randint(0, 256, (600, 900, 3), dtype=np.uint8)
+    expected, expected_scale = resize_image(preprocess_image(image, mode=mode), min_side=200, max_side=1000)
+
+    actual, scale = preprocess_and_resize(image, min_side=200, max_side=1000, mode=mode)
+    assert scale == expected_scale
+    assert actual.dtype == np.float32
+    assert actual.shape == expected.shape
+    # the filters differ, the mean does not
+    assert actual.mean() == pytest.approx(expected.mean(), abs=0.5 if mode == 'caffe' else 0.01)
+
+    # unresized images are preprocessed exactly like preprocess_image
+    np.testing.assert_allclose(preprocess_and_resize(image, min_side=None, mode=mode)[0], preprocess_image(image, mode=mode), atol=1e-4)
+
+
+def test_preprocess_and_resize_out_buffer():
+    image = np.random.randint(0, 256, (50, 60, 3), dtype=np.uint8)
+    out   = np.empty((50, 60, 3), dtype=np.float32)
+    actual, scale = preprocess_and_resize(image, min_side=None, out=out)
+    assert actual is out and scale == 1
+
+    # preprocessing functions are applied after resizing
+    actual, scale = preprocess_and_resize(image, min_side=25, mode=lambda x: x.astype(np.float32) * 0)
+    assert actual.shape == (25, 30, 3) and scale == 0.5 and not actual.any()
+
+    with pytest.raises(ValueError):
+        preprocess_and_resize(image, min_side=25, out=out)
+
+
+def test_reduced_decode_flag():
+    assert reduced_decode_flag(None) == (cv2.IMREAD_COLOR, 1.0)
+    assert reduced_decode_flag(0.8) == (cv2.IMREAD_COLOR, 1.0)
+    assert reduced_decode_flag(0.5) == (cv2.IMREAD_REDUCED_COLOR_2, 0.5)
+    assert reduced_decode_flag(0.2) == (cv2.IMREAD_REDUCED_COLOR_4, 0.25)
+    assert reduced_decode_flag(0.1) == (cv2.IMREAD_REDUCED_COLOR_8, 0.125)
+
+
+def test_reduced_decode(tmp_path):
+    image = np.random.randint(0, 256, (400, 640, 3), dtype=np.uint8)
+    data  = cv2.imencode('.jpg', image)[1].tobytes()
+    assert jpeg_size(data) == (400, 640)
+    assert jpeg_size(cv2.imencode('.png', image)[1].tobytes()) is None
+    assert jpeg_size(b'\xff\xd8\xff') is None
+
+    decoded, scale = decode_image_bgr(data, scale=0.25)
+    assert decoded.shape == (100, 160, 3) and scale == 0.25
+    decoded, scale = decode_image_bgr(data)
+    assert decoded.shape == image.shape and scale == 1
+
+    path = str(tmp_path / 'image.jpg')
+    with open(path, 'wb') as f:
+        f.write(data)
+    assert read_image_bgr(path).shape == image.shape
+    decoded, scale = read_image_bgr(path, scale=0.5)
+    assert decoded.shape == (200, 320, 3) and scale == 0.5
@@ -0,0 +1,66 @@
+import pytest
+
+from keras_retinanet.utils.metrics import MetricsRegistry, process_rss_bytes
+
+
+def test_counter_and_gauge_exposition():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', 'Handled requests.', ['status'])
+    in_flight = registry.gauge('in_flight', 'Requests in progress.')
+    registry.gauge('queue_size', 'Pending requests.', function=lambda: 3)
+
+    requests.inc(status=200)
+    requests.inc(2, status=200)
+    requests.inc(status=503)
+    with in_flight.track_inprogress():
+        assert 'in_flight 1\n' in registry.expose()
+
+    text = registry.expose()
+    assert '# TYPE requests_total counter\n' in text
+    assert 'requests_total{status="200"} 3\n' in text
+    assert 'requests_total{status="503"} 1\n' in text
+    assert 'in_flight 0\n' in text
+    assert 'queue_size 3\n' in text
+
+    with pytest.raises(ValueError):
+        requests.inc()
+
+
+def test_histogram_buckets():
+    registry = MetricsRegistry()
+    latency = registry.histogram('latency_seconds', 'Latency.', ['stage'], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        latency.observe(value, stage='predict')
+
+    text = registry.expose()
+    assert 'latency_seconds_bucket{stage="predict",le="0.1"} 2\n' in text
+    assert 'latency_seconds_bucket{stage="predict",le="1"} 3\n' in text
+    assert 'latency_seconds_bucket{stage="predict",le="+Inf"} 4\n' in text
+    assert 'latency_seconds_count{stage="predict"} 4\n' in text
+    assert 'latency_seconds_sum{stage="predict"} 2.65\n' in text
+
+
+def test_record_and_replay():
+    worker = MetricsRegistry()
+    parent = MetricsRegistry()
+    for registry in (worker, parent):
+        registry.counter('images_total', 'Images.')
+        registry.histogram('latency_seconds', 'Latency.', ['stage'])
+
+    worker.start_recording()
+    worker._by_name['images_total'].inc()
+    with worker._by_name['latency_seconds'].time(stage='imdecode'):
+        pass
+
+    samples = worker.drain()
+    assert len(samples) == 2
+    assert worker.drain() == []
+
+    parent.replay(samples)
+    text = parent.expose()
+    assert 'images_total 1\n' in text
+    assert 'latency_seconds_count{stage="imdecode"} 1\n' in text
+
+
+def test_process_rss_bytes():
+    assert process_rss_bytes() > 0
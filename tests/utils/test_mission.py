@@ -0,0 +1,87 @@
+import io
+import os
+import tarfile
+import time
+import zipfile
+
+import pytest
+
+from keras_retinanet.utils.mission import is_image_name, iter_paths, iter_tar, iter_zip, process_unordered
+
+
+def test_is_image_name():
+    assert is_image_name('mission/DSC_0001.JPG')
+    assert is_image_name('a.png')
+    assert not is_image_name('mission/readme.txt')
+    assert not is_image_name('__MACOSX/._DSC_0001.JPG')
+
+
+def test_iter_tar():
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode='w:gz') as tar:
+        for name, data in [('a.jpg', b'first'), ('notes.txt', b'skip'), ('dir/b.png', b'second')]:
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    buffer.seek(0)
+
+    items = [(name, load()) for name, load in iter_tar(buffer)]
+    assert items == [('a.jpg', b'first'), ('dir/b.png', b'second')]
+
+
+def test_iter_zip():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        archive.writestr('a.jpg', b'first')
+        archive.writestr('notes.txt', b'skip')
+    buffer.seek(0)
+
+    items = [(name, load()) for name, load in iter_zip(buffer)]
+    assert items == [('a.jpg', b'first')]
+
+
+def test_iter_paths(tmpdir):
+    tmpdir.join('a.jpg').write_binary(b'first')
+
+    items = [(name, load()) for name, load in iter_paths(['a.jpg'], str(tmpdir))]
+    assert items == [('a.jpg', b'first')]
+
+    with pytest.raises(ValueError):
+        list(iter_paths([os.path.join('..', 'a.jpg')], str(tmpdir)))
+
+
+def test_process_unordered_completion_order():
+    def process(data):
+        time.sleep(data)
+        return data
+
+    items = [('slow', lambda: 0.2), ('fast', lambda: 0.0)]
+    results = list(process_unordered(items, process, workers=2))
+    assert [name for name, _, _ in results] == ['fast', 'slow']
+
+
+def test_process_unordered_bounds_pending():
+    submitted = [0]
+
+    def items():
+        for i in range(20):
+            submitted[0] += 1
+            yield str(i), lambda i=i: i
+
+    results = []
+    for name, result, error in process_unordered(items(), lambda data: data, workers=2, max_pending=3):
+        results.append(result)
+        # the consumer falls behind, the producer still never runs more than max_pending items ahead of it
+        assert submitted[0] - len(results) <= 3
+        time.sleep(0.01)
+    assert sorted(results) == list(range(20))
+
+
+def test_process_unordered_errors():
+    def process(data):
+        raise ValueError(data)
+
+    (name, result, error), = process_unordered([('a', lambda: 'broken')], process)
+    assert name == 'a'
+    assert result is None
+    assert isinstance(error, ValueError)
@@ -0,0 +1,129 @@
+import os
+import time
+
+import pytest
+
+from keras_retinanet.utils.model_registry import ModelRegistry, ModelSpec, parse_model_spec
+
+
+class FakeModel(object):
+    def __init__(self, name, spec, memory_bytes=10):
+        self.name         = name
+        self.spec         = spec
+        self.memory_bytes = memory_bytes
+        self.closed       = False
+
+    def close(self):
+        self.closed = True
+
+
+def write_snapshot(tmpdir, name):
+    path = tmpdir.join(name)
+    path.write('weights')
+    return str(path)
+
+
+def test_parse_model_spec():
+    assert parse_model_spec('mobilenet=mobilenet224_1.0:snapshots/m.h5') == ('mobilenet', ModelSpec('snapshots/m.h5', 'mobilenet224_1.0'))
+    with pytest.raises(ValueError):
+        parse_model_spec('snapshots/m.h5')
+
+
+def test_load_on_first_use():
+    loads = []
+    registry = ModelRegistry(lambda name, spec: loads.append(name) or FakeModel(name, spec))
+    registry.add('a', ModelSpec('a.h5', 'resnet50'))
+
+    with registry.use('a') as model:
+        assert model.name == 'a'
+    with registry.use('a'):
+        pass
+    assert loads == ['a']
+
+    with pytest.raises(KeyError):
+        with registry.use('b'):
+            pass
+
+
+def test_evict_least_recently_used():
+    registry = ModelRegistry(FakeModel, max_bytes=25)
+    for name in ('a', 'b', 'c'):
+        registry.add(name, ModelSpec(name + '.h5', 'resnet50'))
+
+    with registry.use('a') as a:
+        pass
+    with registry.use('b'):
+        pass
+    with registry.use('a'):
+        pass
+    with registry.use('c'):
+        pass
+
+    assert [name for name, _ in registry.loaded()] == ['a', 'c']
+    assert not a.closed
+    assert registry.statistics()['evictions'] == 1
+
+
+def test_evicted_model_closes_after_use():
+    registry = ModelRegistry(FakeModel, max_bytes=15)
+    registry.add('a', ModelSpec('a.h5', 'resnet50'))
+    registry.add('b', ModelSpec('b.h5', 'resnet50'))
+
+    with registry.use('a') as a:
+        with registry.use('b'):
+            pass
+        # a is evicted, but still in use
+        assert not a.closed
+    assert a.closed
+
+
+def test_reload_swaps_model(tmpdir):
+    path = write_snapshot(tmpdir, 'a.h5')
+    registry = ModelRegistry(FakeModel)
+    registry.add('a', ModelSpec(path, 'resnet50'))
+
+    with registry.use('a') as old:
+        assert registry.reload('a')
+        with registry.use('a') as new:
+            assert new is not old
+        assert not old.closed
+    assert old.closed
+
+
+def test_failed_reload_keeps_model():
+    def loader(name, spec):
+        if spec.path == 'broken.h5':
+            raise IOError('unable to open file')
+        return FakeModel(name, spec)
+
+    registry = ModelRegistry(loader)
+    registry.add('a', ModelSpec('a.h5', 'resnet50'))
+    with registry.use('a') as old:
+        pass
+
+    assert not registry.reload('a', ModelSpec('broken.h5', 'resnet50'))
+    with registry.use('a') as model:
+        assert model is old
+    assert registry.spec('a').path == 'a.h5'
+    assert registry.statistics()['errors'] == 1
+
+
+def test_watch_reloads_changed_snapshot(tmpdir):
+    path = write_snapshot(tmpdir, 'a.h5')
+    registry = ModelRegistry(FakeModel)
+    registry.add('a', ModelSpec(path, 'resnet50'))
+    with registry.use('a') as old:
+        pass
+
+    assert registry.changed() == []
+    os.utime(path, (time.time() + 10, time.time() + 10))
+    assert registry.changed() == ['a']
+
+    registry.watch(interval=0.01)
+    try:
+        deadline = time.time() + 5
+        while old is dict(registry.loaded())['a'] and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        registry.stop()
+    assert old.closed
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from keras_retinanet.utils.motion import BoxTracker, MotionGatedDetector
+
+
+def textured_frame(offset=(0, 0), size=(480, 640)):
+    rng   = np.random.RandomState(0)
+    noise = rng.randint(0, 255, size=(size[0] // 8, size[1] // 8), dtype=np.uint8)
+    image = np.kron(noise, np.ones((8, 8), dtype=np.uint8))
+    image = np.roll(image, offset, axis=(0, 1))
+    return np.repeat(image[..., None], 3, axis=2)
+
+
+class CountingDetector(object):
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, image):
+        self.calls.append(image.shape)
+        boxes  = np.array([[[100, 100, 140, 180], [0, 0, 0, 0]]], dtype=np.float32)
+        scores = np.array([[0.9, -1]], dtype=np.float32)
+        labels = np.array([[0, -1]], dtype=np.int32)
+        return boxes, scores, labels
+
+
+def test_static_frames_are_tracked():
+    detector = CountingDetector()
+    gated    = MotionGatedDetector(detector, keyframe_interval=5)
+
+    for _ in range(10):
+        boxes, scores, labels = gated(textured_frame())
+
+    # keyframes 0 and 5
+    assert len(detector.calls) == 2
+    assert boxes.shape == (1, 1, 4)
+    assert scores[0, 0] == pytest.approx(0.9)
+
+    stats = gated.statistics()
+    assert stats['frames'] == 10
+    assert stats['keyframe'] == 2
+    assert stats['tracked'] == 8
+
+
+def test_local_change_detects_region():
+    detector = CountingDetector()
+    gated    = MotionGatedDetector(detector, keyframe_interval=100, min_region=128)
+
+    gated(textured_frame())
+    frame = textured_frame()
+    frame[300:340, 400:440] = 255 - frame[300:340, 400:440]
+    gated(frame)
+
+    assert gated.statistics()['region'] == 1
+    height, width = detector.calls[-1][:2]
+    assert height < 480 and width < 640
+
+
+def test_tracker_follows_shift():
+    previous = textured_frame()[..., 0]
+    current  = textured_frame(offset=(3, 5))[..., 0]
+    boxes    = np.array([[100, 100, 200, 200]], dtype=np.float32)
+
+    moved = BoxTracker().track(previous, current, boxes)
+    np.testing.assert_allclose(moved, [[105, 103, 205, 203]], atol=0.5)
+
+
+def test_camera_shift_is_compensated():
+    detector = CountingDetector()
+    gated    = MotionGatedDetector(detector, keyframe_interval=100)
+
+    for i in range(5):
+        boxes, _, _ = gated(textured_frame(offset=(0, 8 * i)))
+
+    assert len(detector.calls) == 1
+    # the box moved with the camera
+    assert boxes[0, 0, 0] == pytest.approx(132, abs=2)
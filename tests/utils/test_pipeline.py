@@ -0,0 +1,75 @@
+import threading
+
+import pytest
+
+from keras_retinanet.utils.pipeline import DropOldestQueue, LatencyMeter, RateMeter, StreamMultiplexer
+
+
+def test_drop_oldest_queue():
+    frames = DropOldestQueue(maxsize=2)
+    assert frames.put(1) is None
+    assert frames.put(2) is None
+    assert frames.put(3) == 1
+    assert frames.dropped == 1
+
+    assert frames.get_many(5) == [2, 3]
+    assert frames.get(timeout=0.01) is None
+
+
+def test_drop_oldest_queue_close_wakes_consumer():
+    frames = DropOldestQueue()
+    received = []
+    consumer = threading.Thread(target=lambda: received.append(frames.get()))
+    consumer.start()
+    frames.close()
+    consumer.join(timeout=5)
+    assert received == [None]
+    assert frames.closed
+
+    with pytest.raises(ValueError):
+        DropOldestQueue(maxsize=0)
+
+
+def test_rate_meter():
+    meter = RateMeter(window=10)
+    for i in range(11):
+        meter.tick(now=100 + i * 0.1)
+    assert meter.rate(now=101) == pytest.approx(10)
+    assert meter.total == 11
+    assert meter.rate(now=200) == 0.0
+
+
+def test_latency_meter():
+    meter = LatencyMeter(size=4)
+    assert meter.summary()['mean'] == 0.0
+    for value in (10, 1, 2, 3, 4):
+        meter.record(value)
+    summary = meter.summary()
+    assert summary['max'] == 4
+    assert summary['mean'] == pytest.approx(2.5)
+
+
+def test_stream_multiplexer_is_fair():
+    streams = StreamMultiplexer(3, maxsize=4)
+    for i in range(4):
+        streams.put(0, ('a', i))
+    streams.put(1, ('b', 0))
+    assert streams.put(0, ('a', 4)) == ('a', 0)
+    assert streams.dropped == [1, 0, 0]
+
+    # one item per stream and round, the next call continues after the stream served last
+    assert streams.get_many(3) == [('a', 1), ('b', 0), ('a', 2)]
+    streams.put(2, ('c', 0))
+    assert streams.get_many(2) == [('c', 0), ('a', 3)]
+    assert len(streams) == 1
+
+
+def test_stream_multiplexer_closes_after_all_streams():
+    streams = StreamMultiplexer(2)
+    streams.put(1, 'x')
+    streams.close(0)
+    assert not streams.closed
+    streams.close(1)
+    assert streams.closed
+    assert streams.get_many(2) == ['x']
+    assert streams.get_many(2, timeout=5) == []
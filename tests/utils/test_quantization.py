@@ -0,0 +1,38 @@
+import numpy as np
+
+from keras_retinanet.utils.quantization import calibration_images, quantized_path
+
+
+class ImageGenerator(object):
+    def __init__(self, size):
+        self.images = [np.full((4, 6, 3), i, dtype=np.uint8) for i in range(size)]
+
+    def size(self):
+        return len(self.images)
+
+    def load_image(self, i):
+        return self.images[i]
+
+    def preprocess_and_resize_image(self, image):
+        return image.astype(np.float32) - 1, 1.0
+
+
+def test_quantized_path():
+    assert quantized_path('snapshots/model.tflite') == 'snapshots/model_int8.tflite'
+    assert quantized_path('snapshots/model.onnx') == 'snapshots/model_int8.onnx'
+
+
+def test_calibration_images():
+    generator = ImageGenerator(10)
+
+    images = calibration_images(generator, 4, seed=1)
+    assert len(images) == 4
+    assert all(image.dtype == np.float32 for image in images)
+    # distinct images, the same sample for the same seed
+    assert len(set(float(image[0, 0, 0]) for image in images)) == 4
+    assert [image[0, 0, 0] for image in images] == [image[0, 0, 0] for image in calibration_images(generator, 4, seed=1)]
+
+    # models with in-graph preprocessing take the uint8 images, small sets are used whole
+    images = calibration_images(generator, 20, preprocessed=True)
+    assert len(images) == 10
+    assert images[0].dtype == np.uint8
@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from keras_retinanet.utils.shape_buckets import ShapeBuckets, parse_buckets
+
+
+def test_parse_buckets():
+    assert parse_buckets('1067x800, 1333x750') == [(800, 1067), (750, 1333)]
+    with pytest.raises(ValueError):
+        parse_buckets('1067')
+    with pytest.raises(ValueError):
+        parse_buckets('0x800')
+
+
+def test_pad_to_smallest_fitting_bucket():
+    buckets = ShapeBuckets([(750, 1333), (800, 1067)])
+    image = np.ones((800, 1000, 3), dtype=np.float32)
+
+    padded, scale, padding = buckets.fit(image)
+    assert padded.shape == (800, 1067, 3)
+    assert scale == 1.0
+    assert np.all(padded[:, :1000] == 1)
+    assert np.all(padded[:, 1000:] == 0)
+    assert padding == pytest.approx(1 - 1000 / 1067)
+
+
+def test_letterbox_large_image():
+    buckets = ShapeBuckets([(750, 1333), (800, 1067)])
+    image = np.ones((900, 1600, 3), dtype=np.float32)
+
+    padded, scale, _ = buckets.fit(image)
+    assert padded.shape == (750, 1333, 3)
+    assert scale == pytest.approx(1333 / 1600)
+
+    stats = buckets.statistics()
+    assert stats['1333x750']['images'] == 1
+    assert stats['1333x750']['letterboxed'] == 1
+    assert stats['1067x800']['images'] == 0
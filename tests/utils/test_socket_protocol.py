@@ -0,0 +1,85 @@
+import socket
+import threading
+
+import numpy as np
+import pytest
+
+from keras_retinanet.utils.socket_protocol import (
+    KIND_RAW,
+    MAX_MODEL_NAME_LENGTH,
+    REQUEST_HEADER,
+    STATUS_BUSY,
+    RequestTooLargeError,
+    SocketProtocolError,
+    read_request,
+    read_response,
+    send_detections,
+    send_error,
+    send_request,
+)
+
+
+def test_request_round_trip():
+    client, server = socket.socketpair()
+    image = np.arange(2 * 3 * 3, dtype=np.uint8).reshape(2, 3, 3)
+    send_request(client, image, kind=KIND_RAW, height=2, width=3, threshold=0.25, model_name='mobilenet', priority=1, timeout=0.5)
+
+    request = read_request(server)
+    assert request.kind == KIND_RAW
+    assert (request.height, request.width, request.priority) == (2, 3, 1)
+    assert request.model_name == 'mobilenet'
+    assert request.threshold == 0.25 and request.timeout == 0.5
+    assert bytes(request.payload) == image.tobytes()
+
+    send_request(client, b'jpeg')
+    assert read_request(server).model_name is None
+
+    client.close()
+    assert read_request(server) is None
+
+
+def test_response_round_trip():
+    client, server = socket.socketpair()
+    boxes  = np.array([[[0, 0, 1, 1], [2, 2, 3, 3], [-1, -1, -1, -1]]], dtype=np.float32)
+    scores = np.array([[0.4, 0.9, -1]], dtype=np.float32)
+    labels = np.array([[1, 0, -1]], dtype=np.int32)
+
+    # padding and low scores are cut, the rest is sorted by score
+    send_detections(server, boxes, scores, labels, threshold=0.3)
+    actual_boxes, actual_scores, actual_labels = read_response(client)
+    np.testing.assert_array_equal(actual_boxes, [[2, 2, 3, 3], [0, 0, 1, 1]])
+    np.testing.assert_allclose(actual_scores, [0.9, 0.4])
+    np.testing.assert_array_equal(actual_labels, [0, 1])
+
+    send_detections(server, boxes, scores, labels, threshold=1)
+    assert read_response(client)[0].shape == (0, 4)
+
+    send_error(server, STATUS_BUSY, 'Too many pending requests.')
+    with pytest.raises(SocketProtocolError) as error:
+        read_response(client)
+    assert error.value.status == STATUS_BUSY
+
+
+def test_large_payload():
+    client, server = socket.socketpair()
+    payload = np.random.randint(0, 256, 4 * 1024 * 1024, dtype=np.uint8)
+    sender  = threading.Thread(target=send_request, args=(client, payload))
+    sender.start()
+    request = read_request(server)
+    sender.join()
+    assert bytes(request.payload) == payload.tobytes()
+
+
+def test_request_too_large():
+    client, server = socket.socketpair()
+    send_request(client, b'jpeg' * 16)
+    send_request(client, b'jpeg')
+    with pytest.raises(RequestTooLargeError):
+        read_request(server, max_payload_size=32)
+    # the large request is skipped, the next one is read
+    assert bytes(read_request(server, max_payload_size=32).payload) == b'jpeg'
+
+    # a too long model name is refused before its payload is allocated
+    client.sendall(REQUEST_HEADER.pack(4, 0, 0, MAX_MODEL_NAME_LENGTH + 1, 0, 0, 0.5, 0) + b'n' * (MAX_MODEL_NAME_LENGTH + 1) + b'jpeg')
+    with pytest.raises(RequestTooLargeError):
+        read_request(server)
@@ -0,0 +1,84 @@
+import numpy as np
+
+from keras_retinanet.utils.tiling import non_max_suppression, TiledPredictor
+
+
+def test_non_max_suppression_iou():
+    boxes = np.array([
+        [0, 0, 10, 10],
+        [1, 1, 11, 11],
+        [20, 20, 30, 30],
+    ], dtype=np.float32)
+    scores = np.array([0.8, 0.9, 0.7])
+
+    keep = non_max_suppression(boxes, scores, threshold=0.5)
+    assert keep.tolist() == [1, 2]
+
+
+def test_non_max_suppression_labels():
+    boxes = np.array([
+        [0, 0, 10, 10],
+        [0, 0, 10, 10],
+    ], dtype=np.float32)
+    scores = np.array([0.9, 0.8])
+
+    assert non_max_suppression(boxes, scores, np.array([0, 0])).tolist() == [0]
+    assert non_max_suppression(boxes, scores, np.array([0, 1])).tolist() == [0, 1]
+
+
+def test_non_max_suppression_ios():
+    # a partial box of an object cut by a tile border lies inside the full box
+    boxes = np.array([
+        [0, 0, 10, 20],
+        [0, 0, 10, 8],
+    ], dtype=np.float32)
+    scores = np.array([0.9, 0.8])
+
+    assert non_max_suppression(boxes, scores, threshold=0.5, metric='iou').tolist() == [0, 1]
+    assert non_max_suppression(boxes, scores, threshold=0.5, metric='ios').tolist() == [0]
+
+
+def test_non_max_suppression_empty():
+    keep = non_max_suppression(np.zeros((0, 4)), np.zeros((0,)))
+    assert keep.shape == (0,)
+
+
+def test_tiled_predictor():
+    # the fake model detects one object in the center of every tile
+    batch_sizes = []
+
+    def predict(batch):
+        batch_sizes.append(batch.shape[0])
+        n, h, w = batch.shape[:3]
+        boxes  = np.tile(np.array([[[w / 2 - 5, h / 2 - 5, w / 2 + 5, h / 2 + 5]]], dtype=np.float32), (n, 1, 1))
+        scores = np.full((n, 1), 0.9, dtype=np.float32)
+        labels = np.zeros((n, 1), dtype=np.int32)
+        return boxes, scores, labels
+
+    predictor = TiledPredictor(predict, tile_width=100, tile_height=100, overlap_width=0, overlap_height=0, batch_size=3, preprocess_image=lambda x: x)
+    image = np.zeros((200, 300, 3), dtype=np.uint8)
+    boxes, scores, labels = predictor(image)
+
+    assert batch_sizes == [3, 3]
+    assert boxes.shape == (1, 6, 4)
+    assert scores.shape == (1, 6)
+    centers = sorted(((b[0] + b[2]) / 2, (b[1] + b[3]) / 2) for b in boxes[0])
+    assert centers == [(50, 50), (50, 150), (150, 50), (150, 150), (250, 50), (250, 150)]
+    assert predictor.statistics()['tiles'] == 6
+
+
+def test_tiled_predictor_merges_overlap():
+    # both tiles see the object at x 60..80 in the overlap zone, at tile offsets 0 and 50
+    def predict(batch):
+        boxes = np.array([
+            [[60, 40, 80, 60]],
+            [[10, 40, 30, 60]],
+        ], dtype=np.float32)
+        scores = np.array([[0.9], [0.8]], dtype=np.float32)
+        return boxes, scores, np.zeros((2, 1), dtype=np.int32)
+
+    predictor = TiledPredictor(predict, tile_width=100, tile_height=100, overlap_width=50, overlap_height=0, batch_size=2, preprocess_image=lambda x: x)
+    boxes, scores, labels = predictor(np.zeros((100, 150, 3), dtype=np.uint8))
+    assert boxes.shape == (1, 1, 4)
+    assert boxes[0, 0].tolist() == [60, 40, 80, 60]
+    assert scores[0].tolist() == [np.float32(0.9)]
@@ -0,0 +1,78 @@
+import json
+
+import cv2
+import numpy as np
+import pytest
+
+from keras_retinanet.utils.video import DetectionWriter, ParallelDecoder, decode_frames, sample_frames, video_info
+
+
+@pytest.fixture
+def video(tmp_path):
+    """ A 20 frame video whose frame i is filled with gray level 10 * i.
+    """
+    path   = str(tmp_path / 'flight.avi')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'MJPG'), 10, (64, 48))
+    for i in range(20):
+        writer.write(np.full((48, 64, 3), 10 * i, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def test_sample_frames():
+    assert sample_frames(5, 25) == [0, 1, 2, 3, 4]
+    assert sample_frames(10, 30, target_fps=10) == [0, 3, 6, 9]
+    assert sample_frames(10, 30, target_fps=10, start=4) == [6, 9]
+    assert sample_frames(10, 25, target_fps=50, start=8) == [8, 9]
+
+
+def test_decode_frames(video):
+    info = video_info(video)
+    assert info.frame_count == 20
+    assert (info.width, info.height) == (64, 48)
+
+    frames = decode_frames(video, [1, 2, 15, 19, 25], min_side=96, max_side=200, seek_gap=4)
+    assert [index for index, _, _ in frames] == [1, 2, 15, 19]
+    for index, image, scale in frames:
+        assert scale == 2
+        assert image.shape == (96, 128, 3)
+        assert abs(int(image.mean()) - 10 * index) <= 3
+
+
+def test_parallel_decoder_keeps_order(video):
+    decoder = ParallelDecoder(video, workers=2, segment_size=3, min_side=48, max_side=64)
+    try:
+        frames = list(decoder.decode(sample_frames(20, 10, target_fps=5)))
+    finally:
+        decoder.close()
+    assert [index for index, _, _ in frames] == list(range(0, 20, 2))
+
+
+@pytest.mark.parametrize('fmt', ['json', 'csv'])
+def test_detection_writer_resume(tmp_path, fmt):
+    path   = str(tmp_path / 'detections.{}'.format(fmt))
+    box    = {'name': 'Pedestrian', 'score': 0.9, 'xmin': 1, 'ymin': 2, 'xmax': 3, 'ymax': 4}
+    writer = DetectionWriter(path)
+    assert writer.last_frame is None
+    writer.write(0, 0.0, [box, box])
+    writer.write(3, 0.1, [])
+    writer.close()
+
+    # an interrupted write leaves a partial line behind
+    with open(path, 'a') as f:
+        f.write('5,0.2,Pedes')
+
+    writer = DetectionWriter(path)
+    assert writer.last_frame == 3
+    writer.write(5, 0.2, [box])
+    writer.close()
+
+    with open(path) as f:
+        lines = f.read().splitlines()
+    if fmt == 'json':
+        assert [json.loads(line)['frame'] for line in lines] == [0, 3, 5]
+    else:
+        assert lines[0].startswith('frame,time')
+        assert [line.split(',')[0] for line in lines[1:]] == ['0', '0', '3', '5']
+
+    assert DetectionWriter(path, resume=False).last_frame is None
@@ -0,0 +1,77 @@
+import os
+import queue
+
+import pytest
+
+from keras_retinanet.utils.cpu import split_cores
+from keras_retinanet.utils.worker_pool import WorkerPool, WorkerError
+
+
+def test_split_cores():
+    assert split_cores(2, [0, 1, 2, 3]) == [[0, 1], [2, 3]]
+    assert split_cores(3, [0, 1, 2, 3]) == [[0, 1], [2], [3]]
+    assert split_cores(1, [4, 5]) == [[4, 5]]
+
+
+def test_split_cores_more_parts_than_cores():
+    assert split_cores(3, [0, 1]) == [[0], [1], [0]]
+
+
+state = {}
+
+
+def initializer(index, cores):
+    state['index'] = index
+
+
+def handler(payload):
+    if payload == 'fail':
+        raise ValueError('failed')
+    return state['index'], os.getpid(), payload * 2
+
+
+def test_worker_pool():
+    pool = WorkerPool(initializer, handler, num_workers=2, cores=[0, 1]).start()
+    try:
+        index, pid, result = pool.run(21)
+        assert result == 42
+        assert pid != os.getpid()
+        assert index in (0, 1)
+        assert pool.idle_workers() == 2
+
+        with pytest.raises(WorkerError):
+            pool.run('fail')
+        assert pool.idle_workers() == 2
+    finally:
+        pool.stop()
+
+
+def test_worker_pool_initializer_failure():
+    def failing_initializer(index, cores):
+        raise RuntimeError('no model')
+
+    pool = WorkerPool(failing_initializer, handler, num_workers=1, cores=[0])
+    with pytest.raises(WorkerError):
+        pool.start()
+    pool.stop()
+
+
+def test_worker_pool_reserve():
+    pool = WorkerPool(initializer, handler, num_workers=1, cores=[0]).start()
+    try:
+        # the only worker is reserved for more urgent requests
+        with pytest.raises(queue.Empty):
+            pool.run(1, timeout=0.1, reserve=1)
+        assert pool.run(1)[2] == 2
+    finally:
+        pool.stop()
+
+
+def test_worker_pool_forward_exceptions():
+    pool = WorkerPool(initializer, handler, num_workers=1, cores=[0], forward_exceptions=(ValueError,)).start()
+    try:
+        with pytest.raises(ValueError):
+            pool.run('fail')
+        assert pool.run(1)[2] == 2
+    finally:
+        pool.stop()